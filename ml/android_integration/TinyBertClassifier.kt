@@ -29,7 +29,6 @@ class TinyBertClassifier(private val context: Context) {
         private const val LABEL_ENCODER_FILE = "label_encoder.json"
         
         // Model constants
-        private const val MAX_SEQUENCE_LENGTH = 128
         private const val CONFIDENCE_THRESHOLD = 0.7f
         private const val LOW_CONFIDENCE_THRESHOLD = 0.3f
     }
@@ -47,7 +46,11 @@ class TinyBertClassifier(private val context: Context) {
         val pad_token: String,
         val pad_token_id: Int,
         val unk_token: String,
-        val unk_token_id: Int
+        val unk_token_id: Int,
+        val cls_token: String,
+        val cls_token_id: Int,
+        val sep_token: String,
+        val sep_token_id: Int
     )
     
     data class LabelEncoder(
@@ -112,7 +115,7 @@ class TinyBertClassifier(private val context: Context) {
             // Preprocess input
             val tokens = tokenize(activityText)
             val inputBuffer = prepareInputBuffer(tokens)
-            val attentionMask = prepareAttentionMask(tokens.size)
+            val attentionMask = prepareAttentionMask(tokens.count { it != tokenConfig!!.pad_token_id })
             
             // Run inference
             val outputBuffer = runInference(inputBuffer, attentionMask)
@@ -252,7 +255,7 @@ class TinyBertClassifier(private val context: Context) {
     private fun tokenize(text: String): List<Int> {
         val config = tokenConfig ?: throw Exception("Tokenizer not configured")
         
-        // Simple whitespace tokenization + vocabulary lookup
+        // Simple whitespace tokenization + WordPiece lookup
         // In production, this would use a proper BERT tokenizer
         val words = text.lowercase(Locale.getDefault())
             .replace(Regex("[^a-z0-9\\s]"), " ")
@@ -261,19 +264,18 @@ class TinyBertClassifier(private val context: Context) {
         
         val tokens = mutableListOf<Int>()
         
-        // Add [CLS] token (assuming ID 101 for BERT-like models)
-        tokens.add(101)
+        // Special-token ids come from the config: a pruned vocabulary renumbers them
+        tokens.add(config.cls_token_id)
         
-        // Convert words to token IDs
+        // Convert words to token IDs, reserving space for [SEP]
         for (word in words) {
-            val tokenId = vocabulary[word] ?: config.unk_token_id
-            tokens.add(tokenId)
+            val pieces = wordPieces(word, config.unk_token_id)
+            tokens.addAll(pieces.take(config.max_length - 1 - tokens.size))
             
-            if (tokens.size >= config.max_length - 1) break // Reserve space for [SEP]
+            if (tokens.size >= config.max_length - 1) break
         }
         
-        // Add [SEP] token (assuming ID 102 for BERT-like models)
-        tokens.add(102)
+        tokens.add(config.sep_token_id)
         
         // Pad to max length
         while (tokens.size < config.max_length) {
@@ -283,8 +285,34 @@ class TinyBertClassifier(private val context: Context) {
         return tokens.take(config.max_length)
     }
     
+    // Greedy longest-match WordPiece, as BERT's tokenizer splits a word; with a
+    // pruned vocabulary the kept single-character pieces let unseen words split
+    // into characters instead of becoming [UNK]
+    private fun wordPieces(word: String, unkTokenId: Int): List<Int> {
+        vocabulary[word]?.let { return listOf(it) }
+        
+        val pieces = mutableListOf<Int>()
+        var start = 0
+        while (start < word.length) {
+            var end = word.length
+            var pieceId: Int? = null
+            while (start < end) {
+                val piece = if (start > 0) "##" + word.substring(start, end) else word.substring(start, end)
+                pieceId = vocabulary[piece]
+                if (pieceId != null) break
+                end--
+            }
+            if (pieceId == null) return listOf(unkTokenId)
+            pieces.add(pieceId)
+            start = end
+        }
+        return pieces
+    }
+    
+    // Buffers are sized from tokenizer_config.json's max_length, which matches
+    // the fixed [1, max_length] input shape the model was exported with
     private fun prepareInputBuffer(tokens: List<Int>): ByteBuffer {
-        val inputBuffer = ByteBuffer.allocateDirect(4 * MAX_SEQUENCE_LENGTH)
+        val inputBuffer = ByteBuffer.allocateDirect(4 * tokens.size)
         inputBuffer.order(ByteOrder.nativeOrder())
         
         tokens.forEach { token ->
@@ -296,10 +324,11 @@ class TinyBertClassifier(private val context: Context) {
     }
     
     private fun prepareAttentionMask(actualLength: Int): ByteBuffer {
-        val maskBuffer = ByteBuffer.allocateDirect(4 * MAX_SEQUENCE_LENGTH)
+        val sequenceLength = tokenConfig?.max_length ?: throw Exception("Tokenizer not configured")
+        val maskBuffer = ByteBuffer.allocateDirect(4 * sequenceLength)
         maskBuffer.order(ByteOrder.nativeOrder())
         
-        repeat(MAX_SEQUENCE_LENGTH) { i ->
+        repeat(sequenceLength) { i ->
             maskBuffer.putInt(if (i < actualLength) 1 else 0)
         }
         
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Batched latency and throughput benchmarks for exported models.
+Every backend runs the same texts through the same four timed stages
+(tokenization, input packing, inference, softmax) for each batch size in a
+sweep, after untimed warmup iterations, using perf_counter_ns. Results hold
+p50/p95/p99 latency per stage and a throughput curve per backend.
+"""
+
+import os
+import platform
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+SCHEMA_VERSION = 2
+STAGES = ["tokenize", "pack", "inference", "softmax"]
+
+# Defaults for the optional `benchmark` section of config.yaml
+DEFAULT_SETTINGS = {
+    'batch_sizes': [1, 2, 4, 8, 16, 32, 64, 128, 256],
+    'warmup_iterations': 3,
+    'min_iterations': 10,
+    'max_iterations': 200,
+    'seconds_per_batch_size': 2.0,  # Stop a batch size after this much timed work (once min_iterations ran)
+    'max_examples': 100,
+}
+
+
+def benchmark_settings(config: Dict) -> Dict:
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get('benchmark') or {})
+    return settings
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def latency_summary(nanoseconds: Sequence[int]) -> Dict[str, float]:
+    ms = np.asarray(nanoseconds, dtype=np.float64) / 1e6
+    return {
+        'mean_ms': float(ms.mean()),
+        'std_ms': float(ms.std()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+    }
+
+
+def host_info() -> Dict:
+    cores = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else range(os.cpu_count() or 1)
+    return {
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'available_cores': len(cores),
+    }
+
+
+class Backend:
+    """One runnable model format.
+
+    `pack` turns tokenizer output (int64 numpy arrays) into what `infer`
+    takes, and `infer` returns float logits as a numpy array.
+    """
+
+    def __init__(self, model_size_mb: Optional[float], load_time_ms: Optional[float]):
+        self._model_size_mb = model_size_mb
+        self.load_time_ms = load_time_ms
+
+    @property
+    def model_size_mb(self) -> float:
+        return self._model_size_mb
+
+    def prepare(self, batch_size: int) -> bool:
+        """Get ready for a batch size; False if this backend cannot run it."""
+        return True
+
+    def pack(self, input_ids: np.ndarray, attention_mask: np.ndarray):
+        return input_ids, attention_mask
+
+    def infer(self, packed) -> np.ndarray:
+        raise NotImplementedError
+
+
+class PyTorchBackend(Backend):
+    def __init__(self, model, model_size_mb: float, load_time_ms: Optional[float]):
+        super().__init__(model_size_mb, load_time_ms)
+        import torch
+        self._torch = torch
+        self.model = model.eval()
+
+    def pack(self, input_ids, attention_mask):
+        return self._torch.from_numpy(input_ids), self._torch.from_numpy(attention_mask)
+
+    def infer(self, packed):
+        with self._torch.inference_mode():
+            return self.model(input_ids=packed[0], attention_mask=packed[1]).logits.float().numpy()
+
+
+def onnx_model_size(onnx_path: str) -> int:
+    """Bytes of the graph plus the external data files it references (e.g. model.onnx.data).
+
+    Only referenced files count: a stale .data file left by an earlier
+    export with inlined weights is not part of the model.
+    """
+    import onnx
+    from onnx.external_data_helper import ExternalDataInfo, uses_external_data
+    model = onnx.load(onnx_path, load_external_data=False)
+    locations = {ExternalDataInfo(tensor).location
+                 for tensor in model.graph.initializer if uses_external_data(tensor)}
+    directory = os.path.dirname(onnx_path)
+    return os.path.getsize(onnx_path) + sum(os.path.getsize(os.path.join(directory, location))
+                                            for location in locations)
+
+
+class OnnxBackend(Backend):
+    """ONNX Runtime session; thread counts default to ONNX Runtime's own choice."""
+
+    def __init__(self, onnx_path: str, intra_op_threads: Optional[int] = None,
+                 inter_op_threads: Optional[int] = None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+            # Inter-op threads are only used when independent nodes may run in parallel
+            if inter_op_threads > 1:
+                options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        start = time.perf_counter_ns()
+        self.session = ort.InferenceSession(onnx_path, options)
+        super().__init__(None, (time.perf_counter_ns() - start) / 1e6)
+        self.onnx_path = onnx_path
+
+    @property
+    def model_size_mb(self) -> float:
+        # Measured on first use, so parsing the graph stays out of load time and cold-start memory
+        if self._model_size_mb is None:
+            self._model_size_mb = onnx_model_size(self.onnx_path) / 1024**2
+        return self._model_size_mb
+
+    def pack(self, input_ids, attention_mask):
+        return {'input_ids': np.ascontiguousarray(input_ids), 'attention_mask': np.ascontiguousarray(attention_mask)}
+
+    def infer(self, packed):
+        return self.session.run(None, packed)[0]
+
+
+class TFLiteBackend(Backend):
+    """TFLite interpreter, resized per batch size where the graph allows it."""
+
+    def __init__(self, tflite_path: str, num_threads: Optional[int] = None):
+        import tensorflow as tf
+        start = time.perf_counter_ns()
+        self.interpreter = tf.lite.Interpreter(model_path=tflite_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        super().__init__(os.path.getsize(tflite_path) / 1024**2, (time.perf_counter_ns() - start) / 1e6)
+        self.inputs = self.interpreter.get_input_details()
+        self.output = self.interpreter.get_output_details()[0]
+
+    def prepare(self, batch_size):
+        try:
+            for detail in self.inputs:
+                shape = list(detail['shape'])
+                self.interpreter.resize_tensor_input(detail['index'], [batch_size] + shape[1:])
+            self.interpreter.allocate_tensors()
+            return True
+        except (RuntimeError, ValueError):
+            # The exported graph is traced for [1, max_length]; not every op resizes
+            return False
+
+    def pack(self, input_ids, attention_mask):
+        return input_ids.astype(np.int32), attention_mask.astype(np.int32)
+
+    def infer(self, packed):
+        for detail, array in zip(self.inputs, packed):
+            self.interpreter.set_tensor(detail['index'], array)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output['index'])
+
+
+class BenchmarkEngine:
+    """Sweeps batch sizes over a set of backends with shared texts and tokenizer."""
+
+    def __init__(self, tokenizer, max_length: int, settings: Dict):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.settings = settings
+
+    def _tokenize(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        # Exported graphs take a fixed max_length, so every batch is padded to it
+        return self.tokenizer(texts, truncation=True, padding='max_length', max_length=self.max_length,
+                              return_tensors='np')
+
+    def _run_once(self, backend: Backend, texts: List[str]) -> Dict[str, int]:
+        t0 = time.perf_counter_ns()
+        encoding = self._tokenize(texts)
+        t1 = time.perf_counter_ns()
+        packed = backend.pack(encoding['input_ids'].astype(np.int64), encoding['attention_mask'].astype(np.int64))
+        t2 = time.perf_counter_ns()
+        logits = backend.infer(packed)
+        t3 = time.perf_counter_ns()
+        softmax(logits)
+        t4 = time.perf_counter_ns()
+        return {'tokenize': t1 - t0, 'pack': t2 - t1, 'inference': t3 - t2, 'softmax': t4 - t3}
+
+    def _batches(self, texts: List[str], batch_size: int):
+        """Endless batches cycling through the texts."""
+        position = 0
+        while True:
+            indices = (np.arange(position, position + batch_size) % len(texts))
+            position = (position + batch_size) % len(texts)
+            yield [texts[i] for i in indices]
+
+    def sweep(self, backend: Backend, texts: List[str]) -> Dict[str, Dict]:
+        """Timings per batch size; unsupported batch sizes are recorded as such."""
+        results = {}
+        for batch_size in self.settings['batch_sizes']:
+            if not backend.prepare(batch_size):
+                results[str(batch_size)] = {'supported': False}
+                continue
+            batches = self._batches(texts, batch_size)
+            for _ in range(self.settings['warmup_iterations']):
+                self._run_once(backend, next(batches))
+
+            timings = {stage: [] for stage in STAGES}
+            budget_ns = self.settings['seconds_per_batch_size'] * 1e9
+            spent_ns = 0
+            while len(timings['inference']) < self.settings['max_iterations']:
+                if len(timings['inference']) >= self.settings['min_iterations'] and spent_ns >= budget_ns:
+                    break
+                run = self._run_once(backend, next(batches))
+                for stage, ns in run.items():
+                    timings[stage].append(ns)
+                spent_ns += sum(run.values())
+
+            total = np.sum([timings[stage] for stage in STAGES], axis=0)
+            stages = {stage: latency_summary(timings[stage]) for stage in STAGES}
+            stages['total'] = latency_summary(total)
+            results[str(batch_size)] = {
+                'supported': True,
+                'iterations': len(total),
+                'stages': stages,
+                'throughput_per_second': batch_size / (stages['total']['mean_ms'] / 1000),
+                'inference_throughput_per_second': batch_size / (stages['inference']['mean_ms'] / 1000),
+                # Raw inference times, for confidence intervals when runs are compared
+                'inference_samples_ms': [round(ns / 1e6, 4) for ns in timings['inference']],
+            }
+        backend.prepare(1)
+        return results
+
+    def accuracy(self, backend: Backend, texts: List[str], labels: np.ndarray) -> float:
+        """Accuracy over the benchmark texts, one example at a time (the only shape every backend runs)."""
+        predictions = []
+        for text in texts:
+            encoding = self._tokenize([text])
+            packed = backend.pack(encoding['input_ids'].astype(np.int64), encoding['attention_mask'].astype(np.int64))
+            predictions.append(int(backend.infer(packed).argmax()))
+        return float((np.asarray(predictions) == labels[:len(predictions)]).mean())
+
+    def run(self, backends: Dict[str, Callable[[], Backend]], texts: List[str],
+            labels: Optional[np.ndarray] = None) -> Dict:
+        """Benchmark every backend; backends are built lazily so only one is loaded at a time."""
+        texts = texts[:self.settings['max_examples']]
+        results = {
+            'schema_version': SCHEMA_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'max_length': self.max_length,
+            'examples': len(texts),
+            'settings': self.settings,
+            'host': host_info(),
+            'backends': {},
+        }
+        for name, build in backends.items():
+            backend = build()
+            batches = self.sweep(backend, texts)
+            summary = {'model_size_mb': backend.model_size_mb, 'load_time_ms': backend.load_time_ms}
+            # Headline latency: one example through the model alone, as on device
+            if batches.get('1', {}).get('supported'):
+                single = batches['1']['stages']
+                summary.update({
+                    'mean_latency_ms': single['inference']['mean_ms'],
+                    'std_latency_ms': single['inference']['std_ms'],
+                    'p50_latency_ms': single['inference']['p50_ms'],
+                    'p95_latency_ms': single['inference']['p95_ms'],
+                    'p99_latency_ms': single['inference']['p99_ms'],
+                    'end_to_end_p95_ms': single['total']['p95_ms'],
+                })
+            if labels is not None:
+                summary['accuracy'] = self.accuracy(backend, texts, labels)
+            summary['throughput_curve'] = [
+                [int(batch_size), result['throughput_per_second']]
+                for batch_size, result in batches.items() if result['supported']
+            ]
+            summary['batches'] = batches
+            results['backends'][name] = summary
+        return results
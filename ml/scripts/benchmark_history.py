@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Benchmark history and regression gate.
+Every convert_to_mobile.py benchmark run is appended to a local JSON-lines
+store, tagged with the model's weights hash, the config hash and the host.
+The compare command checks a candidate run against a baseline: p95 latency
+through a bootstrap confidence interval on the p95 ratio, size and accuracy
+against fixed thresholds. It exits non-zero on any regression, so it can
+gate a pipeline or CI job.
+"""
+
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "training"))
+from token_cache import model_fingerprint
+
+HISTORY_FILE = "history.jsonl"
+
+# Defaults for the optional `benchmark_history` section of config.yaml
+DEFAULT_SETTINGS = {
+    'store_dir': "../models/benchmark_history",
+    'max_p95_increase': 0.10,
+    'max_size_increase': 0.05,
+    'max_accuracy_drop': 0.01,
+    'bootstrap_resamples': 2000,
+    'confidence': 0.95,
+    'seed': 0,
+}
+
+
+def history_settings(config: Dict) -> Dict:
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get('benchmark_history') or {})
+    return settings
+
+
+def config_hash(config: Dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkHistory:
+    """Append-only store of benchmark runs, one JSON record per line."""
+
+    def __init__(self, store_dir: Union[str, Path]):
+        self.store_dir = Path(store_dir)
+        self.path = self.store_dir / HISTORY_FILE
+
+    def append(self, results: Dict, model_path: Union[str, Path], config: Dict) -> Dict:
+        model_hash = model_fingerprint(model_path)
+        record = {
+            'run_id': f"{time.strftime('%Y%m%d-%H%M%S')}-{model_hash[:8]}",
+            'model_path': str(model_path),
+            'model_hash': model_hash,
+            'config_hash': config_hash(config),
+            'git_commit': git_commit(),
+            'config': config,
+            'results': results,
+        }
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=str) + "\n")
+        return record
+
+    def runs(self) -> List[Dict]:
+        if not self.path.exists():
+            return []
+        with open(self.path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def find(self, selector: str, runs: Optional[List[Dict]] = None) -> Dict:
+        """A run by id or model hash prefix, or by position: 'latest', 'previous', or -N (N-th from last)."""
+        runs = self.runs() if runs is None else runs
+        if not runs:
+            raise LookupError(f"No benchmark runs in {self.path}")
+        positions = {'latest': -1, 'previous': -2}
+        if selector in positions or (selector.startswith('-') and selector[1:].isdigit()):
+            index = positions.get(selector) or int(selector)
+            if index < -len(runs):
+                raise LookupError(f"Only {len(runs)} runs in {self.path}")
+            return runs[index]
+        matches = [run for run in runs
+                   if run['run_id'].startswith(selector) or run['model_hash'].startswith(selector)]
+        if not matches:
+            raise LookupError(f"No run matches {selector!r}")
+        return matches[-1]
+
+
+def bootstrap_p95_ratio(baseline: np.ndarray, candidate: np.ndarray, resamples: int, confidence: float,
+                        rng: np.random.Generator) -> Dict[str, float]:
+    """Point estimate and bootstrap confidence interval of candidate p95 / baseline p95."""
+    baseline_p95 = np.percentile(rng.choice(baseline, (resamples, len(baseline))), 95, axis=1)
+    candidate_p95 = np.percentile(rng.choice(candidate, (resamples, len(candidate))), 95, axis=1)
+    ratios = candidate_p95 / baseline_p95
+    tail = (1 - confidence) / 2 * 100
+    return {
+        'ratio': float(np.percentile(candidate, 95) / np.percentile(baseline, 95)),
+        'ci_low': float(np.percentile(ratios, tail)),
+        'ci_high': float(np.percentile(ratios, 100 - tail)),
+    }
+
+
+def compare_runs(baseline: Dict, candidate: Dict, settings: Dict) -> Dict:
+    """Per-backend checks of candidate against baseline; `regressions` lists every failed check."""
+    rng = np.random.default_rng(settings['seed'])
+    checks, regressions = {}, []
+    baseline_backends = baseline['results']['backends']
+    for name, after in candidate['results']['backends'].items():
+        before = baseline_backends.get(name)
+        if before is None:
+            continue
+        backend = {}
+
+        samples_before = before.get('batches', {}).get('1', {}).get('inference_samples_ms')
+        samples_after = after.get('batches', {}).get('1', {}).get('inference_samples_ms')
+        if samples_before and samples_after:
+            latency = bootstrap_p95_ratio(np.asarray(samples_before), np.asarray(samples_after),
+                                          settings['bootstrap_resamples'], settings['confidence'], rng)
+            # Regressed only if the slowdown is both past the threshold and statistically clear
+            latency['regressed'] = (latency['ratio'] > 1 + settings['max_p95_increase']
+                                    and latency['ci_low'] > 1)
+            backend['p95_latency'] = latency
+
+        size_ratio = after['model_size_mb'] / before['model_size_mb']
+        backend['model_size'] = {'ratio': size_ratio, 'regressed': size_ratio > 1 + settings['max_size_increase']}
+
+        if 'accuracy' in before and 'accuracy' in after:
+            change = after['accuracy'] - before['accuracy']
+            backend['accuracy'] = {'change': change, 'regressed': change < -settings['max_accuracy_drop']}
+
+        regressions.extend(f"{name} {check}" for check, result in backend.items() if result['regressed'])
+        checks[name] = backend
+
+    return {
+        'baseline': baseline['run_id'],
+        'candidate': candidate['run_id'],
+        'same_host': baseline['results'].get('host') == candidate['results'].get('host'),
+        'thresholds': {key: settings[key] for key in ('max_p95_increase', 'max_size_increase', 'max_accuracy_drop')},
+        'backends': checks,
+        'regressions': regressions,
+    }
+
+
+def print_comparison(comparison: Dict):
+    print(f"Baseline {comparison['baseline']} -> candidate {comparison['candidate']}")
+    if not comparison['same_host']:
+        print("Warning: the runs come from different hosts; latency is not directly comparable")
+    for name, checks in comparison['backends'].items():
+        print(f"\n{name.upper()}")
+        latency = checks.get('p95_latency')
+        if latency:
+            print(f"  P95 latency: x{latency['ratio']:.3f} (CI {latency['ci_low']:.3f}-{latency['ci_high']:.3f})"
+                  f"{'  REGRESSION' if latency['regressed'] else ''}")
+        size = checks['model_size']
+        print(f"  Model size: x{size['ratio']:.3f}{'  REGRESSION' if size['regressed'] else ''}")
+        accuracy = checks.get('accuracy')
+        if accuracy:
+            print(f"  Accuracy: {accuracy['change']:+.4f}{'  REGRESSION' if accuracy['regressed'] else ''}")
+    print(f"\n{len(comparison['regressions'])} regression(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run history and regression gate")
+    parser.add_argument("--config", default="../training/config.yaml", help="Training config")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List recorded runs")
+    compare = subparsers.add_parser("compare", help="Compare two runs; exit 1 on regression")
+    compare.add_argument("--baseline", default="previous", help="Run id or model hash prefix, 'previous' or -N")
+    compare.add_argument("--candidate", default="latest", help="Run id or model hash prefix, 'latest' or -N")
+    compare.add_argument("--output", help="Also write the comparison as JSON")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        settings = history_settings(yaml.safe_load(f))
+    history = BenchmarkHistory(settings['store_dir'])
+
+    if args.command == "list":
+        for run in history.runs():
+            backends = run['results']['backends']
+            latencies = ", ".join(f"{name} p95 {metrics['p95_latency_ms']:.1f}ms"
+                                  for name, metrics in backends.items() if 'p95_latency_ms' in metrics)
+            print(f"{run['run_id']}  {run['model_path']}  {latencies}")
+        return
+
+    runs = history.runs()
+    comparison = compare_runs(history.find(args.baseline, runs), history.find(args.candidate, runs), settings)
+    print_comparison(comparison)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(comparison, f, indent=2)
+    sys.exit(1 if comparison['regressions'] else 0)
+
+
+if __name__ == "__main__":
+    main()
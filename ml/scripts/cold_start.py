@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Cold-start and memory profiling per model format.
+Each format is loaded in a fresh process, as an app would at start-up:
+runtime import, model load and the first prediction are timed separately,
+and the resident set size is sampled before and after the runtime import,
+after N steady-state inferences, and at its peak. PyTorch is measured
+twice: through from_pretrained and through a zero-copy mmap of
+model.safetensors.
+"""
+
+import argparse
+import importlib
+import json
+import mmap
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+# Defaults for the optional `cold_start` section of config.yaml
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    'repeats': 3,  # Fresh processes per format; the median of each metric is reported
+    'steady_state_inferences': 100,
+}
+
+# transformers loads its modeling stack lazily; importing it here keeps it out of the model's load time and RSS
+RUNTIME_MODULES = {
+    'pytorch': ["torch", "transformers", "transformers.modeling_utils"],
+    'pytorch_mmap': ["torch", "transformers", "transformers.modeling_utils"],
+    'onnx': ["onnxruntime"],
+    'tflite': ["tensorflow"],
+}
+
+METRICS = ["import_ms", "load_ms", "first_prediction_ms", "load_to_first_prediction_ms",
+           "rss_before_import_mb", "runtime_rss_mb", "model_rss_mb", "model_anon_rss_mb", "steady_state_rss_mb",
+           "peak_rss_mb"]
+
+
+def cold_start_settings(config: Dict) -> Dict:
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get('cold_start') or {})
+    return settings
+
+
+def _status_mb(field: str) -> float:
+    """A kB field of /proc/self/status (Linux), in MB."""
+    with open("/proc/self/status", 'r') as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def current_rss_mb() -> float:
+    return _status_mb("VmRSS")
+
+
+def peak_rss_mb() -> float:
+    # Not getrusage: ru_maxrss survives exec, so a child would report its parent's peak
+    return _status_mb("VmHWM")
+
+
+def load_safetensors_mmap(model_dir: Path):
+    """Build the model around tensors that view a copy-on-write mmap of model.safetensors.
+
+    Weights are paged in from the file as inference touches them and stay
+    clean, shared page-cache pages, whichever way the installed transformers
+    version loads checkpoints in from_pretrained (some copy every tensor).
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+    from transformers.modeling_utils import no_init_weights
+
+    dtypes = {'F64': torch.float64, 'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16,
+              'I64': torch.int64, 'I32': torch.int32, 'I16': torch.int16, 'I8': torch.int8,
+              'U8': torch.uint8, 'BOOL': torch.bool}
+    with open(model_dir / "model.safetensors", 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    state_dict = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = dtypes[info['dtype']]
+        begin, end = info['data_offsets']
+        count = (end - begin) // dtype.itemsize
+        tensor = (torch.frombuffer(buffer, dtype=dtype, count=count, offset=8 + header_size + begin)
+                  if count else torch.empty(0, dtype=dtype))
+        state_dict[name] = tensor.reshape(info['shape'])
+
+    # Skip weight initialization: every parameter is replaced by its mmap view
+    with no_init_weights():
+        model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(model_dir))
+    model.load_state_dict(state_dict, assign=True)
+    return model
+
+
+def _load_backend(kind: str, path: Path):
+    from benchmark_engine import OnnxBackend, PyTorchBackend, TFLiteBackend
+    if kind == 'onnx':
+        return OnnxBackend(str(path))
+    if kind == 'tflite':
+        return TFLiteBackend(str(path))
+    if kind == 'pytorch_mmap':
+        model = load_safetensors_mmap(path)
+    else:
+        from transformers import AutoModelForSequenceClassification
+        model = AutoModelForSequenceClassification.from_pretrained(path)
+    return PyTorchBackend(model, 0.0, None)
+
+
+def measure(kind: str, path: Path, inputs_path: Path, inferences: int) -> Dict:
+    """Cold start and memory for one format; call only in a fresh process."""
+    inputs = np.load(inputs_path)
+    input_ids, attention_mask = inputs['input_ids'], inputs['attention_mask']
+    rss_before_import = current_rss_mb()
+
+    t0 = time.perf_counter_ns()
+    for module in RUNTIME_MODULES[kind]:
+        importlib.import_module(module)
+    t1 = time.perf_counter_ns()
+    rss_after_import, anon_after_import = current_rss_mb(), _status_mb("RssAnon")
+    backend = _load_backend(kind, path)
+    t2 = time.perf_counter_ns()
+    backend.infer(backend.pack(input_ids[:1], attention_mask[:1]))
+    t3 = time.perf_counter_ns()
+
+    for i in range(inferences):
+        row = i % len(input_ids)
+        backend.infer(backend.pack(input_ids[row:row + 1], attention_mask[row:row + 1]))
+    steady_rss, steady_anon = current_rss_mb(), _status_mb("RssAnon")
+
+    return {
+        'import_ms': (t1 - t0) / 1e6,
+        'load_ms': (t2 - t1) / 1e6,
+        'first_prediction_ms': (t3 - t2) / 1e6,
+        'load_to_first_prediction_ms': (t3 - t0) / 1e6,
+        'rss_before_import_mb': rss_before_import,
+        # The runtime library itself, then what loading and running the model added on top
+        'runtime_rss_mb': rss_after_import - rss_before_import,
+        'model_rss_mb': steady_rss - rss_after_import,
+        # Private memory only: mmapped weights are file pages the kernel can share and drop
+        'model_anon_rss_mb': steady_anon - anon_after_import,
+        'steady_state_rss_mb': steady_rss,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def profile_formats(formats: Dict[str, Tuple[str, Path]], input_ids: np.ndarray, attention_mask: np.ndarray,
+                    settings: Dict) -> Dict[str, Dict]:
+    """Median cold-start and memory metrics per format, each run in `repeats` fresh processes.
+
+    `formats` maps a name to (kind, path): kind is one of RUNTIME_MODULES,
+    path the model file (or directory for the PyTorch kinds).
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs_path = Path(tmp) / "inputs.npz"
+        np.savez(inputs_path, input_ids=input_ids.astype(np.int64), attention_mask=attention_mask.astype(np.int64))
+        for name, (kind, path) in formats.items():
+            run = {'kind': kind, 'path': str(path), 'inputs': str(inputs_path),
+                   'inferences': settings['steady_state_inferences']}
+            samples, error = [], None
+            for _ in range(settings['repeats']):
+                completed = subprocess.run([sys.executable, __file__, "--run", json.dumps(run)],
+                                           capture_output=True, text=True, cwd=Path(__file__).resolve().parent)
+                lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+                if completed.returncode != 0 or not lines:
+                    error = completed.stderr.strip().splitlines()[-1:] or [f"exit code {completed.returncode}"]
+                    break
+                samples.append(json.loads(lines[-1][len("RESULT "):]))
+            if error:
+                results[name] = {'error': error[0]}
+                continue
+            results[name] = {metric: statistics.median(sample[metric] for sample in samples) for metric in METRICS}
+            results[name]['repeats'] = len(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure one model format in this process (used by profile_formats)")
+    parser.add_argument("--run", required=True, help="JSON with kind, path, inputs and inferences")
+    args = parser.parse_args()
+    run = json.loads(args.run)
+    result = measure(run['kind'], Path(run['path']), Path(run['inputs']), run['inferences'])
+    print("RESULT " + json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ Model optimization and conversion script for mobile deployment.
 Converts TinyBERT model to TensorFlow Lite with quantization.
 """
 
+import argparse
 import os
 import sys
 import yaml
@@ -21,24 +22,58 @@ import pandas as pd
 import logging
 from typing import Dict, List, Tuple, Optional
 import time
+from functools import partial
+
+from benchmark_engine import BenchmarkEngine, OnnxBackend, PyTorchBackend, TFLiteBackend, benchmark_settings
+from benchmark_history import BenchmarkHistory, history_settings
+from cold_start import cold_start_settings, profile_formats
+from stage_graph import MANIFEST_DIR, StageGraph, run_branch
+
+# Share the pre-tokenized dataset cache with training
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "training"))
+from token_cache import TokenCache
+from sequence_length import resolve_max_length
+from fake_quant import load_quantization_settings
+from cpu_profile import available_cores
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The TensorFlow branch runs in its own process, alongside the ONNX branch (torch only, so it
+# stays in this process with the model already loaded); benchmarks and Android assets follow
+CONVERSION_STAGES = {
+    'tensorflow': {'after': [], 'branch': 'tensorflow'},
+    'tflite': {'after': ['tensorflow'], 'branch': 'tensorflow'},
+    'onnx': {'after': [], 'branch': 'onnx'},
+    'onnx_quantized': {'after': ['onnx'], 'branch': 'onnx'},
+    'benchmark': {'after': ['tflite', 'onnx_quantized'], 'branch': 'main'},
+    'android_assets': {'after': ['tflite'], 'branch': 'main'},
+}
+
+# Defaults for the optional `conversion` section of config.yaml
+DEFAULT_CONVERSION_SETTINGS = {
+    'parallel': "auto",  # "auto": only with 2+ cores; False runs every stage in this process, in order
+}
+
+
 class MobileModelConverter:
     """Converts and optimizes TinyBERT for mobile deployment."""
     
-    def __init__(self, config_path: str, model_path: str):
+    def __init__(self, config_path: str, model_path: str, output_dir: str = "../models/mobile"):
+        self.config_path = config_path
         self.config = self._load_config(config_path)
         self.model_path = Path(model_path)
-        self.output_dir = Path("../models/mobile")
+        self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
         # Model components
         self.tokenizer = None
         self.pytorch_model = None
         self.tf_model = None
+        self.max_length = None
+        self.quantization = None
+        self.load_time_ms = None
         
     def _load_config(self, config_path: str) -> Dict:
         """Load configuration."""
@@ -50,10 +85,19 @@ class MobileModelConverter:
         logger.info(f"Loading trained model from {self.model_path}")
         
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        start_time = time.perf_counter()
         self.pytorch_model = AutoModelForSequenceClassification.from_pretrained(self.model_path)
+        self.load_time_ms = (time.perf_counter() - start_time) * 1000
         self.pytorch_model.eval()
         
-        logger.info("Model loaded successfully")
+        # Export with the same fixed sequence length the model was trained on
+        self.max_length = resolve_max_length(self.config, self.tokenizer, self.model_path)
+        
+        # Set by quantization-aware training: export INT8 exactly as the model was trained
+        self.quantization = load_quantization_settings(self.model_path)
+        
+        logger.info(f"Model loaded successfully (max_length={self.max_length}, "
+                    f"quantization-aware={self.quantization is not None})")
     
     def convert_to_tensorflow(self) -> str:
         """Convert PyTorch model to TensorFlow."""
@@ -83,7 +127,7 @@ class MobileModelConverter:
         onnx_path = self.output_dir / "model.onnx"
         
         # Create dummy input
-        max_length = self.config['model']['max_length']
+        max_length = self.max_length
         dummy_input = {
             'input_ids': torch.randint(0, 1000, (1, max_length), dtype=torch.long),
             'attention_mask': torch.ones(1, max_length, dtype=torch.long)
@@ -96,9 +140,10 @@ class MobileModelConverter:
             onnx_path,
             input_names=['input_ids', 'attention_mask'],
             output_names=['logits'],
+            # Sequence length stays fixed at max_length; only the batch is dynamic
             dynamic_axes={
-                'input_ids': {0: 'batch_size', 1: 'sequence'},
-                'attention_mask': {0: 'batch_size', 1: 'sequence'},
+                'input_ids': {0: 'batch_size'},
+                'attention_mask': {0: 'batch_size'},
                 'logits': {0: 'batch_size'}
             },
             opset_version=11,
@@ -124,6 +169,7 @@ class MobileModelConverter:
             quantize_dynamic(
                 onnx_path,
                 str(quantized_path),
+                per_channel=bool(self.quantization and self.quantization['per_channel']),
                 weight_type=QuantType.QInt8
             )
             
@@ -138,15 +184,17 @@ class MobileModelConverter:
         """Convert TensorFlow model to TensorFlow Lite with quantization."""
         logger.info("Converting to TensorFlow Lite...")
         
-        # Load TensorFlow model
-        model = tf.saved_model.load(tf_model_path)
-        
         # Create converter
-        converter = tf.lite.TFLiteConverter.from_saved_model(tf_model_path)
+        converter = self._tflite_converter(tf_model_path)
         
         # Apply optimizations
         converter.optimizations = [tf.lite.Optimize.DEFAULT]
         
+        if self.quantization:
+            # Dynamic-range INT8 is the scheme the model was trained for, and every op supports it
+            tflite_model = converter.convert()
+            return self._save_tflite(tflite_model, quantized=True)
+        
         # Enable dynamic range quantization
         converter.representative_dataset = self._representative_dataset
         converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
@@ -163,12 +211,15 @@ class MobileModelConverter:
             logger.info("Falling back to float32 conversion...")
             
             # Fallback to float32
-            converter = tf.lite.TFLiteConverter.from_saved_model(tf_model_path)
+            converter = self._tflite_converter(tf_model_path)
             converter.optimizations = [tf.lite.Optimize.DEFAULT]
             tflite_model = converter.convert()
             quantized = False
         
-        # Save TFLite model
+        return self._save_tflite(tflite_model, quantized)
+    
+    def _save_tflite(self, tflite_model: bytes, quantized: bool) -> str:
+        """Save a converted TFLite model."""
         tflite_path = self.output_dir / ("model_quantized.tflite" if quantized else "model.tflite")
         with open(tflite_path, 'wb') as f:
             f.write(tflite_model)
@@ -178,207 +229,146 @@ class MobileModelConverter:
         
         return str(tflite_path)
     
+    def _tflite_converter(self, tf_model_path: str) -> tf.lite.TFLiteConverter:
+        """Converter for a fixed [1, max_length] input signature.
+        
+        The saved model's default signature has a dynamic sequence axis, so
+        the TFLite graph is traced from a concrete function instead.
+        """
+        if self.tf_model is None:
+            return tf.lite.TFLiteConverter.from_saved_model(tf_model_path)
+        
+        input_signature = [
+            tf.TensorSpec([1, self.max_length], tf.int32, name='input_ids'),
+            tf.TensorSpec([1, self.max_length], tf.int32, name='attention_mask'),
+        ]
+        
+        @tf.function(input_signature=input_signature)
+        def serving_fn(input_ids, attention_mask):
+            return {'logits': self.tf_model(input_ids=input_ids, attention_mask=attention_mask).logits}
+        
+        return tf.lite.TFLiteConverter.from_concrete_functions(
+            [serving_fn.get_concrete_function()], self.tf_model
+        )
+    
     def _representative_dataset(self):
         """Generate representative dataset for quantization."""
         # Load some sample data for quantization calibration
         try:
-            test_df = pd.read_csv(self.config['data']['test_file'])
-            sample_texts = test_df['user_input'].head(100).tolist()
+            test_file = self.config['data']['test_file']
+            sample_texts = pd.read_csv(test_file)['user_input'].head(100).tolist()
         except:
             # Fallback to synthetic data
+            test_file = None
             sample_texts = [
                 "morning run", "work meeting", "lunch break", "evening yoga",
                 "coding session", "family dinner", "gym workout", "study time"
             ] * 12  # 96 samples
         
-        max_length = self.config['model']['max_length']
-        
-        for text in sample_texts:
-            # Tokenize
-            encoding = self.tokenizer(
-                text,
-                truncation=True,
-                padding='max_length',
-                max_length=max_length,
-                return_tensors='tf'
-            )
-            
+        for input_ids, attention_mask in self._encode_texts(sample_texts, test_file):
             # Yield as generator
-            yield [
-                encoding['input_ids'].numpy().astype(np.int32),
-                encoding['attention_mask'].numpy().astype(np.int32)
+            yield [input_ids.astype(np.int32), attention_mask.astype(np.int32)]
+    
+    def _encode_texts(self, texts: List[str], data_file: Optional[str] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Tokenize texts into (input_ids, attention_mask) pairs of shape [1, max_length].
+        
+        When the texts are the head of a data file, the arrays come from the
+        same memory-mapped token cache that training uses.
+        """
+        max_length = self.max_length
+        cache_dir = self.config['data'].get('cache_dir')
+        
+        if data_file and cache_dir:
+            cache = TokenCache.build(cache_dir, self.tokenizer, max_length, data_file,
+                                     text_column=self.config['data']['text_column'])
+            return [
+                (cache.input_ids[i:i + 1].astype(np.int64), cache.attention_mask[i:i + 1].astype(np.int64))
+                for i in range(len(texts))
             ]
+        
+        encoding = self.tokenizer(
+            texts,
+            truncation=True,
+            padding='max_length',
+            max_length=max_length,
+            return_tensors='np'
+        )
+        return [
+            (encoding['input_ids'][i:i + 1].astype(np.int64), encoding['attention_mask'][i:i + 1].astype(np.int64))
+            for i in range(len(texts))
+        ]
     
     def benchmark_models(self, test_data_path: Optional[str] = None) -> Dict:
-        """Benchmark different model formats for latency and accuracy."""
+        """Benchmark every exported format over a sweep of batch sizes."""
         logger.info("Benchmarking model performance...")
         
-        results = {}
-        
         # Load test data
+        labels = None
         if test_data_path:
             test_df = pd.read_csv(test_data_path)
-            test_texts = test_df['user_input'].head(100).tolist()  # Sample for benchmarking
+            test_texts = test_df['user_input'].astype(str).tolist()
+            labels = self._encode_labels(test_df[self.config['data']['label_column']])
         else:
             test_texts = [
                 "morning run", "team meeting", "lunch with friends", "evening workout",
                 "coding project", "family time", "gym session", "study break"
             ] * 12  # 96 test samples
         
-        # Benchmark PyTorch model
-        results['pytorch'] = self._benchmark_pytorch(test_texts)
-        
-        # Benchmark ONNX model
+        # Each backend is loaded only when its turn comes
+        backends = {'pytorch': lambda: PyTorchBackend(self.pytorch_model, self._get_pytorch_model_size(),
+                                                      self.load_time_ms)}
         onnx_path = self.output_dir / "model.onnx"
         if onnx_path.exists():
-            results['onnx'] = self._benchmark_onnx(str(onnx_path), test_texts)
-        
-        # Benchmark quantized ONNX model
+            backends['onnx'] = lambda: OnnxBackend(str(onnx_path))
         quantized_onnx_path = self.output_dir / "model_quantized.onnx"
         if quantized_onnx_path.exists():
-            results['onnx_quantized'] = self._benchmark_onnx(str(quantized_onnx_path), test_texts)
-        
-        # Benchmark TFLite model
+            backends['onnx_quantized'] = lambda: OnnxBackend(str(quantized_onnx_path))
         tflite_path = self.output_dir / "model_quantized.tflite"
         if not tflite_path.exists():
             tflite_path = self.output_dir / "model.tflite"
-        
         if tflite_path.exists():
-            results['tflite'] = self._benchmark_tflite(str(tflite_path), test_texts)
-        
-        # Save benchmark results
+            backends['tflite'] = lambda: TFLiteBackend(str(tflite_path))
+        
+        engine = BenchmarkEngine(self.tokenizer, self.max_length, benchmark_settings(self.config))
+        results = engine.run(backends, test_texts, labels)
+        results['model_path'] = str(self.model_path)
+        
+        # Load-to-first-prediction and memory, each format in fresh processes
+        cold_start = cold_start_settings(self.config)
+        if cold_start['enabled']:
+            formats = {'pytorch': ('pytorch', self.model_path)}
+            if (self.model_path / "model.safetensors").exists():
+                formats['pytorch_mmap'] = ('pytorch_mmap', self.model_path)
+            for name, path in [('onnx', onnx_path), ('onnx_quantized', quantized_onnx_path)]:
+                if path.exists():
+                    formats[name] = ('onnx', path)
+            if tflite_path.exists():
+                formats['tflite'] = ('tflite', tflite_path)
+            encoding = self.tokenizer(test_texts[:engine.settings['max_examples']], truncation=True,
+                                      padding='max_length', max_length=self.max_length, return_tensors='np')
+            results['cold_start'] = profile_formats(formats, encoding['input_ids'], encoding['attention_mask'],
+                                                    cold_start)
+        
+        # Save benchmark results, and keep every run for comparisons (benchmark_history.py compare)
         with open(self.output_dir / "benchmark_results.json", 'w') as f:
             json.dump(results, f, indent=2)
+        history = BenchmarkHistory(history_settings(self.config)['store_dir'])
+        run = history.append(results, self.model_path, self.config)
+        logger.info(f"Benchmark run {run['run_id']} recorded in {history.path}")
         
         # Print summary
         self._print_benchmark_summary(results)
         
         return results
     
-    def _benchmark_pytorch(self, test_texts: List[str]) -> Dict:
-        """Benchmark PyTorch model."""
-        logger.info("Benchmarking PyTorch model...")
-        
-        max_length = self.config['model']['max_length']
-        times = []
-        
-        with torch.no_grad():
-            for text in test_texts:
-                start_time = time.time()
-                
-                # Tokenize
-                encoding = self.tokenizer(
-                    text,
-                    truncation=True,
-                    padding='max_length',
-                    max_length=max_length,
-                    return_tensors='pt'
-                )
-                
-                # Inference
-                outputs = self.pytorch_model(**encoding)
-                predictions = torch.softmax(outputs.logits, dim=1)
-                
-                end_time = time.time()
-                times.append((end_time - start_time) * 1000)  # Convert to ms
-        
-        return {
-            'mean_latency_ms': np.mean(times),
-            'std_latency_ms': np.std(times),
-            'p95_latency_ms': np.percentile(times, 95),
-            'model_size_mb': self._get_pytorch_model_size()
-        }
-    
-    def _benchmark_onnx(self, onnx_path: str, test_texts: List[str]) -> Dict:
-        """Benchmark ONNX model."""
-        logger.info(f"Benchmarking ONNX model: {Path(onnx_path).name}")
-        
-        # Load ONNX model
-        session = ort.InferenceSession(onnx_path)
-        
-        max_length = self.config['model']['max_length']
-        times = []
-        
-        for text in test_texts:
-            start_time = time.time()
-            
-            # Tokenize
-            encoding = self.tokenizer(
-                text,
-                truncation=True,
-                padding='max_length',
-                max_length=max_length,
-                return_tensors='np'
-            )
-            
-            # Inference
-            outputs = session.run(
-                None,
-                {
-                    'input_ids': encoding['input_ids'].astype(np.int64),
-                    'attention_mask': encoding['attention_mask'].astype(np.int64)
-                }
-            )
-            
-            end_time = time.time()
-            times.append((end_time - start_time) * 1000)  # Convert to ms
-        
-        model_size = os.path.getsize(onnx_path) / (1024 * 1024)  # MB
-        
-        return {
-            'mean_latency_ms': np.mean(times),
-            'std_latency_ms': np.std(times),
-            'p95_latency_ms': np.percentile(times, 95),
-            'model_size_mb': model_size
-        }
-    
-    def _benchmark_tflite(self, tflite_path: str, test_texts: List[str]) -> Dict:
-        """Benchmark TensorFlow Lite model."""
-        logger.info(f"Benchmarking TFLite model: {Path(tflite_path).name}")
-        
-        # Load TFLite model
-        interpreter = tf.lite.Interpreter(model_path=tflite_path)
-        interpreter.allocate_tensors()
-        
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
-        
-        max_length = self.config['model']['max_length']
-        times = []
-        
-        for text in test_texts:
-            start_time = time.time()
-            
-            # Tokenize
-            encoding = self.tokenizer(
-                text,
-                truncation=True,
-                padding='max_length',
-                max_length=max_length,
-                return_tensors='np'
-            )
-            
-            # Set input tensors
-            interpreter.set_tensor(input_details[0]['index'], encoding['input_ids'].astype(np.int32))
-            interpreter.set_tensor(input_details[1]['index'], encoding['attention_mask'].astype(np.int32))
-            
-            # Inference
-            interpreter.invoke()
-            
-            # Get output
-            outputs = interpreter.get_tensor(output_details[0]['index'])
-            
-            end_time = time.time()
-            times.append((end_time - start_time) * 1000)  # Convert to ms
-        
-        model_size = os.path.getsize(tflite_path) / (1024 * 1024)  # MB
-        
-        return {
-            'mean_latency_ms': np.mean(times),
-            'std_latency_ms': np.std(times),
-            'p95_latency_ms': np.percentile(times, 95),
-            'model_size_mb': model_size
-        }
+    def _encode_labels(self, categories: pd.Series) -> Optional[np.ndarray]:
+        """Class ids for benchmark accuracy, or None if the model has no label encoder."""
+        label_encoder_path = self.model_path / "label_encoder.json"
+        if not label_encoder_path.exists():
+            return None
+        with open(label_encoder_path, 'r') as f:
+            category_to_id = json.load(f)['category_to_id']
+        return categories.map(category_to_id).fillna(-1).to_numpy(dtype=np.int64)
     
     def _get_pytorch_model_size(self) -> float:
         """Estimate PyTorch model size in MB."""
@@ -400,11 +390,32 @@ class MobileModelConverter:
         print("MODEL BENCHMARK SUMMARY")
         print("="*60)
         
-        for model_name, metrics in results.items():
+        for model_name, metrics in results['backends'].items():
             print(f"\n{model_name.upper()}")
-            print(f"  Latency: {metrics['mean_latency_ms']:.1f}ms ± {metrics['std_latency_ms']:.1f}ms")
-            print(f"  P95 Latency: {metrics['p95_latency_ms']:.1f}ms")
+            if 'mean_latency_ms' in metrics:
+                print(f"  Latency: {metrics['mean_latency_ms']:.1f}ms ± {metrics['std_latency_ms']:.1f}ms")
+                print(f"  P50/P95/P99 Latency: {metrics['p50_latency_ms']:.1f}/{metrics['p95_latency_ms']:.1f}/"
+                      f"{metrics['p99_latency_ms']:.1f}ms")
             print(f"  Model Size: {metrics['model_size_mb']:.1f}MB")
+            if metrics.get('load_time_ms') is not None:
+                print(f"  Load Time: {metrics['load_time_ms']:.0f}ms")
+            if 'accuracy' in metrics:
+                print(f"  Accuracy: {metrics['accuracy']:.3f}")
+            if metrics['throughput_curve']:
+                batch_size, throughput = max(metrics['throughput_curve'], key=lambda point: point[1])
+                print(f"  Peak Throughput: {throughput:.0f} examples/s at batch size {batch_size}")
+        
+        if results.get('cold_start'):
+            print("\nCOLD START (fresh process)")
+            for model_name, metrics in results['cold_start'].items():
+                if 'error' in metrics:
+                    print(f"  {model_name}: failed ({metrics['error']})")
+                    continue
+                print(f"  {model_name}: {metrics['load_to_first_prediction_ms']:.0f}ms to first prediction "
+                      f"(import {metrics['import_ms']:.0f}ms, load {metrics['load_ms']:.0f}ms); "
+                      f"RSS runtime {metrics['runtime_rss_mb']:.0f}MB + model {metrics['model_rss_mb']:.0f}MB "
+                      f"({metrics['model_anon_rss_mb']:.0f}MB anonymous), "
+                      f"{metrics['peak_rss_mb']:.0f}MB peak")
         
         print("\n" + "="*60)
     
@@ -423,23 +434,37 @@ class MobileModelConverter:
             shutil.copy2(best_tflite, android_dir / "activity_classifier.tflite")
             logger.info(f"Copied {best_tflite.name} to Android assets")
         
-        # Create tokenizer assets
+        # Create tokenizer assets; special-token ids come from the tokenizer, since
+        # a pruned vocabulary (prune_vocab.py) renumbers them
         tokenizer_config = {
             'vocab_size': len(self.tokenizer.vocab),
-            'max_length': self.config['model']['max_length'],
+            'max_length': self.max_length,
             'pad_token': self.tokenizer.pad_token,
             'pad_token_id': self.tokenizer.pad_token_id,
             'unk_token': self.tokenizer.unk_token,
-            'unk_token_id': self.tokenizer.unk_token_id
+            'unk_token_id': self.tokenizer.unk_token_id,
+            'cls_token': self.tokenizer.cls_token,
+            'cls_token_id': self.tokenizer.cls_token_id,
+            'sep_token': self.tokenizer.sep_token,
+            'sep_token_id': self.tokenizer.sep_token_id
         }
         
         with open(android_dir / "tokenizer_config.json", 'w') as f:
             json.dump(tokenizer_config, f, indent=2)
         
-        # Save vocabulary
+        # The exported graphs take a fixed [1, max_length] input
+        model_info = {
+            'input_shape': [1, self.max_length],
+            'output_shape': [1, self.pytorch_model.config.num_labels],
+            'quantized': bool(tflite_files) and 'quantized' in best_tflite.name
+        }
+        with open(android_dir / "model_info.json", 'w') as f:
+            json.dump(model_info, f, indent=2)
+        
+        # Save vocabulary (compact: it is parsed at app start, never read by people)
         vocab = dict(sorted(self.tokenizer.vocab.items(), key=lambda x: x[1]))
         with open(android_dir / "vocab.json", 'w') as f:
-            json.dump(vocab, f, indent=2)
+            json.dump(vocab, f, separators=(',', ':'))
         
         # Copy label encoder
         label_encoder_path = self.model_path / "label_encoder.json"
@@ -447,37 +472,78 @@ class MobileModelConverter:
             shutil.copy2(label_encoder_path, android_dir / "label_encoder.json")
         
         logger.info(f"Android assets created in {android_dir}")
+        return str(android_dir)
+    
+    def run_stage(self, name: str, inputs: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+        """Run one CONVERSION_STAGES stage; returns its artifacts for the stage manifest."""
+        if name == 'tensorflow':
+            return {'tensorflow_model': self.convert_to_tensorflow()}
+        if name == 'tflite':
+            return {'tflite_model': self.convert_to_tflite(inputs['tensorflow']['tensorflow_model'])}
+        if name == 'onnx':
+            onnx_path = self.convert_to_onnx()
+            artifacts = {'onnx_model': onnx_path}
+            # The dynamo exporter writes weights to an external data file next to the graph
+            if Path(onnx_path + ".data").exists():
+                artifacts['onnx_data'] = onnx_path + ".data"
+            return artifacts
+        if name == 'onnx_quantized':
+            return {'onnx_quantized_model': self.quantize_onnx_model(inputs['onnx']['onnx_model'])}
+        if name == 'benchmark':
+            self.benchmark_models(self.config['data']['test_file'])
+            return {'benchmark_results': str(self.output_dir / "benchmark_results.json")}
+        if name == 'android_assets':
+            return {'android_assets': self.create_android_assets()}
+        raise ValueError(f"Unknown conversion stage: {name}")
     
-    def convert_all(self):
-        """Run complete conversion pipeline."""
+    def convert_all(self, android_assets: bool = True, parallel: Optional[bool] = None):
+        """Run complete conversion pipeline (`parallel` overrides the config's conversion setting)."""
         logger.info("Starting complete model conversion pipeline...")
         
         # Load trained model
         self.load_trained_model()
         
-        # Convert to different formats
-        tf_model_path = self.convert_to_tensorflow()
-        onnx_path = self.convert_to_onnx()
-        quantized_onnx_path = self.quantize_onnx_model(onnx_path)
-        tflite_path = self.convert_to_tflite(tf_model_path)
-        
-        # Benchmark all models
-        self.benchmark_models(self.config['data']['test_file'])
-        
-        # Create Android assets
-        self.create_android_assets()
+        stages = {name: stage for name, stage in CONVERSION_STAGES.items()
+                  if android_assets or name != 'android_assets'}
+        settings = dict(DEFAULT_CONVERSION_SETTINGS)
+        settings.update(self.config.get('conversion') or {})
+        if parallel is None:
+            # On one core the extra process only adds its start-up (imports, model load) to the wall time
+            parallel = available_cores() > 1 if settings['parallel'] == "auto" else bool(settings['parallel'])
+        
+        # Convert to every format, then benchmark them (and create Android assets)
+        graph = StageGraph(stages, self.output_dir / MANIFEST_DIR)
+        pipeline = graph.run(
+            partial(_convert_branch, self.config_path, str(self.model_path), str(self.output_dir), stages),
+            partial(run_branch, self.run_stage, stages, graph.manifest_dir),
+            local_branches={'onnx', 'main'},
+            parallel=parallel
+        )
         
-        logger.info("Model conversion pipeline completed!")
+        logger.info(f"Model conversion pipeline completed in {pipeline['wall_time_s']:.0f}s "
+                    f"({pipeline['stage_time_s']:.0f}s of stage work)")
+
+
+def _convert_branch(config_path: str, model_path: str, output_dir: str, stages: Dict[str, Dict], names: List[str]):
+    """Run conversion stages in a fresh process with its own converter."""
+    converter = MobileModelConverter(config_path, model_path, output_dir)
+    converter.load_trained_model()
+    run_branch(converter.run_stage, stages, converter.output_dir / MANIFEST_DIR, names)
 
 
 def main():
     """Main conversion script."""
-    if len(sys.argv) != 3:
-        print("Usage: python convert_to_mobile.py <config_path> <model_path>")
-        sys.exit(1)
-    
-    config_path = sys.argv[1]
-    model_path = sys.argv[2]
+    parser = argparse.ArgumentParser(description="Convert a trained model for mobile deployment")
+    parser.add_argument("config_path", help="Training config")
+    parser.add_argument("model_path", help="Trained model directory")
+    parser.add_argument("--output-dir", default="../models/mobile", help="Where to write the converted models")
+    parser.add_argument("--skip-android-assets", action="store_true",
+                        help="Convert and benchmark only (e.g. for comparisons)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Run every conversion stage in this process, one after another")
+    args = parser.parse_args()
+    config_path = args.config_path
+    model_path = args.model_path
     
     if not os.path.exists(config_path):
         logger.error(f"Config file not found: {config_path}")
@@ -487,8 +553,8 @@ def main():
         logger.error(f"Model path not found: {model_path}")
         sys.exit(1)
     
-    converter = MobileModelConverter(config_path, model_path)
-    converter.convert_all()
+    converter = MobileModelConverter(config_path, model_path, args.output_dir)
+    converter.convert_all(android_assets=not args.skip_android_assets, parallel=False if args.sequential else None)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Streaming duplicate and near-duplicate detection for generated examples.
+Rows are checked a frame at a time, as they are emitted, against exact,
+normalized-text and near-duplicate keys. Exact and normalized keys live in
+fixed-size Bloom filters, so their memory is set by the configured capacity.
+Near-duplicates are found with MinHash LSH and confirmed by exact shingle
+Jaccard against kept rows in the same bucket. Only the most recent kept rows
+of each category (near_window) are indexed, and each bucket holds at most
+max_bucket_rows of them, so that index is bounded too.
+"""
+
+import re
+import sys
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+DEDUP_REASONS = ["exact", "normalized", "near"]
+
+# Fixed 16-byte keys for pandas' SipHash, giving two stable 64-bit halves per key
+_HASH_KEYS = ("dedup-index-h1..", "dedup-index-h2..")
+
+# Rows whose MinHash signatures are computed in one array operation
+_SIGNATURE_BATCH = 4096
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _NON_WORD.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _hash_pairs(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Stable (unlike the salted builtin hash) 128-bit hashes of string keys, as two uint64 arrays."""
+    return tuple(pd.util.hash_array(keys, hash_key=hash_key, categorize=False) for hash_key in _HASH_KEYS)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 128-bit hashes, queried and updated a batch at a time."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate in (0, 1)")
+        self.num_bits = max(8, int(-capacity * np.log(error_rate) / (np.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * np.log(2)))
+        self._bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bits.nbytes
+
+    def _positions(self, h1: np.ndarray, h2: np.ndarray) -> np.ndarray:
+        # Kirsch-Mitzenmacher double hashing (uint64 arithmetic wraps mod 2**64)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps * (h2 | np.uint64(1))[:, None]) % np.uint64(self.num_bits)
+
+    def add_many(self, h1: np.ndarray, h2: np.ndarray) -> np.ndarray:
+        """Insert keys; return a mask of those that were (probably) present, counting earlier keys in the batch."""
+        positions = self._positions(h1, h2)
+        byte = positions >> np.uint64(3)
+        mask = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        present = np.all(self._bits[byte] & mask, axis=1)
+        # A key repeated within the batch is present from its second copy on
+        present |= pd.DataFrame({'h1': h1, 'h2': h2}).duplicated().to_numpy()
+        np.bitwise_or.at(self._bits, byte.ravel(), mask.ravel())
+        return present
+
+
+class MinHasher:
+    """MinHash signatures over character shingles of normalized text, a batch of texts at a time."""
+
+    def __init__(self, num_perm: int, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        # Multiply-shift hashing: odd 64-bit multipliers, arithmetic wraps mod 2**64
+        self._a = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+        self._mix = rng.integers(0, np.iinfo(np.uint64).max, size=shingle_size, dtype=np.uint64) | np.uint64(1)
+
+    def shingles(self, normalized: List[str]) -> List[np.ndarray]:
+        """Per text, the hashes of the character shingles of the space-padded text (repeats included)."""
+        padded = [f" {text} ".ljust(self.shingle_size) for text in normalized]
+        codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+        hashes = sum(codes[i:len(codes) - self.shingle_size + 1 + i] * self._mix[i]
+                     for i in range(self.shingle_size))
+        # Drop shingles that would span two texts
+        ends = np.cumsum(lengths)
+        counts = lengths - self.shingle_size + 1
+        return [hashes[end - length:end - length + count]
+                for end, length, count in zip(ends.tolist(), lengths.tolist(), counts.tolist())]
+
+    def signatures(self, shingles: List[np.ndarray]) -> np.ndarray:
+        """(texts × num_perm) signatures, one array operation per batch of texts."""
+        signatures = np.empty((len(shingles), len(self._a)), dtype=np.uint64)
+        for start in range(0, len(shingles), _SIGNATURE_BATCH):
+            batch = shingles[start:start + _SIGNATURE_BATCH]
+            hashes = np.concatenate(batch)
+            permuted = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+            offsets = np.cumsum([0] + [len(row) for row in batch[:-1]])
+            signatures[start:start + len(batch)] = np.minimum.reduceat(permuted, offsets, axis=0)
+        return signatures
+
+
+def shingle_sets(shingles: List[np.ndarray]) -> List[np.ndarray]:
+    """Per text, its distinct shingle hashes as a sorted uint32 array (compact to keep and compare)."""
+    if not shingles:
+        return []
+    lengths = np.fromiter(map(len, shingles), dtype=np.int64, count=len(shingles))
+    rows = np.repeat(np.arange(len(shingles), dtype=np.uint64), lengths)
+    # Sorting (text, hash) pairs as one 64-bit key dedups every text's shingles in one pass
+    pairs = np.unique((rows << np.uint64(32)) | (np.concatenate(shingles) >> np.uint64(32)))
+    counts = np.bincount((pairs >> np.uint64(32)).astype(np.int64), minlength=len(shingles))
+    return np.split((pairs & np.uint64(0xFFFFFFFF)).astype(np.uint32), np.cumsum(counts)[:-1])
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity of two sorted arrays of distinct shingle hashes."""
+    shared = len(np.intersect1d(a, b, assume_unique=True))
+    return shared / (len(a) + len(b) - shared)
+
+
+class _NearWindow:
+    """A category's most recent kept rows (shingle sets and LSH keys), reused as a ring."""
+
+    def __init__(self):
+        self.shingles: List[np.ndarray] = []
+        self.keys: List[List[int]] = []
+        self.next_slot = 0
+
+
+class StreamingDedupIndex:
+    """Checks rows against everything seen so far, within the same category."""
+
+    def __init__(self, capacity: int = 5_000_000, error_rate: float = 1e-4,
+                 near_duplicates: bool = True, near_threshold: float = 0.9,
+                 num_bands: int = 3, rows_per_band: int = 10, shingle_size: int = 3,
+                 near_window: int = 10_000, max_bucket_rows: int = 32):
+        self.settings = {
+            'capacity': capacity, 'error_rate': error_rate, 'near_duplicates': near_duplicates,
+            'near_threshold': near_threshold, 'num_bands': num_bands, 'rows_per_band': rows_per_band,
+            'shingle_size': shingle_size, 'near_window': near_window, 'max_bucket_rows': max_bucket_rows,
+        }
+        if near_window <= 0 or max_bucket_rows <= 0:
+            raise ValueError("near_window and max_bucket_rows must be positive")
+        self.exact = BloomFilter(capacity, error_rate)
+        self.normalized = BloomFilter(capacity, error_rate)
+        self.near_duplicates = near_duplicates
+        self.near_threshold = near_threshold
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        self.near_window = near_window
+        self.max_bucket_rows = max_bucket_rows
+        if near_duplicates:
+            self.minhasher = MinHasher(num_bands * rows_per_band, shingle_size)
+            rng = np.random.default_rng(2)
+            self._band_mix = rng.integers(0, np.iinfo(np.uint64).max, size=rows_per_band + 2,
+                                          dtype=np.uint64) | np.uint64(1)
+            # LSH buckets (64-bit keys per category and band) hold window slots that only propose
+            # candidates; the window's shingle sets confirm them. Windows are per category, so
+            # splitting categories across processes does not change which rows are compared.
+            self._buckets: Dict[int, List[int]] = {}
+            self._windows: Dict[str, _NearWindow] = defaultdict(_NearWindow)
+        self.stats: Dict[str, Counter] = defaultdict(Counter)
+        # Index memory held by worker processes whose counts were merged in
+        self.merged_nbytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the Bloom filters and the near-duplicate index."""
+        size = self.exact.nbytes + self.normalized.nbytes
+        if self.near_duplicates:
+            size += sys.getsizeof(self._buckets) + sum(
+                sys.getsizeof(key) + sys.getsizeof(slots) for key, slots in self._buckets.items())
+            for window in self._windows.values():
+                size += sys.getsizeof(window.shingles) + sys.getsizeof(window.keys)
+                size += sum(sys.getsizeof(shingles) + shingles.nbytes for shingles in window.shingles)
+                size += sum(sys.getsizeof(keys) + sum(map(sys.getsizeof, keys)) for keys in window.keys)
+        return size
+
+    def _band_keys(self, signatures: np.ndarray, categories: np.ndarray) -> np.ndarray:
+        """(texts × num_bands) bucket keys mixing each band's signature slice with the category and band."""
+        category_hashes = pd.util.hash_array(categories, categorize=False)
+        bands = signatures.reshape(len(signatures), self.num_bands, self.rows_per_band)
+        keys = (bands * self._band_mix[:self.rows_per_band]).sum(axis=2, dtype=np.uint64)
+        keys += category_hashes[:, None] * self._band_mix[-2]
+        keys += np.arange(self.num_bands, dtype=np.uint64) * self._band_mix[-1]
+        return keys
+
+    def _index(self, window: _NearWindow, shingles: np.ndarray, keys: List[int]):
+        """Add a kept row to its category's window, evicting the window's oldest row once it is full."""
+        if len(window.shingles) < self.near_window:
+            slot = len(window.shingles)
+            window.shingles.append(shingles)
+            window.keys.append(keys)
+        else:
+            slot = window.next_slot
+            window.next_slot = (slot + 1) % self.near_window
+            for key in window.keys[slot]:
+                slots = self._buckets.get(key)
+                if slots and slot in slots:
+                    slots.remove(slot)
+                    if not slots:
+                        del self._buckets[key]
+            window.shingles[slot] = shingles
+            window.keys[slot] = keys
+        for key in keys:
+            slots = self._buckets.setdefault(key, [])
+            if len(slots) >= self.max_bucket_rows:
+                slots.pop(0)
+            slots.append(slot)
+
+    def _near_duplicates(self, normalized: List[str], categories: np.ndarray) -> np.ndarray:
+        """Check rows in order against recent kept rows sharing an LSH band, indexing those that are new."""
+        shingles = self.minhasher.shingles(normalized)
+        band_keys = self._band_keys(self.minhasher.signatures(shingles), categories).tolist()
+        near = np.zeros(len(normalized), dtype=bool)
+        for i, (row_shingles, keys, category) in enumerate(zip(shingle_sets(shingles), band_keys, categories)):
+            window = self._windows[category]
+            candidates = {slot for key in keys if key in self._buckets for slot in self._buckets[key]}
+            if any(jaccard(row_shingles, window.shingles[slot]) >= self.near_threshold for slot in candidates):
+                near[i] = True
+                continue
+            self._index(window, row_shingles, keys)
+        return near
+
+    def check_frame(self, frame: pd.DataFrame) -> np.ndarray:
+        """Record a frame's rows in order; return each row's duplicate reason, or None if it is new."""
+        reasons = np.full(len(frame), None, dtype=object)
+        if frame.empty:
+            return reasons
+        categories = frame["category"].astype(str).to_numpy(dtype=object)
+        texts = frame["user_input"].astype(str).to_numpy(dtype=object)
+
+        exact = self.exact.add_many(*_hash_pairs(categories + "\x1f" + texts))
+        reasons[exact] = "exact"
+
+        rest = np.flatnonzero(~exact)
+        normalized = np.array([normalize_text(text) for text in texts[rest]], dtype=object)
+        if len(rest):
+            duplicate = self.normalized.add_many(*_hash_pairs(categories[rest] + "\x1f" + normalized))
+            reasons[rest[duplicate]] = "normalized"
+            rest, normalized = rest[~duplicate], normalized[~duplicate]
+
+        if self.near_duplicates and len(rest):
+            near = self._near_duplicates(list(normalized), categories[rest])
+            reasons[rest[near]] = "near"
+        return reasons
+
+    def filter_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """The frame's rows that are not duplicates, counting outcomes per source."""
+        reasons = self.check_frame(frame)
+        outcomes = pd.DataFrame({'source': frame["source"].astype(str).to_numpy(),
+                                 'reason': np.where(pd.isna(reasons), "kept", reasons)})
+        for (source, reason), count in outcomes.value_counts().items():
+            self.stats[source]["seen"] += count
+            self.stats[source][reason] += count
+        return frame[pd.isna(reasons)]
+
+    def filter(self, rows: Iterable[Dict], batch_size: int = 4096) -> Iterator[Dict]:
+        """Yield only rows that are not duplicates, checked a batch at a time."""
+        rows = iter(rows)
+        while True:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            if not batch:
+                return
+            for row, reason in zip(batch, self.check_frame(pd.DataFrame(batch))):
+                self.stats[row["source"]]["seen"] += 1
+                self.stats[row["source"]][reason or "kept"] += 1
+                if reason is None:
+                    yield row
+
+    def merge_stats(self, stats: Dict[str, Dict[str, int]], nbytes: int = 0):
+        """Add per-source counts and the index size from another index (e.g. one used in a worker process)."""
+        self.merged_nbytes += nbytes
+        for source, counts in stats.items():
+            self.stats[source].update(counts)
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Per-source counts of seen, kept and dropped rows by reason."""
+        return {
+            source: {key: counts[key] for key in ["seen", "kept"] + DEDUP_REASONS}
+            for source, counts in sorted(self.stats.items())
+        }
+
+    def print_summary(self):
+        print(f"\nDeduplication by source (index size {(self.nbytes + self.merged_nbytes) / 1024**2:.1f}MB):")
+        print(f"{'source':<32} {'seen':>8} {'kept':>8} " + " ".join(f"{r:>10}" for r in DEDUP_REASONS))
+        for source, counts in self.summary().items():
+            print(f"{source:<32} {counts['seen']:>8} {counts['kept']:>8} "
+                  + " ".join(f"{counts[r]:>10}" for r in DEDUP_REASONS))
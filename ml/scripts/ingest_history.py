@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Streaming ingestion of Chronofile history exports.
+Reads chronofile.tsv files (Entry.toTsvRow: activity, lat, long, note,
+startTime) block by block from a memory map, aggregates every distinct
+activity string with its frequency and time-of-day profile, and emits the
+activities as example rows in the ActivityDataGenerator schema.
+"""
+
+import argparse
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from shard_io import ShardWriter, SHARD_SUFFIXES, ROW_SCHEMA
+from weak_labeler import KeywordWeakLabeler
+
+# Column order written by Entry.toTsvRow in the Android app
+HISTORY_COLUMNS = ["activity", "lat", "long", "note", "start_time"]
+
+HOURS_PER_DAY = 24
+READ_BLOCK_SIZE = 64 << 20
+
+# Partial aggregates are merged once this many have accumulated
+COMPACT_EVERY = 64
+
+# Byte ranges per worker, so one slow range does not hold up the pool
+RANGES_PER_WORKER = 4
+
+HISTORY_SOURCE = "user_history"
+
+
+def _aggregate(table: pa.Table, aggregations: Dict[str, tuple]) -> pa.Table:
+    """Group by (activity, hour) and name each output column after its key in `aggregations`."""
+    grouped = table.group_by(["activity", "hour"]).aggregate(list(aggregations.values()))
+    columns = {"activity": grouped.column("activity"), "hour": grouped.column("hour")}
+    for name, (column, function) in aggregations.items():
+        columns[name] = grouped.column(f"{column}_{function}")
+    return pa.table(columns)
+
+
+def newline_ranges(path: Union[str, Path], parts: int) -> List[Tuple[int, int]]:
+    """Split a file into about `parts` byte ranges that each end on a line boundary."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    bounds = [0]
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i in range(1, parts):
+            position = mm.find(b"\n", max(bounds[-1], size * i // parts))
+            if position == -1:
+                break
+            bounds.append(position + 1)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _aggregate_range(task: Tuple[str, int, int, float, int]) -> "HistoryAggregator":
+    path, start, end, utc_offset_hours, block_size = task
+    aggregator = HistoryAggregator(utc_offset_hours, block_size)
+    aggregator.add_range(path, start, end)
+    return aggregator
+
+
+class HistoryAggregator:
+    """Per-activity counts, first/last timestamps and hour-of-day histograms.
+
+    Each block is reduced to (activity, hour) partial aggregates with Arrow
+    group-bys, so memory grows with the number of distinct activities rather
+    than with the size of the export.
+    """
+
+    def __init__(self, utc_offset_hours: float = 0.0, block_size: int = READ_BLOCK_SIZE):
+        self.offset_seconds = int(round(utc_offset_hours * 3600))
+        self.block_size = block_size
+        self.rows_read = 0
+        self.invalid_rows = 0
+        self.bytes_read = 0
+        self._parts: List[pa.Table] = []
+
+    def _skip_invalid_row(self, row) -> str:
+        # e.g. a note containing a tab; the app itself would fail to parse it too
+        self.invalid_rows += 1
+        return "skip"
+
+    def iter_batches(self, path: Union[str, Path], start: int = 0,
+                     end: Optional[int] = None) -> Iterator[pa.RecordBatch]:
+        """Stream a byte range of a history TSV as record batches of (activity, start_time)."""
+        read_options = pacsv.ReadOptions(column_names=HISTORY_COLUMNS, block_size=self.block_size)
+        parse_options = pacsv.ParseOptions(
+            delimiter="\t", quote_char=False, escape_char=False,
+            invalid_row_handler=self._skip_invalid_row
+        )
+        convert_options = pacsv.ConvertOptions(
+            # Dictionary-encoding the few distinct activities makes grouping much cheaper
+            column_types={"activity": pa.dictionary(pa.int32(), pa.string()), "start_time": pa.int64()},
+            include_columns=["activity", "start_time"],
+            strings_can_be_null=False
+        )
+        with pa.memory_map(str(path), "r") as source:
+            end = source.size() if end is None else end
+            source.seek(start)
+            # A zero-copy view of the mapped range
+            data = pa.BufferReader(source.read_buffer(end - start))
+            yield from pacsv.open_csv(data, read_options, parse_options, convert_options)
+        self.bytes_read += end - start
+
+    def add_batch(self, batch: pa.RecordBatch):
+        self.rows_read += batch.num_rows
+        table = pa.table({"activity": batch.column("activity"), "start_time": batch.column("start_time")})
+        if table.column("start_time").null_count:
+            table = table.filter(pc.is_valid(table.column("start_time")))
+
+        seconds = table.column("start_time").to_numpy() + self.offset_seconds
+        hours = (seconds // 3600) % HOURS_PER_DAY
+        table = table.append_column("hour", pa.array(hours.astype(np.int8)))
+        partial = _aggregate(table, {
+            "count": ("start_time", "count"), "first_seen": ("start_time", "min"), "last_seen": ("start_time", "max")
+        })
+
+        # Trim and filter the few aggregated strings rather than every row; rows
+        # with an empty activity only record when the current activity started
+        activities = pc.utf8_trim_whitespace(pc.cast(partial.column("activity"), pa.string()))
+        partial = partial.set_column(0, "activity", activities)
+        self._parts.append(partial.filter(pc.not_equal(activities, "")))
+
+        if len(self._parts) >= COMPACT_EVERY:
+            self._parts = [self._merged()]
+
+    def add_range(self, path: Union[str, Path], start: int = 0, end: Optional[int] = None):
+        for batch in self.iter_batches(path, start, end):
+            self.add_batch(batch)
+
+    def add_file(self, path: Union[str, Path], workers: int = 1):
+        """Aggregate a whole file, splitting it into line-aligned ranges across processes."""
+        if workers <= 1:
+            self.add_range(path)
+            return
+        tasks = [
+            (str(path), start, end, self.offset_seconds / 3600, self.block_size)
+            for start, end in newline_ranges(path, workers * RANGES_PER_WORKER)
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(_aggregate_range, tasks):
+                self.merge(partial)
+
+    def merge(self, other: "HistoryAggregator"):
+        """Fold in the counts from another aggregator."""
+        self.rows_read += other.rows_read
+        self.invalid_rows += other.invalid_rows
+        self.bytes_read += other.bytes_read
+        self._parts.extend(other._parts)
+        if len(self._parts) >= COMPACT_EVERY:
+            self._parts = [self._merged()]
+
+    def _merged(self) -> pa.Table:
+        return _aggregate(pa.concat_tables(self._parts), {
+            "count": ("count", "sum"), "first_seen": ("first_seen", "min"), "last_seen": ("last_seen", "max")
+        })
+
+    def activity_stats(self) -> pd.DataFrame:
+        """One row per distinct activity, most frequent first."""
+        hour_columns = [f"h{hour:02d}" for hour in range(HOURS_PER_DAY)]
+        if not self._parts:
+            return pd.DataFrame(columns=["activity", "count", "first_seen", "last_seen", "peak_hour"] + hour_columns)
+
+        merged = self._merged().to_pandas()
+        histogram = merged.pivot_table(index="activity", columns="hour", values="count",
+                                       aggfunc="sum", fill_value=0)
+        histogram = histogram.reindex(columns=range(HOURS_PER_DAY), fill_value=0)
+        histogram.columns = hour_columns
+
+        stats = merged.groupby("activity").agg(
+            count=("count", "sum"), first_seen=("first_seen", "min"), last_seen=("last_seen", "max")
+        )
+        stats["peak_hour"] = histogram.to_numpy().argmax(axis=1)
+        stats = stats.join(histogram).reset_index()
+        return stats.sort_values(["count", "activity"], ascending=[False, True], ignore_index=True)
+
+
+def history_examples(stats: pd.DataFrame, labeler: KeywordWeakLabeler, min_count: int = 1,
+                     min_confidence: float = 0.5, keep_unlabeled: bool = False) -> Iterator[Dict]:
+    """Yield one weakly labelled example row per distinct activity, in the generator's row schema."""
+    stats = stats[stats["count"] >= min_count]
+    labels = labeler.label(stats["activity"].tolist(), min_confidence)
+    for activity, category, icon_label, confidence in zip(
+            stats["activity"].tolist(), labels["category"].tolist(),
+            labels["icon_label"].tolist(), labels["confidence_score"].tolist()):
+        if not category and not keep_unlabeled:
+            continue
+        yield {
+            "user_input": activity,
+            "icon_label": icon_label,
+            "category": category,
+            "confidence_score": confidence,
+            "source": HISTORY_SOURCE,
+        }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ingest chronofile.tsv history into training rows")
+    parser.add_argument("history", nargs="+", help="chronofile.tsv files or merged exports")
+    parser.add_argument("--output-dir", default="../data/history", help="Directory for stats and examples")
+    parser.add_argument("--utc-offset-hours", type=float, default=0.0,
+                        help="Offset applied to startTime before computing the hour of day")
+    parser.add_argument("--min-count", type=int, default=1,
+                        help="Skip activities logged fewer times than this")
+    parser.add_argument("--min-confidence", type=float, default=0.5,
+                        help="Minimum weak-label share for an activity to get a category")
+    parser.add_argument("--keep-unlabeled", action="store_true",
+                        help="Also emit activities with no known category (empty category)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write examples as shards instead of a CSV")
+    parser.add_argument("--shard-size", type=int, default=100_000, help="Rows per shard in streaming mode")
+    parser.add_argument("--shard-format", choices=sorted(SHARD_SUFFIXES), default="parquet",
+                        help="Shard file format in streaming mode")
+    parser.add_argument("--block-size", type=int, default=READ_BLOCK_SIZE, help="Bytes parsed per block")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes parsing separate byte ranges of each file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    from prepare_data import ActivityDataGenerator
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    aggregator = HistoryAggregator(args.utc_offset_hours, args.block_size)
+    started = time.perf_counter()
+    for path in args.history:
+        aggregator.add_file(path, workers=args.workers)
+    stats = aggregator.activity_stats()
+    elapsed = time.perf_counter() - started
+
+    print(f"Read {aggregator.rows_read} rows ({aggregator.bytes_read / 1024**2:.1f}MB) in {elapsed:.2f}s, "
+          f"skipped {aggregator.invalid_rows} malformed rows")
+    print(f"{len(stats)} distinct activities")
+    stats.to_csv(output_dir / "activity_stats.csv", index=False)
+
+    labeler = KeywordWeakLabeler(ActivityDataGenerator().categories)
+    examples = history_examples(stats, labeler, args.min_count, args.min_confidence, args.keep_unlabeled)
+    if args.stream:
+        with ShardWriter(output_dir / "shards", shard_size=args.shard_size, shard_format=args.shard_format) as writer:
+            writer.write_many(examples)
+        written = writer.total_rows
+    else:
+        frame = pd.DataFrame(list(examples), columns=ROW_SCHEMA.names)
+        frame.to_csv(output_dir / "history_data.csv", index=False)
+        written = len(frame)
+    print(f"Wrote {written} example rows to {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,35 @@ Generates training data from existing keywords and synthetic augmentation.
 
 import pandas as pd
 import numpy as np
+import argparse
 import json
-import random
-from typing import List, Dict, Tuple
+import math
+import multiprocessing
+import queue
+import string
+import traceback
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
 from pathlib import Path
 import re
 from dataclasses import dataclass
-from collections import defaultdict
+from collections import defaultdict, Counter
+from itertools import islice
+
+from shard_io import ShardWriter, SHARD_SUFFIXES, ROW_SCHEMA
+from template_expansion import ExpansionBudgets, TemplateExpansionEngine
+from dedup_index import StreamingDedupIndex
+from split_assigner import HashSplitAssigner, SPLITS, print_split_distribution, split_shards
+
+# Number of leading examples that the noise stage draws variations from
+NOISE_SAMPLE_SIZE = 500
+
+PUNCTUATION = ["!", ".", "?", "..."]
+
+# Generation stages in output order; each runs once per category
+STAGES = ["base", "template", "contextual", "multilingual", "realistic"]
+
+# Independent random streams, one SeedSequence spawn key per entry
+SEED_STREAMS = STAGES + ["noise", "balance"]
 
 @dataclass
 class CategoryData:
@@ -22,11 +44,78 @@ class CategoryData:
     templates: List[str]
     character_features: List[str]
 
+def _frame_rows(frame: pd.DataFrame) -> Iterator[Dict]:
+    """Yield the rows of an example DataFrame as dicts."""
+    columns = list(frame.columns)
+    for values in zip(*(frame[column].tolist() for column in columns)):
+        yield dict(zip(columns, values))
+
+
+# Frames a generation worker may have waiting for the parent before it blocks
+WORKER_QUEUE_FRAMES = 2
+
+
+def _unique_frames(generator: "ActivityDataGenerator", dedup: StreamingDedupIndex,
+                   categories: Iterable[str]) -> Iterator[Tuple[str, object]]:
+    """Generate and deduplicate the tasks of some categories, in task order.
+    
+    Yields ("frame", frame) per non-empty deduplicated chunk and ("done", task)
+    after each task, then ("noise", frame) with these categories' surviving
+    noise variants (indexed by their position among all variants) and
+    ("stats", (summary, nbytes)) with the dedup counts and index size. The
+    dedup index is per category, so categories can be split across processes
+    without changing the result.
+    """
+    categories = set(categories)
+    for stage, category_name in generator.stage_tasks():
+        if category_name not in categories:
+            continue
+        for frame in generator.stage_frames(stage, category_name):
+            frame = dedup.filter_frame(frame)
+            if len(frame):
+                yield "frame", frame
+        yield "done", (stage, category_name)
+    
+    noise = generator.noise_frame()
+    yield "noise", dedup.filter_frame(noise[noise["category"].isin(categories)])
+    yield "stats", (dedup.summary(), dedup.nbytes)
+
+
+def _generation_worker(generator_settings: Dict, dedup_settings: Dict, categories: List[str],
+                       results: multiprocessing.Queue):
+    try:
+        generator = ActivityDataGenerator(**generator_settings)
+        for message in _unique_frames(generator, StreamingDedupIndex(**dedup_settings), categories):
+            results.put(message)
+    except Exception:
+        results.put(("error", traceback.format_exc()))
+
+
+def _next_message(results: multiprocessing.Queue, process: multiprocessing.Process) -> Tuple[str, object]:
+    while True:
+        try:
+            kind, payload = results.get(timeout=1.0)
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"{process.name} exited (code {process.exitcode}) without finishing")
+            continue
+        if kind == "error":
+            raise RuntimeError(f"{process.name} failed:\n{payload}")
+        return kind, payload
+
+
 class ActivityDataGenerator:
-    def __init__(self):
+    def __init__(self, budgets: Optional[ExpansionBudgets] = None, max_modifiers: int = 2, seed: int = 42):
         self.categories = self._load_categories()
+        self.category_index = {name: i for i, name in enumerate(self.categories)}
         self.activity_templates = self._load_templates()
         self.multilingual_terms = self._load_multilingual_terms()
+        self.budgets = budgets
+        self.max_modifiers = max_modifiers
+        self.seed = seed
+        self.expansion_engine = TemplateExpansionEngine(
+            self.activity_templates, budgets, max_modifiers=max_modifiers
+        )
         
     def _load_categories(self) -> Dict[str, CategoryData]:
         """Load category data from the existing ActivityClassifier structure."""
@@ -237,127 +326,83 @@ class ActivityDataGenerator:
             }
         }
     
-    def generate_base_examples(self) -> List[Dict]:
+    def _select_categories(self, categories: Optional[Iterable[str]]) -> List[str]:
+        return list(self.categories) if categories is None else list(categories)
+    
+    def task_rng(self, stream: str, category_name: Optional[str] = None) -> np.random.Generator:
+        """Return the random generator for one stage (and category) of the pipeline.
+        
+        Seeds are derived from the root seed by a SeedSequence spawn key, so a
+        task draws the same numbers whichever process runs it and in whatever order.
+        """
+        spawn_key = (SEED_STREAMS.index(stream),)
+        if category_name is not None:
+            spawn_key += (self.category_index[category_name],)
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=spawn_key))
+    
+    def generate_base_examples(self, categories: Optional[Iterable[str]] = None) -> Iterator[Dict]:
         """Generate base examples from existing keywords."""
-        examples = []
-        
-        for category_name, category_data in self.categories.items():
+        for category_name in self._select_categories(categories):
+            category_data = self.categories[category_name]
             # Add direct keyword examples
             for keyword in category_data.keywords:
-                examples.append({
+                yield {
                     "user_input": keyword,
                     "icon_label": category_data.icon_res,
                     "category": category_name,
                     "confidence_score": 1.0,
                     "source": "direct_keyword"
-                })
+                }
                 
                 # Add simple variations
-                examples.extend([
-                    {
-                        "user_input": f"go {keyword}",
-                        "icon_label": category_data.icon_res,
-                        "category": category_name,
-                        "confidence_score": 0.9,
-                        "source": "keyword_variation"
-                    },
-                    {
-                        "user_input": f"{keyword} session",
-                        "icon_label": category_data.icon_res,
-                        "category": category_name,
-                        "confidence_score": 0.9,
-                        "source": "keyword_variation"
-                    }
-                ])
-        
-        return examples
+                yield {
+                    "user_input": f"go {keyword}",
+                    "icon_label": category_data.icon_res,
+                    "category": category_name,
+                    "confidence_score": 0.9,
+                    "source": "keyword_variation"
+                }
+                yield {
+                    "user_input": f"{keyword} session",
+                    "icon_label": category_data.icon_res,
+                    "category": category_name,
+                    "confidence_score": 0.9,
+                    "source": "keyword_variation"
+                }
     
-    def generate_template_examples(self) -> List[Dict]:
+    def generate_template_examples(self, categories: Optional[Iterable[str]] = None) -> Iterator[Dict]:
         """Generate examples using activity templates."""
-        examples = []
-        
-        for category_name, category_data in self.categories.items():
-            for template in category_data.templates:
-                # Use top keywords for this category
-                top_keywords = category_data.keywords[:10]
-                
-                for keyword in top_keywords:
-                    try:
-                        if "{duration}" in template:
-                            duration = random.choice(["15", "30", "45", "60"])
-                            activity_text = template.format(duration=duration, activity=keyword)
-                        elif "{activity}" in template:
-                            activity_text = template.format(activity=keyword)
-                        else:
-                            activity_text = f"{template} {keyword}"
-                    except KeyError:
-                        # Handle templates with missing placeholders
-                        activity_text = f"{keyword} {template}".replace("{activity}", "").replace("{duration}", "")
-                    
-                    examples.append({
-                        "user_input": activity_text,
-                        "icon_label": category_data.icon_res,
-                        "category": category_name,
-                        "confidence_score": 0.8,
-                        "source": "template_generated"
-                    })
-        
-        return examples
+        for category_name in self._select_categories(categories):
+            for frame in self.stage_frames("template", category_name):
+                yield from _frame_rows(frame)
     
-    def generate_contextual_examples(self) -> List[Dict]:
+    def generate_contextual_examples(self, categories: Optional[Iterable[str]] = None) -> Iterator[Dict]:
         """Generate contextual examples with modifiers."""
-        examples = []
-        templates = self.activity_templates
-        
-        for category_name, category_data in self.categories.items():
-            # Use subset of keywords to avoid explosion
-            keywords = category_data.keywords[:8]
-            
-            for keyword in keywords:
-                # Time-based contexts
-                for time_prefix in templates["time_prefixes"][:5]:
-                    examples.append({
-                        "user_input": f"{time_prefix} {keyword}",
-                        "icon_label": category_data.icon_res,
-                        "category": category_name,
-                        "confidence_score": 0.7,
-                        "source": "contextual"
-                    })
-                
-                # Duration contexts
-                for duration in templates["duration_modifiers"][:3]:
-                    examples.append({
-                        "user_input": f"{duration} {keyword}",
-                        "icon_label": category_data.icon_res,
-                        "category": category_name,
-                        "confidence_score": 0.7,
-                        "source": "contextual"
-                    })
-        
-        return examples
+        for category_name in self._select_categories(categories):
+            for frame in self.stage_frames("contextual", category_name):
+                yield from _frame_rows(frame)
     
-    def generate_multilingual_examples(self) -> List[Dict]:
+    def generate_multilingual_examples(self, categories: Optional[Iterable[str]] = None) -> Iterator[Dict]:
         """Generate multilingual examples."""
-        examples = []
-        
-        for category_name in ["exercise", "work", "food"]:  # Subset for now
+        for category_name in self._select_categories(categories):
+            # Only a subset of categories has translations for now
+            if category_name not in self.multilingual_terms:
+                continue
             category_data = self.categories[category_name]
             
-            if category_name in self.multilingual_terms:
-                for lang, terms in self.multilingual_terms[category_name].items():
-                    for term in terms[:3]:  # Limit per language
-                        examples.append({
-                            "user_input": term,
-                            "icon_label": category_data.icon_res,
-                            "category": category_name,
-                            "confidence_score": 0.9,
-                            "source": f"multilingual_{lang}"
-                        })
-        
-        return examples
+            for lang, terms in self.multilingual_terms[category_name].items():
+                for term in terms[:3]:  # Limit per language
+                    yield {
+                        "user_input": term,
+                        "icon_label": category_data.icon_res,
+                        "category": category_name,
+                        "confidence_score": 0.9,
+                        "source": f"multilingual_{lang}"
+                    }
     
-    def generate_realistic_examples(self) -> List[Dict]:
+    def generate_realistic_examples(self, categories: Optional[Iterable[str]] = None) -> Iterator[Dict]:
         """Generate realistic user input examples."""
+        selected = set(self._select_categories(categories))
         realistic_patterns = [
             # Exercise patterns
             ("morning run 5km", "exercise", "ic_run", 1.0),
@@ -392,56 +437,58 @@ class ActivityDataGenerator:
             ("research project", "learning", "ic_note", 0.8),
         ]
         
-        examples = []
         for text, category, icon, confidence in realistic_patterns:
-            examples.append({
+            if category not in selected:
+                continue
+            yield {
                 "user_input": text,
                 "icon_label": icon,
                 "category": category,
                 "confidence_score": confidence,
                 "source": "realistic_pattern"
-            })
-        
-        return examples
+            }
     
-    def add_noise_and_variations(self, examples: List[Dict]) -> List[Dict]:
+    def noise_frame(self) -> pd.DataFrame:
+        """Noise variants of the first NOISE_SAMPLE_SIZE generated examples (before deduplication)."""
+        tasks = self.stage_tasks()
+        head = (example for task in tasks for frame in self.stage_frames(*task) for example in _frame_rows(frame))
+        return pd.DataFrame(list(self.add_noise_and_variations(head)), columns=ROW_SCHEMA.names)
+    
+    def add_noise_and_variations(self, examples: Iterable[Dict]) -> Iterator[Dict]:
         """Add natural variations and noise to examples."""
-        variations = []
-        
-        for example in examples[:500]:  # Apply to subset to control size
+        rng = self.task_rng("noise")
+        for example in islice(examples, NOISE_SAMPLE_SIZE):  # Apply to subset to control size
             text = example["user_input"]
             
             # Add typos (5% chance)
-            if random.random() < 0.05:
-                typo_text = self._add_typo(text)
-                variations.append({
+            if rng.random() < 0.05:
+                typo_text = self._add_typo(text, rng)
+                yield {
                     **example,
                     "user_input": typo_text,
                     "confidence_score": example["confidence_score"] * 0.9,
                     "source": f"{example['source']}_typo"
-                })
+                }
             
             # Add punctuation variations
-            if random.random() < 0.1:
-                punct_text = text + random.choice(["!", ".", "?", "..."])
-                variations.append({
+            if rng.random() < 0.1:
+                punct_text = text + PUNCTUATION[rng.integers(len(PUNCTUATION))]
+                yield {
                     **example,
                     "user_input": punct_text,
                     "confidence_score": example["confidence_score"],
                     "source": f"{example['source']}_punct"
-                })
-        
-        return variations
+                }
     
-    def _add_typo(self, text: str) -> str:
+    def _add_typo(self, text: str, rng: np.random.Generator) -> str:
         """Add a simple typo to text."""
         if len(text) < 3:
             return text
         
         # Simple character substitution
-        pos = random.randint(1, len(text) - 2)
+        pos = rng.integers(1, len(text) - 1)
         chars = list(text)
-        chars[pos] = random.choice('abcdefghijklmnopqrstuvwxyz')
+        chars[pos] = string.ascii_lowercase[rng.integers(len(string.ascii_lowercase))]
         return ''.join(chars)
     
     def balance_dataset(self, examples: List[Dict]) -> List[Dict]:
@@ -465,32 +512,99 @@ class ActivityDataGenerator:
                 balanced_examples.extend(category_examples)
             else:
                 # Randomly sample to target count
-                sampled = random.sample(category_examples, target_count)
+                rng = self.task_rng("balance", category)
+                indices = rng.choice(len(category_examples), size=target_count, replace=False)
+                sampled = [category_examples[i] for i in indices]
                 balanced_examples.extend(sampled)
         
         return balanced_examples
     
-    def generate_all_data(self, target_total: int = 10000) -> pd.DataFrame:
+    def stage_frames(self, stage: str, category_name: str) -> Iterator[pd.DataFrame]:
+        """Yield the examples of one (stage, category) task as DataFrames."""
+        category_data = self.categories[category_name]
+        if stage == "template":
+            yield from self.expansion_engine.expand_templates(category_data, self.task_rng(stage, category_name))
+        elif stage == "contextual":
+            yield from self.expansion_engine.expand_contextual(category_data, self.task_rng(stage, category_name))
+        else:
+            rows = list(getattr(self, f"generate_{stage}_examples")([category_name]))
+            if rows:
+                yield pd.DataFrame(rows, columns=ROW_SCHEMA.names)
+    
+    def stage_tasks(self) -> List[Tuple[str, str]]:
+        """Return every (stage, category) task in output order."""
+        return [(stage, category_name) for stage in STAGES for category_name in self.categories]
+    
+    def iter_unique_frames(self, dedup: StreamingDedupIndex, workers: int = 1) -> Iterator[pd.DataFrame]:
+        """Yield every generated example that survives deduplication, stage by stage, then noise variants.
+        
+        Frames are the generation chunks, so memory is bounded by the chunk
+        size rather than by whole tasks. With workers > 1 each category is
+        owned by one worker process, which generates and deduplicates its
+        tasks and hands the frames over through a bounded queue; they are
+        consumed in task order, so the output is identical to a serial run.
+        """
+        categories = list(self.categories)
+        workers = max(1, min(workers, len(categories)))
+        if workers == 1:
+            messages = _unique_frames(self, dedup, categories)
+            next_message = lambda owner: next(messages)
+            owners = dict.fromkeys(categories, 0)
+        else:
+            owners = {category_name: i % workers for i, category_name in enumerate(categories)}
+            context = multiprocessing.get_context("spawn")
+            generator_settings = {'budgets': self.budgets, 'max_modifiers': self.max_modifiers, 'seed': self.seed}
+            channels = []
+            for worker in range(workers):
+                owned = [category_name for category_name, owner in owners.items() if owner == worker]
+                # Each worker only indexes its own categories' rows
+                dedup_settings = {**dedup.settings,
+                                  'capacity': math.ceil(dedup.settings['capacity'] * len(owned) / len(categories))}
+                results = context.Queue(maxsize=WORKER_QUEUE_FRAMES)
+                process = context.Process(target=_generation_worker,
+                                          args=(generator_settings, dedup_settings, owned, results),
+                                          name=f"generation-worker-{worker}", daemon=True)
+                process.start()
+                channels.append((results, process))
+            next_message = lambda owner: _next_message(*channels[owner])
+        
+        try:
+            current_stage = None
+            for stage, category_name in self.stage_tasks():
+                if stage != current_stage:
+                    print(f"Generating {stage} examples...")
+                    current_stage = stage
+                owner = owners[category_name]
+                kind, payload = next_message(owner)
+                while kind == "frame":
+                    yield payload
+                    kind, payload = next_message(owner)
+            
+            print("Adding variations and noise...")
+            noise = []
+            for owner in sorted(set(owners.values())):
+                noise.append(next_message(owner)[1])
+                stats, nbytes = next_message(owner)[1]
+                if workers > 1:
+                    dedup.merge_stats(stats, nbytes)
+            noise = pd.concat(noise).sort_index()
+            if len(noise):
+                yield noise
+        finally:
+            if workers > 1:
+                for _, process in channels:
+                    process.kill()
+                    process.join()
+    
+    def generate_all_data(self, target_total: int = 10000, workers: int = 1,
+                          dedup: Optional[StreamingDedupIndex] = None) -> pd.DataFrame:
         """Generate complete training dataset."""
-        print("Generating base examples...")
-        examples = self.generate_base_examples()
-        
-        print("Generating template examples...")
-        examples.extend(self.generate_template_examples())
-        
-        print("Generating contextual examples...")
-        examples.extend(self.generate_contextual_examples())
-        
-        print("Generating multilingual examples...")
-        examples.extend(self.generate_multilingual_examples())
-        
-        print("Generating realistic examples...")
-        examples.extend(self.generate_realistic_examples())
-        
-        print("Adding variations and noise...")
-        examples.extend(self.add_noise_and_variations(examples))
+        # Duplicates are dropped as rows are emitted, so balancing only sees unique rows
+        dedup = dedup or StreamingDedupIndex()
+        examples = [example for frame in self.iter_unique_frames(dedup, workers) for example in _frame_rows(frame)]
+        dedup.print_summary()
         
-        print(f"Generated {len(examples)} examples before balancing")
+        print(f"\nGenerated {len(examples)} unique examples before balancing")
         
         print("Balancing dataset...")
         examples = self.balance_dataset(examples)
@@ -498,51 +612,167 @@ class ActivityDataGenerator:
         # Convert to DataFrame
         df = pd.DataFrame(examples)
         
-        # Remove duplicates
-        df = df.drop_duplicates(subset=['user_input', 'category'])
-        
         print(f"Final dataset: {len(df)} examples")
         print("\nCategory distribution:")
         print(df['category'].value_counts())
         
         return df
+    
+    def generate_sharded_data(self, output_dir: Path, target_total: int = 10000,
+                              shard_size: int = 100_000, shard_format: str = "parquet",
+                              workers: int = 1, dedup: Optional[StreamingDedupIndex] = None) -> Dict:
+        """Stream the generated dataset into fixed-size shards with a manifest.
+        
+        Unlike generate_all_data, memory does not grow with the corpus or with
+        target_total. A first pass counts the unique examples per category.
+        Generation is seeded, so a second pass regenerates the same stream and
+        writes a uniform sample of at most target_total / #categories rows
+        per category straight into the shards. The sample has the stream's
+        source mix, later stages and noise variants included, and keeps
+        generation order.
+        """
+        per_category_cap = math.ceil(target_total / len(self.categories))
+        dedup = dedup or StreamingDedupIndex()
+        
+        print("Counting unique examples per category...")
+        remaining = Counter()
+        for frame in self.iter_unique_frames(dedup, workers):
+            remaining.update(frame["category"].value_counts().to_dict())
+        generated = sum(remaining.values())
+        to_take = {category: min(count, per_category_cap) for category, count in remaining.items()}
+        rngs = {category_name: self.task_rng("balance", category_name) for category_name in self.categories}
+        
+        print("Writing the per-category sample...")
+        writer = ShardWriter(output_dir, shard_size=shard_size, shard_format=shard_format)
+        for frame in self.iter_unique_frames(StreamingDedupIndex(**dedup.settings), workers):
+            keep = np.zeros(len(frame), dtype=bool)
+            for category, rows in frame.groupby("category").indices.items():
+                if len(rows) > remaining[category]:
+                    raise RuntimeError(f"Regenerated stream has more {category} examples than the first pass")
+                # Of the picks still to make among the remaining rows, this frame's share is hypergeometric
+                rng = rngs[category]
+                take = rng.hypergeometric(len(rows), remaining[category] - len(rows), to_take[category])
+                keep[rows[rng.choice(len(rows), size=take, replace=False)]] = True
+                remaining[category] -= len(rows)
+                to_take[category] -= take
+            writer.write_many(_frame_rows(frame[keep]))
+        if any(remaining.values()):
+            raise RuntimeError("Regenerated stream has fewer examples than the first pass")
+        manifest = writer.close(extra={"dedup": dedup.summary()})
+        dedup.print_summary()
+        
+        print(f"\nGenerated {generated} unique examples, kept {manifest['total_rows']} "
+              f"(cap {per_category_cap} per category)")
+        print(f"Wrote {len(manifest['shards'])} {shard_format} shards to {output_dir}")
+        print("\nCategory distribution:")
+        for category, count in manifest["category_counts"].items():
+            print(f"{category:<15} {count}")
+        
+        return manifest
 
 
 def split_data(df: pd.DataFrame, train_ratio: float = 0.7, val_ratio: float = 0.15) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    """Split data into train/validation/test sets stratified by category."""
+    """Split data into train/validation/test sets by hashing normalized user_input.
     
-    train_dfs, val_dfs, test_dfs = [], [], []
+    Each example's split is fixed by its text, so regenerating the corpus never
+    moves an example between splits; categories are stratified in expectation,
+    and any that fall short of their share are reported.
+    """
+    assigner = HashSplitAssigner(train_ratio, val_ratio)
+    split_ids = assigner.assign_series(df['user_input'])
     
-    for category in df['category'].unique():
-        category_df = df[df['category'] == category].copy()
-        category_df = category_df.sample(frac=1, random_state=42).reset_index(drop=True)  # Shuffle
-        
-        n = len(category_df)
-        train_end = int(n * train_ratio)
-        val_end = int(n * (train_ratio + val_ratio))
-        
-        train_dfs.append(category_df[:train_end])
-        val_dfs.append(category_df[train_end:val_end])
-        test_dfs.append(category_df[val_end:])
+    category_splits = defaultdict(Counter)
+    for (category, split_id), count in Counter(zip(df['category'], split_ids)).items():
+        category_splits[category][SPLITS[split_id]] = count
+    print_split_distribution(category_splits, assigner)
     
-    train_df = pd.concat(train_dfs, ignore_index=True).sample(frac=1, random_state=42)
-    val_df = pd.concat(val_dfs, ignore_index=True).sample(frac=1, random_state=42)
-    test_df = pd.concat(test_dfs, ignore_index=True).sample(frac=1, random_state=42)
+    train_df, val_df, test_df = (
+        df[split_ids == split_id].sample(frac=1, random_state=42)  # Shuffle
+        for split_id in range(len(SPLITS))
+    )
     
     return train_df, val_df, test_df
 
 
+def save_category_mapping(generator: ActivityDataGenerator, output_dir: Path):
+    """Save the category → icon mapping used by the Android assets."""
+    category_mapping = {
+        category: data.icon_res 
+        for category, data in generator.categories.items()
+    }
+    
+    with open(output_dir / "category_mapping.json", "w") as f:
+        json.dump(category_mapping, f, indent=2)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Generate TinyBERT activity training data")
+    parser.add_argument("--output-dir", default="../data", help="Directory for generated datasets")
+    parser.add_argument("--target-total", type=int, default=10000,
+                        help="Approximate number of examples to generate")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream examples into sharded files instead of in-memory CSVs")
+    parser.add_argument("--shard-size", type=int, default=100_000, help="Rows per shard in streaming mode")
+    parser.add_argument("--shard-format", choices=sorted(SHARD_SUFFIXES), default="parquet",
+                        help="Shard file format in streaming mode")
+    parser.add_argument("--budgets", help="JSON file with per-category template expansion budgets")
+    parser.add_argument("--max-modifiers", type=int, default=2,
+                        help="Maximum number of modifiers combined in one contextual example")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes used for generation; output does not depend on this")
+    parser.add_argument("--seed", type=int, default=42, help="Root random seed")
+    parser.add_argument("--dedup-capacity", type=int, default=5_000_000,
+                        help="Expected number of unique rows; sizes the dedup index")
+    parser.add_argument("--no-near-dedup", action="store_true",
+                        help="Only drop exact and normalized-text duplicates")
+    parser.add_argument("--near-dedup-window", type=int, default=10_000,
+                        help="Recent kept rows per category checked for near-duplicates; bounds that index")
+    parser.add_argument("--split-shards", metavar="SHARD_DIR",
+                        help="Only split an existing sharded dataset into train/validation/test shards")
+    return parser.parse_args()
+
+
 def main():
     """Main data preparation pipeline."""
+    args = parse_args()
     print("Starting data preparation pipeline...")
     
     # Create output directory
-    output_dir = Path("../data")
+    output_dir = Path(args.output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
+    if args.split_shards:
+        split_shards(args.split_shards, output_dir / "splits", HashSplitAssigner(), shard_size=args.shard_size)
+        print("\nData preparation completed!")
+        return
+    
+    budgets = None
+    if args.budgets:
+        with open(args.budgets, "r") as f:
+            budgets = ExpansionBudgets.from_dict(json.load(f))
+    
+    generator = ActivityDataGenerator(budgets=budgets, max_modifiers=args.max_modifiers, seed=args.seed)
+    
+    dedup = StreamingDedupIndex(capacity=args.dedup_capacity, near_duplicates=not args.no_near_dedup,
+                                near_window=args.near_dedup_window)
+    
+    if args.stream:
+        generator.generate_sharded_data(
+            output_dir / "shards",
+            target_total=args.target_total,
+            shard_size=args.shard_size,
+            shard_format=args.shard_format,
+            workers=args.workers,
+            dedup=dedup
+        )
+        split_shards(output_dir / "shards", output_dir / "splits", HashSplitAssigner(), shard_size=args.shard_size)
+        save_category_mapping(generator, output_dir)
+        print("\nData preparation completed!")
+        return
+    
     # Generate data
-    generator = ActivityDataGenerator()
-    df = generator.generate_all_data()
+    df = generator.generate_all_data(target_total=args.target_total, workers=args.workers, dedup=dedup)
     
     # Split data
     train_df, val_df, test_df = split_data(df)
@@ -558,18 +788,10 @@ def main():
     print(f"Test: {len(test_df)} examples")
     
     # Save category mapping
-    category_mapping = {
-        category: data.icon_res 
-        for category, data in generator.categories.items()
-    }
-    
-    with open(output_dir / "category_mapping.json", "w") as f:
-        json.dump(category_mapping, f, indent=2)
+    save_category_mapping(generator, output_dir)
     
     print("\nData preparation completed!")
 
 
 if __name__ == "__main__":
-    random.seed(42)
-    np.random.seed(42)
-    main()
\ No newline at end of file
+    main()
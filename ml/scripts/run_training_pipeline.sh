@@ -54,11 +54,30 @@ fi
 
 echo "✓ Model training completed"
 
+# Optional: structured pruning under an accuracy budget (PRUNE_MAX_ACCURACY_DROP=0.01)
+EXPORT_MODEL_DIR="$MODELS_DIR/fine_tuned"
+if [ -n "$PRUNE_MAX_ACCURACY_DROP" ]; then
+    echo ""
+    echo "Pruning attention heads and FFN neurons..."
+    python prune_model.py --max-accuracy-drop "$PRUNE_MAX_ACCURACY_DROP"
+    EXPORT_MODEL_DIR="$MODELS_DIR/pruned"
+    echo "✓ Pruning completed (see $EXPORT_MODEL_DIR/pruning_report.json)"
+fi
+
+# Optional: drop vocabulary tokens the corpora never use (PRUNE_VOCAB=1)
+if [ -n "$PRUNE_VOCAB" ]; then
+    echo ""
+    echo "Pruning the vocabulary to the corpus tokens..."
+    python prune_vocab.py --model-dir "$EXPORT_MODEL_DIR" --output-dir "$MODELS_DIR/vocab_pruned"
+    EXPORT_MODEL_DIR="$MODELS_DIR/vocab_pruned"
+    echo "✓ Vocabulary pruning completed (see $EXPORT_MODEL_DIR/vocab_pruning_report.json)"
+fi
+
 # Step 3: Convert and optimize for mobile
 echo ""
 echo "Step 3: Converting model for mobile deployment..."
 cd "$SCRIPTS_DIR"
-python convert_to_mobile.py "$TRAINING_DIR/config.yaml" "$MODELS_DIR/fine_tuned"
+python convert_to_mobile.py "$TRAINING_DIR/config.yaml" "$EXPORT_MODEL_DIR"
 
 if [ ! -f "$MODELS_DIR/mobile/activity_classifier.tflite" ]; then
     echo "ERROR: Mobile model conversion failed"
@@ -76,10 +95,15 @@ if [ -f "$MODELS_DIR/mobile/benchmark_results.json" ]; then
 import json
 with open('$MODELS_DIR/mobile/benchmark_results.json') as f:
     results = json.load(f)
-    for model, metrics in results.items():
+    for model, metrics in results['backends'].items():
         print(f'  {model}:')
-        print(f'    Latency: {metrics.get(\"mean_latency_ms\", 0):.1f}ms')
+        print(f'    Latency: {metrics.get(\"mean_latency_ms\", 0):.1f}ms (p95 {metrics.get(\"p95_latency_ms\", 0):.1f}ms)')
         print(f'    Size: {metrics.get(\"model_size_mb\", 0):.1f}MB')
+        if 'accuracy' in metrics:
+            print(f'    Accuracy: {metrics[\"accuracy\"]:.3f}')
+        if metrics['throughput_curve']:
+            batch_size, throughput = max(metrics['throughput_curve'], key=lambda point: point[1])
+            print(f'    Peak throughput: {throughput:.0f}/s at batch size {batch_size}')
 "
 else
     echo "⚠ Benchmark results not available"
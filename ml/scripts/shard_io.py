@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Sharded Parquet/Arrow storage for generated activity examples.
+Rows are buffered into fixed-size shards and described by a JSON manifest,
+so corpora of any size can be written and read back one shard at a time.
+"""
+
+import json
+from pathlib import Path
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+MANIFEST_NAME = "manifest.json"
+
+# Column order matches the CSVs written by prepare_data.py
+ROW_SCHEMA = pa.schema([
+    ("user_input", pa.string()),
+    ("icon_label", pa.string()),
+    ("category", pa.string()),
+    ("confidence_score", pa.float64()),
+    ("source", pa.string()),
+])
+
+SHARD_SUFFIXES = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+class ShardWriter:
+    """Writes example rows into fixed-size shards plus a manifest."""
+
+    def __init__(self, output_dir: Union[str, Path], shard_size: int = 100_000,
+                 shard_format: str = "parquet", prefix: str = "part"):
+        if shard_format not in SHARD_SUFFIXES:
+            raise ValueError(f"Unsupported shard format: {shard_format}")
+        if shard_size <= 0:
+            raise ValueError("shard_size must be positive")
+
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.shard_format = shard_format
+        self.prefix = prefix
+
+        self._buffer: Dict[str, List] = {name: [] for name in ROW_SCHEMA.names}
+        self._buffered = 0
+        self._shards: List[Dict] = []
+        self._category_counts: Counter = Counter()
+        self._source_counts: Counter = Counter()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    @property
+    def total_rows(self) -> int:
+        return sum(shard["num_rows"] for shard in self._shards) + self._buffered
+
+    def write(self, row: Dict):
+        """Append a single row, flushing a shard when the buffer is full."""
+        for name in ROW_SCHEMA.names:
+            self._buffer[name].append(row[name])
+        self._buffered += 1
+        self._category_counts[row["category"]] += 1
+        self._source_counts[row["source"]] += 1
+
+        if self._buffered >= self.shard_size:
+            self._flush()
+
+    def write_many(self, rows: Iterable[Dict]):
+        """Append every row from an iterable."""
+        for row in rows:
+            self.write(row)
+
+    def _flush(self):
+        """Write the buffered rows as one shard."""
+        if self._buffered == 0:
+            return
+
+        table = pa.Table.from_pydict(self._buffer, schema=ROW_SCHEMA)
+        shard_name = f"{self.prefix}-{len(self._shards):05d}{SHARD_SUFFIXES[self.shard_format]}"
+        shard_path = self.output_dir / shard_name
+
+        if self.shard_format == "parquet":
+            pq.write_table(table, shard_path)
+        else:
+            feather.write_feather(table, shard_path, compression="uncompressed")
+
+        self._shards.append({"path": shard_name, "num_rows": table.num_rows})
+        self._buffer = {name: [] for name in ROW_SCHEMA.names}
+        self._buffered = 0
+
+    def close(self, extra: Optional[Dict] = None) -> Dict:
+        """Flush remaining rows and write the manifest, with optional extra fields."""
+        if self._closed:
+            return load_manifest(self.output_dir)
+
+        self._flush()
+        manifest = {
+            "format": self.shard_format,
+            "shard_size": self.shard_size,
+            "total_rows": sum(shard["num_rows"] for shard in self._shards),
+            "columns": ROW_SCHEMA.names,
+            "shards": self._shards,
+            "category_counts": dict(sorted(self._category_counts.items())),
+            "source_counts": dict(sorted(self._source_counts.items())),
+        }
+        manifest.update(extra or {})
+        with open(self.output_dir / MANIFEST_NAME, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        self._closed = True
+        return manifest
+
+
+def load_manifest(path: Union[str, Path]) -> Dict:
+    """Load a shard manifest from a directory or a manifest file path."""
+    path = Path(path)
+    if path.is_dir():
+        path = path / MANIFEST_NAME
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    manifest["root"] = str(path.parent)
+    return manifest
+
+
+def iter_shard_frames(path: Union[str, Path], columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """Yield each shard of a sharded dataset as a DataFrame, one at a time."""
+    manifest = load_manifest(path)
+    root = Path(manifest["root"])
+
+    for shard in manifest["shards"]:
+        shard_path = root / shard["path"]
+        if manifest["format"] == "parquet":
+            table = pq.read_table(shard_path, columns=columns)
+        else:
+            table = feather.read_table(shard_path, columns=columns, memory_map=True)
+        yield table.to_pandas()
+
+
+def iter_shard_rows(path: Union[str, Path]) -> Iterator[Dict]:
+    """Yield every row of a sharded dataset as a dict."""
+    for frame in iter_shard_frames(path):
+        yield from frame.to_dict("records")
@@ -8,6 +8,17 @@ import json
 import shutil
 from pathlib import Path
 
+# Used only when neither the model nor the data has a sequence_length.json
+DEFAULT_MAX_LENGTH = 128
+
+def load_max_length(project_root: Path, model_dir: Path) -> int:
+    """Sequence length the model was trained with, as recorded by training/sequence_length.py."""
+    for path in (model_dir / "sequence_length.json", project_root / "data" / "sequence_length.json"):
+        if path.exists():
+            with open(path, 'r') as f:
+                return int(json.load(f)["max_length"])
+    return DEFAULT_MAX_LENGTH
+
 def create_android_assets():
     """Create Android-ready assets from trained model."""
     print("Creating Android assets for TinyBERT integration...")
@@ -27,6 +38,9 @@ def create_android_assets():
     print(f"Model directory: {model_dir}")
     print(f"Android assets directory: {android_dir}")
     
+    max_length = load_max_length(project_root, model_dir)
+    print(f"Sequence length: {max_length}")
+    
     # Copy label encoder if it exists
     label_encoder_src = model_dir / "label_encoder.json"
     if label_encoder_src.exists():
@@ -46,7 +60,7 @@ def create_android_assets():
     # Create simplified tokenizer config
     tokenizer_config = {
         "vocab_size": 30522,  # Standard BERT vocab size
-        "max_length": 128,
+        "max_length": max_length,
         "pad_token": "[PAD]",
         "pad_token_id": 0,
         "unk_token": "[UNK]",
@@ -98,7 +112,7 @@ def create_android_assets():
     placeholder_model_info = {
         "note": "This is a placeholder. In production, this would be the actual TensorFlow Lite model file.",
         "model_size_mb": "~30-50MB",
-        "input_shape": [1, 128],
+        "input_shape": [1, max_length],
         "output_shape": [1, 9],
         "quantized": True
     }
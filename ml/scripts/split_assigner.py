@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Deterministic train/validation/test assignment by hashing example text.
+An example's split depends only on its normalized user_input, so it never
+moves between splits when the corpus is regenerated, and sharded corpora can
+be split in one streaming pass. Per-category stratification is checked, not
+enforced: categories whose splits fall short of their share are reported.
+"""
+
+import hashlib
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Union
+
+import numpy as np
+import pandas as pd
+
+from dedup_index import normalize_text
+from shard_io import ShardWriter, iter_shard_frames, load_manifest
+
+SPLITS = ["train", "validation", "test"]
+
+
+class HashSplitAssigner:
+    """Maps normalized text to a split through a uniform hash bucket.
+
+    Assignment ignores the label, so the same text can never land in two
+    splits even if it appears under different categories. Each category is
+    still stratified in expectation, since buckets are uniform within it;
+    `shortfalls` reports where a category's actual split falls short.
+    """
+
+    def __init__(self, train_ratio: float = 0.7, val_ratio: float = 0.15, salt: str = "split-v1",
+                 min_per_split: int = 1, tolerance: float = 0.5):
+        if train_ratio <= 0 or val_ratio < 0 or train_ratio + val_ratio > 1:
+            raise ValueError("Ratios must satisfy 0 < train_ratio and train_ratio + val_ratio <= 1")
+        self.boundaries = np.array([train_ratio, train_ratio + val_ratio])
+        self.shares = np.diff(np.concatenate([[0], self.boundaries, [1]]))
+        # Changing the salt reshuffles every example, so only do it deliberately
+        self.salt = salt.encode("utf-8")
+        self.min_per_split = min_per_split
+        self.tolerance = tolerance
+
+    def bucket(self, text: str) -> float:
+        """Uniform value in [0, 1) derived from the normalized text."""
+        digest = hashlib.blake2b(normalize_text(str(text)).encode("utf-8"), digest_size=8, key=self.salt).digest()
+        return int.from_bytes(digest, "little") / 2**64
+
+    def assign(self, text: str) -> str:
+        return SPLITS[int(np.searchsorted(self.boundaries, self.bucket(text), side="right"))]
+
+    def assign_series(self, texts: pd.Series) -> np.ndarray:
+        """Split index (0=train, 1=validation, 2=test) for every text."""
+        buckets = np.fromiter((self.bucket(text) for text in texts), dtype=np.float64, count=len(texts))
+        return np.searchsorted(self.boundaries, buckets, side="right")
+
+    def shortfalls(self, category_splits: Dict[str, Counter]) -> Dict[str, Dict[str, int]]:
+        """Per category, the rows each split is missing against its share.
+
+        A split is reported when it holds fewer than min_per_split rows, or
+        fewer than (1 - tolerance) of its expected share. Splits with a zero
+        share are meant to be empty and never reported.
+        """
+        short = {}
+        for category, counts in sorted(category_splits.items()):
+            total = sum(counts[split] for split in SPLITS)
+            missing = {}
+            for split, share in zip(SPLITS, self.shares):
+                expected = share * total
+                if share > 0 and (counts[split] < self.min_per_split
+                                  or counts[split] < (1 - self.tolerance) * expected):
+                    missing[split] = max(self.min_per_split, round(expected)) - counts[split]
+            if missing:
+                short[category] = missing
+        return short
+
+
+def print_split_distribution(category_splits: Dict[str, Counter], assigner: HashSplitAssigner):
+    print("\nSplit distribution by category:")
+    print(f"{'category':<15} " + " ".join(f"{split:>10}" for split in SPLITS))
+    for category, counts in sorted(category_splits.items()):
+        print(f"{category:<15} " + " ".join(f"{counts[split]:>10}" for split in SPLITS))
+
+    short = assigner.shortfalls(category_splits)
+    if short:
+        print("\nWARNING: categories short of their split share (rows missing):")
+        for category, missing in short.items():
+            print(f"  {category}: " + ", ".join(f"{split} {count}" for split, count in missing.items()))
+
+
+def split_shards(input_path: Union[str, Path], output_dir: Union[str, Path],
+                 assigner: HashSplitAssigner, shard_size: int = 100_000,
+                 text_column: str = "user_input") -> Dict[str, Dict]:
+    """Split a sharded dataset into per-split shard sets, one input shard at a time."""
+    output_dir = Path(output_dir)
+    shard_format = load_manifest(input_path)["format"]
+    writers = {
+        split: ShardWriter(output_dir / split, shard_size=shard_size, shard_format=shard_format)
+        for split in SPLITS
+    }
+    category_splits = defaultdict(Counter)
+
+    for frame in iter_shard_frames(input_path):
+        split_ids = assigner.assign_series(frame[text_column])
+        for split_id, split in enumerate(SPLITS):
+            part = frame[split_ids == split_id]
+            writers[split].write_many(part.to_dict("records"))
+            for category, count in part["category"].value_counts().items():
+                category_splits[category][split] += count
+
+    manifests = {split: writer.close() for split, writer in writers.items()}
+    print_split_distribution(category_splits, assigner)
+    return manifests
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Dependency-aware stage executor.
+A pipeline is a set of named stages, each listing the stages it runs after
+and the branch it belongs to. A branch runs its stages in order in one
+spawned process, as soon as every stage it depends on in other branches is
+done, so independent branches run side by side. Each stage writes a
+manifest of its artifacts (path, size, sha256), and later stages, in any
+process, take their inputs from those manifests.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIR = "manifests"
+PIPELINE_MANIFEST = "pipeline.json"
+
+
+def _file_digest(path: Path, hasher):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+
+
+def artifact_info(path: Union[str, Path]) -> Dict:
+    """Path, size and sha256 of a file, or of every file under a directory."""
+    path = Path(path)
+    files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+    hasher = hashlib.sha256()
+    for file in files:
+        if path.is_dir():
+            hasher.update(str(file.relative_to(path)).encode('utf-8'))
+        _file_digest(file, hasher)
+    return {
+        'path': str(path),
+        'size_bytes': sum(file.stat().st_size for file in files),
+        'sha256': hasher.hexdigest(),
+    }
+
+
+def write_manifest(manifest_dir: Path, stage: str, manifest: Dict):
+    manifest_dir.mkdir(parents=True, exist_ok=True)
+    with open(manifest_dir / f"{stage}.json", 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(manifest_dir: Path, stage: str) -> Dict:
+    with open(manifest_dir / f"{stage}.json", 'r') as f:
+        return json.load(f)
+
+
+def run_branch(run_stage: Callable[[str, Dict[str, Dict[str, str]]], Dict[str, str]], stages: Dict[str, Dict],
+               manifest_dir: Union[str, Path], names: List[str]):
+    """Run stages in this process, in order.
+
+    `run_stage(name, inputs)` gets the artifact paths of every stage `name`
+    runs after (read from their manifests) and returns its own artifacts
+    as {key: path}.
+    """
+    manifest_dir = Path(manifest_dir)
+    for name in names:
+        after = stages[name]['after']
+        inputs = {dependency: {key: artifact['path']
+                               for key, artifact in read_manifest(manifest_dir, dependency)['artifacts'].items()}
+                  for dependency in after}
+        logger.info(f"Stage {name} starting (pid {os.getpid()})")
+        started = time.time()
+        start = time.perf_counter()
+        artifacts = run_stage(name, inputs)
+        write_manifest(manifest_dir, name, {
+            'stage': name,
+            'branch': stages[name]['branch'],
+            'pid': os.getpid(),
+            'after': after,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+            'duration_s': time.perf_counter() - start,
+            'artifacts': {key: artifact_info(path) for key, path in artifacts.items()},
+        })
+        logger.info(f"Stage {name} finished in {time.perf_counter() - start:.1f}s")
+
+
+class StageGraph:
+    """Runs the branches of a stage pipeline, each in its own process where allowed."""
+
+    def __init__(self, stages: Dict[str, Dict], manifest_dir: Union[str, Path]):
+        self.stages = stages
+        self.manifest_dir = Path(manifest_dir)
+        self.branches = self._branches()
+
+    def _branches(self) -> Dict[str, List[str]]:
+        """Stages per branch in dependency order; rejects unknown dependencies and cycles."""
+        ordered, visiting = [], set()
+
+        def visit(name: str):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage dependency cycle through {name}")
+            visiting.add(name)
+            for dependency in self.stages[name]['after']:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage {name} runs after unknown stage {dependency}")
+                visit(dependency)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in self.stages:
+            visit(name)
+        branches = {}
+        for name in ordered:
+            branches.setdefault(self.stages[name]['branch'], []).append(name)
+        return branches
+
+    def _needs(self, branch: str) -> set:
+        """Other branches this branch waits for."""
+        return {self.stages[dependency]['branch']
+                for name in self.branches[branch] for dependency in self.stages[name]['after']} - {branch}
+
+    def run(self, process_runner: Callable[[List[str]], None], local_runner: Callable[[List[str]], None],
+            local_branches: Iterable[str] = (), parallel: bool = True) -> Dict:
+        """Run every branch; returns the pipeline manifest.
+
+        `process_runner(names)` runs a branch in a spawned process, so it must
+        be picklable (a module-level function or a partial of one).
+        `local_runner(names)` runs a branch in this process: the branches in
+        `local_branches`, or every branch when `parallel` is False.
+        Branches depending on a failed branch are skipped; RuntimeError is
+        raised at the end if anything failed.
+        """
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        for name in self.stages:
+            (self.manifest_dir / f"{name}.json").unlink(missing_ok=True)
+
+        context = multiprocessing.get_context('spawn')
+        local_branches = set(local_branches)
+        pending = list(self.branches)
+        running, finished, failed, skipped = {}, set(), set(), set()
+        start = time.perf_counter()
+
+        while pending or running:
+            waiting = len(pending)
+            ready = []
+            for branch in list(pending):
+                needs = self._needs(branch)
+                if needs & (failed | skipped):
+                    logger.error(f"Skipping branch {branch}: it depends on a failed branch")
+                    pending.remove(branch)
+                    skipped.add(branch)
+                elif needs <= finished:
+                    pending.remove(branch)
+                    ready.append(branch)
+
+            # Start the process branches first: a local branch blocks until it is done
+            local = [branch for branch in ready if not parallel or branch in local_branches]
+            for branch in ready:
+                if branch not in local:
+                    process = context.Process(target=process_runner, args=(self.branches[branch],),
+                                              name=f"stage-{branch}")
+                    process.start()
+                    running[branch] = process
+            for branch in local:
+                try:
+                    local_runner(self.branches[branch])
+                    finished.add(branch)
+                except Exception:
+                    logger.exception(f"Branch {branch} failed")
+                    failed.add(branch)
+            if not running:
+                if pending and len(pending) == waiting:
+                    raise ValueError(f"Branches {pending} wait on each other; split them differently")
+                continue
+
+            wait([process.sentinel for process in running.values()])
+            for branch, process in list(running.items()):
+                if process.is_alive():
+                    continue
+                process.join()
+                del running[branch]
+                if process.exitcode == 0:
+                    finished.add(branch)
+                else:
+                    logger.error(f"Branch {branch} failed (exit code {process.exitcode})")
+                    failed.add(branch)
+
+        manifests = {name: self._manifest(name) for name in self.stages}
+        pipeline = {
+            'parallel': parallel,
+            'wall_time_s': time.perf_counter() - start,
+            'stage_time_s': sum(manifest['duration_s'] for manifest in manifests.values() if manifest),
+            'branches': self.branches,
+            'failed': sorted(failed),
+            'skipped': sorted(skipped),
+            'stages': manifests,
+        }
+        with open(self.manifest_dir / PIPELINE_MANIFEST, 'w') as f:
+            json.dump(pipeline, f, indent=2)
+        if failed or skipped:
+            raise RuntimeError(f"Pipeline branches failed: {sorted(failed)}; skipped: {sorted(skipped)}")
+        return pipeline
+
+    def _manifest(self, name: str) -> Optional[Dict]:
+        path = self.manifest_dir / f"{name}.json"
+        return read_manifest(self.manifest_dir, name) if path.exists() else None
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Vectorized combinatorial expansion of activity templates.
+Treats keywords × templates × modifiers as a mixed-radix index space, samples
+indices from it under per-category budgets, and builds the text columns with
+NumPy array operations instead of nested Python loops.
+"""
+
+import string
+from itertools import combinations
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Values substituted for the {duration} placeholder in category templates
+DURATION_VALUES = ["15", "30", "45", "60"]
+
+# Modifier lists from ActivityDataGenerator._load_templates, in the order they
+# appear in a contextual example, and whether they go before the keyword
+CONTEXT_DIMENSIONS = [
+    ("time_prefixes", True),
+    ("duration_modifiers", True),
+    ("intensity_modifiers", True),
+    ("location_modifiers", False),
+    ("social_modifiers", False),
+]
+
+# Default number of rows drawn per category and stage; None means the full space.
+# These match the per-category counts of the original loops (10 keywords per
+# template, 8 keywords × 8 modifiers), so the default corpus keeps its source mix;
+# larger budgets are opt-in through --budgets
+DEFAULT_BUDGETS = {
+    "template": 100,
+    "contextual": 64,
+}
+
+
+@dataclass
+class ExpansionBudgets:
+    """Per-stage row budgets with optional per-category overrides."""
+    defaults: Dict[str, Optional[int]] = field(default_factory=lambda: dict(DEFAULT_BUDGETS))
+    per_category: Dict[str, Dict[str, Optional[int]]] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ExpansionBudgets":
+        """Build budgets from {"default": {...}, "<category>": {...}} mappings."""
+        defaults = dict(DEFAULT_BUDGETS)
+        defaults.update(data.get("default", {}))
+        per_category = {name: dict(stages) for name, stages in data.items() if name != "default"}
+        return cls(defaults=defaults, per_category=per_category)
+
+    def get(self, category: str, stage: str) -> Optional[int]:
+        overrides = self.per_category.get(category, {})
+        if stage in overrides:
+            return overrides[stage]
+        return self.defaults.get(stage)
+
+
+def _template_parts(template: str) -> Tuple[List[str], List[Optional[str]]]:
+    """Split a template into literal text and placeholder names."""
+    literals, fields = [], []
+    for literal, field_name, _, _ in string.Formatter().parse(template):
+        literals.append(literal)
+        fields.append(field_name)
+    return literals, fields
+
+
+class TemplateExpansionEngine:
+    """Expands keyword, template and modifier combinations into example rows."""
+
+    def __init__(self, modifiers: Dict[str, List[str]], budgets: Optional[ExpansionBudgets] = None,
+                 max_modifiers: int = 2, chunk_rows: int = 50_000):
+        if not 1 <= max_modifiers <= len(CONTEXT_DIMENSIONS):
+            raise ValueError(f"max_modifiers must be between 1 and {len(CONTEXT_DIMENSIONS)}")
+        self.modifiers = modifiers
+        self.budgets = budgets or ExpansionBudgets()
+        # Combining every modifier list at once gives long, unrealistic phrases,
+        # so by default contextual examples use at most two of them
+        self.max_modifiers = max_modifiers
+        self.chunk_rows = chunk_rows
+
+    @staticmethod
+    def _sample_indices(space_size: int, budget: Optional[int], rng: np.random.Generator) -> np.ndarray:
+        """Pick row indices from the space, sorted so output order is stable."""
+        if budget is None or budget >= space_size:
+            return np.arange(space_size, dtype=np.int64)
+        return np.sort(rng.choice(space_size, size=budget, replace=False))
+
+    def _chunks(self, indices: np.ndarray) -> Iterator[np.ndarray]:
+        for start in range(0, len(indices), self.chunk_rows):
+            yield indices[start:start + self.chunk_rows]
+
+    @staticmethod
+    def _frame(texts: np.ndarray, icon_res: str, category: str, confidence: float, source: str) -> pd.DataFrame:
+        n = len(texts)
+        # Constant columns as single-category Categoricals avoid materialising n strings
+        constant = lambda value: pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), [value])
+        return pd.DataFrame({
+            "user_input": pd.Series(texts, dtype=object),
+            "icon_label": constant(icon_res),
+            "category": constant(category),
+            "confidence_score": np.full(n, confidence),
+            "source": constant(source),
+        })
+
+    def _template_space(self, templates: Sequence[str], keywords: Sequence[str]):
+        """Return per-template (literals, fields, #duration values) and row offsets."""
+        layouts, offsets = [], [0]
+        for template in templates:
+            literals, fields = _template_parts(template)
+            n_durations = len(DURATION_VALUES) if "duration" in fields else 1
+            layouts.append((literals, fields, n_durations))
+            offsets.append(offsets[-1] + n_durations * len(keywords))
+        return layouts, np.array(offsets, dtype=np.int64)
+
+    @staticmethod
+    def _render_template(literals: List[str], fields: List[Optional[str]], template: str,
+                         keywords: np.ndarray, durations: np.ndarray) -> np.ndarray:
+        """Render one template for arrays of keywords and durations."""
+        known = {"activity", "duration", None}
+        if any(name not in known for name in fields):
+            # Templates with unknown placeholders keep the original fallback
+            fallback = template
+            for name in ("{activity}", "{duration}"):
+                fallback = fallback.replace(name, "")
+            return keywords + f" {fallback}"
+        texts = np.full(len(keywords), "", dtype=object)
+        for literal, name in zip(literals, fields):
+            if literal:
+                texts = texts + literal
+            if name == "activity":
+                texts = texts + keywords
+            elif name == "duration":
+                texts = texts + durations
+        if "activity" not in fields:
+            texts = texts + " " + keywords
+        return texts
+
+    def expand_templates(self, category, rng: np.random.Generator) -> Iterator[pd.DataFrame]:
+        """Yield template examples covering keywords × templates × durations."""
+        keywords = np.array(category.keywords, dtype=object)
+        durations = np.array(DURATION_VALUES, dtype=object)
+        layouts, offsets = self._template_space(category.templates, category.keywords)
+
+        budget = self.budgets.get(category.name, "template")
+        indices = self._sample_indices(int(offsets[-1]), budget, rng)
+
+        for chunk in self._chunks(indices):
+            template_ids = np.searchsorted(offsets, chunk, side="right") - 1
+            texts = np.empty(len(chunk), dtype=object)
+            for template_id in np.unique(template_ids):
+                mask = template_ids == template_id
+                local = chunk[mask] - offsets[template_id]
+                literals, fields, _ = layouts[template_id]
+                duration_ids, keyword_ids = np.divmod(local, len(keywords))
+                texts[mask] = self._render_template(
+                    literals, fields, category.templates[template_id],
+                    keywords[keyword_ids], durations[duration_ids % len(durations)]
+                )
+            yield self._frame(texts, category.icon_res, category.name, 0.8, "template_generated")
+
+    def _context_blocks(self, n_keywords: int):
+        """Return the modifier slot combinations in use and their row offsets.
+
+        Each block is one choice of slots; its rows are (modifier combo, keyword)
+        pairs with the keyword varying fastest.
+        """
+        blocks, offsets = [], [0]
+        for n_modifiers in range(1, self.max_modifiers + 1):
+            for slot_ids in combinations(range(len(CONTEXT_DIMENSIONS)), n_modifiers):
+                radices = [len(self.modifiers[CONTEXT_DIMENSIONS[i][0]]) for i in slot_ids]
+                blocks.append((slot_ids, radices))
+                offsets.append(offsets[-1] + int(np.prod(radices, dtype=np.int64)) * n_keywords)
+        return blocks, np.array(offsets, dtype=np.int64)
+
+    def _combo_affixes(self, slot_ids: Tuple[int, ...], radices: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Render prefix and suffix strings for every modifier combo of a block."""
+        n_combos = int(np.prod(radices, dtype=np.int64))
+        prefix = np.full(n_combos, "", dtype=object)
+        suffix = np.full(n_combos, "", dtype=object)
+        # Mixed-radix decode of the combo index, first slot most significant
+        stride = n_combos
+        for slot_id, radix in zip(slot_ids, radices):
+            stride //= radix
+            name, is_prefix = CONTEXT_DIMENSIONS[slot_id]
+            if is_prefix:
+                values = np.array([f"{value} " for value in self.modifiers[name]], dtype=object)
+                prefix = prefix + values[(np.arange(n_combos) // stride) % radix]
+            else:
+                values = np.array([f" {value}" for value in self.modifiers[name]], dtype=object)
+                suffix = suffix + values[(np.arange(n_combos) // stride) % radix]
+        return prefix, suffix
+
+    def expand_contextual(self, category, rng: np.random.Generator) -> Iterator[pd.DataFrame]:
+        """Yield contextual examples covering keywords × modifier lists.
+
+        The space is every combination of 1..max_modifiers modifier slots,
+        each filled from its list in _load_templates, around every keyword.
+        """
+        keywords = np.array(category.keywords, dtype=object)
+        blocks, offsets = self._context_blocks(len(keywords))
+        affixes = {}
+
+        budget = self.budgets.get(category.name, "contextual")
+        indices = self._sample_indices(int(offsets[-1]), budget, rng)
+
+        for chunk in self._chunks(indices):
+            block_ids = np.searchsorted(offsets, chunk, side="right") - 1
+            texts = np.empty(len(chunk), dtype=object)
+            for block_id in np.unique(block_ids):
+                mask = block_ids == block_id
+                if block_id not in affixes:
+                    affixes[block_id] = self._combo_affixes(*blocks[block_id])
+                prefix, suffix = affixes[block_id]
+                combo_ids, keyword_ids = np.divmod(chunk[mask] - offsets[block_id], len(keywords))
+                texts[mask] = prefix[combo_ids] + keywords[keyword_ids] + suffix[combo_ids]
+            yield self._frame(texts, category.icon_res, category.name, 0.7, "contextual")
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Thread-scaling and core-affinity sweep for the exported models.
+Measures every backend with each intra-op/inter-op (TFLite: num_threads)
+setting in a fresh process, optionally pinned to specific cores, for
+single-example latency and bulk throughput. Reports the best thread count
+for each use per backend.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+import yaml
+
+from benchmark_engine import (BenchmarkEngine, OnnxBackend, PyTorchBackend, TFLiteBackend, benchmark_settings,
+                              host_info)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "training"))
+from cpu_profile import available_cores
+from sequence_length import resolve_max_length
+
+logger = logging.getLogger(__name__)
+
+BACKEND_FILES = {
+    'onnx': "model.onnx",
+    'onnx_quantized': "model_quantized.onnx",
+    'tflite': "model_quantized.tflite",
+}
+
+# Defaults for the optional `thread_sweep` section of config.yaml
+DEFAULT_SETTINGS = {
+    'threads': [],  # Intra-op / TFLite thread counts; empty = powers of two up to the available cores
+    'inter_op_threads': [1, 2],
+    'cores': "",  # e.g. "0-3"; each setting is pinned to the first N of these cores
+    'bulk_batch_size': 64,
+    'seconds_per_setting': 2.0,
+}
+
+
+def sweep_settings(config: Dict) -> Dict:
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get('thread_sweep') or {})
+    return settings
+
+
+def parse_cores(spec: str) -> List[int]:
+    """'0-3,6' -> [0, 1, 2, 3, 6]."""
+    cores = []
+    for part in filter(None, str(spec).replace(" ", "").split(",")):
+        low, _, high = part.partition("-")
+        cores.extend(range(int(low), int(high or low) + 1))
+    return cores
+
+
+def default_threads(cores: int) -> List[int]:
+    threads, count = [], 1
+    while count < cores:
+        threads.append(count)
+        count *= 2
+    return threads + [cores]
+
+
+def backend_settings(backend: str, threads: List[int], inter_op: List[int], cores: List[int]) -> List[Dict]:
+    """Every thread setting to measure for a backend, with the cores it is pinned to (if any)."""
+    if backend == 'tflite':
+        combinations = [(count, None) for count in threads]
+    else:
+        combinations = list(itertools.product(threads, inter_op))
+    settings = []
+    for intra, inter in combinations:
+        setting = {'backend': backend, 'threads': intra, 'inter_op_threads': inter}
+        if cores:
+            if intra > len(cores):
+                continue
+            setting['cores'] = cores[:intra]
+        settings.append(setting)
+    return settings
+
+
+def run_setting(config: Dict, model_path: str, export_dir: str, setting: Dict, settings: Dict) -> Dict:
+    """Measure one backend with one thread setting in this (fresh) process."""
+    if setting.get('cores'):
+        os.sched_setaffinity(0, setting['cores'])
+
+    from transformers import AutoTokenizer
+
+    backend_name = setting['backend']
+    if backend_name == 'pytorch':
+        import torch
+        from transformers import AutoModelForSequenceClassification
+        # Thread pools are fixed before the model does any work
+        torch.set_num_threads(setting['threads'])
+        torch.set_num_interop_threads(setting['inter_op_threads'])
+        model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        backend = PyTorchBackend(model, 0.0, None)
+    elif backend_name == 'tflite':
+        backend = TFLiteBackend(str(Path(export_dir) / BACKEND_FILES['tflite']), num_threads=setting['threads'])
+    else:
+        backend = OnnxBackend(str(Path(export_dir) / BACKEND_FILES[backend_name]),
+                              intra_op_threads=setting['threads'], inter_op_threads=setting['inter_op_threads'])
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    max_length = resolve_max_length(config, tokenizer, Path(model_path))
+    texts = pd.read_csv(config['data']['test_file'])[config['data']['text_column']].astype(str).tolist()
+
+    engine_settings = benchmark_settings(config)
+    engine_settings.update(batch_sizes=[1, settings['bulk_batch_size']],
+                           seconds_per_batch_size=settings['seconds_per_setting'] / 2)
+    batches = BenchmarkEngine(tokenizer, max_length, engine_settings).sweep(
+        backend, texts[:engine_settings['max_examples']])
+
+    result = dict(setting)
+    single, bulk = batches['1'], batches[str(settings['bulk_batch_size'])]
+    if single['supported']:
+        inference = single['stages']['inference']
+        result.update(p50_latency_ms=inference['p50_ms'], p95_latency_ms=inference['p95_ms'],
+                      p99_latency_ms=inference['p99_ms'])
+    if bulk['supported']:
+        result.update(bulk_throughput_per_second=bulk['inference_throughput_per_second'],
+                      bulk_p95_ms=bulk['stages']['inference']['p95_ms'])
+    return result
+
+
+def recommend(results: List[Dict]) -> Dict[str, Dict]:
+    """Per backend: the setting with the lowest single-example p95, and the one with the highest bulk throughput."""
+    recommendations = {}
+    for backend in dict.fromkeys(result['backend'] for result in results):
+        measured = [result for result in results if result['backend'] == backend]
+        latency = [result for result in measured if 'p95_latency_ms' in result]
+        bulk = [result for result in measured if 'bulk_throughput_per_second' in result]
+        recommendations[backend] = {
+            'latency': min(latency, key=lambda result: result['p95_latency_ms']) if latency else None,
+            'throughput': max(bulk, key=lambda result: result['bulk_throughput_per_second']) if bulk else None,
+        }
+    return recommendations
+
+
+def describe(result: Optional[Dict]) -> str:
+    if result is None:
+        return "n/a"
+    text = f"{result['threads']} threads"
+    if result.get('inter_op_threads'):
+        text += f", {result['inter_op_threads']} inter-op"
+    if result.get('cores'):
+        text += f", cores {result['cores']}"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep thread counts and core pinning per exported backend")
+    parser.add_argument("config_path", help="Training config")
+    parser.add_argument("model_path", help="Trained model directory")
+    parser.add_argument("--export-dir", default="../models/mobile", help="Directory convert_to_mobile.py wrote")
+    parser.add_argument("--backends", nargs="+", default=["pytorch", "onnx", "onnx_quantized", "tflite"])
+    parser.add_argument("--threads", help="Comma-separated thread counts (default from config)")
+    parser.add_argument("--cores", help="Cores to pin to, e.g. 0-3 (default from config)")
+    parser.add_argument("--output", help="Results JSON (default: <export-dir>/thread_sweep.json)")
+    parser.add_argument("--run", help=argparse.SUPPRESS)  # One setting, in a child process
+    args = parser.parse_args()
+
+    with open(args.config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    settings = sweep_settings(config)
+
+    if args.run:
+        result = run_setting(config, args.model_path, args.export_dir, json.loads(args.run), settings)
+        print("RESULT " + json.dumps(result))
+        return
+
+    cores = parse_cores(args.cores if args.cores is not None else settings['cores'])
+    threads = ([int(t) for t in args.threads.split(",")] if args.threads
+               else settings['threads'] or default_threads(len(cores) or available_cores()))
+
+    results = []
+    for backend in args.backends:
+        if backend != 'pytorch' and not (Path(args.export_dir) / BACKEND_FILES[backend]).exists():
+            logger.warning(f"No {BACKEND_FILES[backend]} in {args.export_dir}; skipping {backend}")
+            continue
+        for setting in backend_settings(backend, threads, settings['inter_op_threads'], cores):
+            logger.info(f"Measuring {backend} with {describe(setting)}")
+            completed = subprocess.run(
+                [sys.executable, __file__, args.config_path, args.model_path, "--export-dir", args.export_dir,
+                 "--run", json.dumps(setting)],
+                capture_output=True, text=True
+            )
+            lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+            if completed.returncode != 0 or not lines:
+                logger.error(f"{backend} {describe(setting)} failed:\n{completed.stderr[-2000:]}")
+                continue
+            results.append(json.loads(lines[-1][len("RESULT "):]))
+
+    if not results:
+        sys.exit(1)
+
+    print(f"\n{'backend':<16} {'setting':<32} {'p50 ms':>8} {'p95 ms':>8} {'bulk /s':>9}")
+    for result in results:
+        print(f"{result['backend']:<16} {describe(result):<32} {result.get('p50_latency_ms', float('nan')):>8.2f} "
+              f"{result.get('p95_latency_ms', float('nan')):>8.2f} "
+              f"{result.get('bulk_throughput_per_second', float('nan')):>9.0f}")
+
+    recommendations = recommend(results)
+    print()
+    for backend, best in recommendations.items():
+        print(f"{backend}: single requests -> {describe(best['latency'])}; "
+              f"bulk (batch {settings['bulk_batch_size']}) -> {describe(best['throughput'])}")
+
+    output = Path(args.output) if args.output else Path(args.export_dir) / "thread_sweep.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'host': host_info(), 'settings': settings, 'threads': threads, 'cores': cores,
+                   'results': results, 'recommendations': recommendations}, f, indent=2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
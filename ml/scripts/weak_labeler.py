@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Vectorized keyword weak-labeler for unlabeled activity strings.
+Mirrors ActivityClassifier.predictCategory in the Android app (exact-word,
+substring, character-feature, length and pattern terms with the same
+per-category weights), but scores a whole batch at once: texts are split
+into words with Arrow string kernels, and every keyword test is a sparse
+text × word × pattern matrix product over the distinct words.
+"""
+
+import argparse
+import re
+import time
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from scipy import sparse
+
+# ActivityClassifier.categoryModels weights, per category
+CATEGORY_WEIGHTS = {
+    "exercise": {"exact_match": 1.0, "substring_match": 0.7, "character_features": 0.5, "length_penalty": -0.1},
+    "work": {"exact_match": 1.0, "substring_match": 0.8, "character_features": 0.6, "length_penalty": -0.05},
+    "food": {"exact_match": 1.0, "substring_match": 0.9, "character_features": 0.7, "length_penalty": -0.02},
+    "sleep": {"exact_match": 1.0, "substring_match": 0.8, "character_features": 0.6, "length_penalty": -0.1},
+    "social": {"exact_match": 1.0, "substring_match": 0.7, "character_features": 0.5, "length_penalty": -0.08},
+    "learning": {"exact_match": 1.0, "substring_match": 0.8, "character_features": 0.6, "length_penalty": -0.05},
+    "entertainment": {"exact_match": 1.0, "substring_match": 0.7, "character_features": 0.5, "length_penalty": -0.06},
+    "health": {"exact_match": 1.0, "substring_match": 0.9, "character_features": 0.7, "length_penalty": -0.03},
+    "travel": {"exact_match": 1.0, "substring_match": 0.8, "character_features": 0.6, "length_penalty": -0.07},
+}
+
+# ActivityClassifier.hasCharacteristic: feature names → words any of which must occur
+CHARACTERISTIC_WORDS = {
+    ("movement", "physical", "active"): ["move", "active", "physical", "body", "muscle", "sweat", "energy"],
+    ("professional", "business", "corporate"): ["professional", "corporate", "business", "formal", "meeting", "client"],
+    ("consumption", "culinary", "nutrition"): ["taste", "flavor", "hungry", "delicious", "recipe", "ingredient"],
+    ("restful", "recovery", "peaceful"): ["calm", "peaceful", "quiet", "relax", "tired", "sleepy"],
+    ("interpersonal", "community", "relationship"): ["together", "group", "friend", "family", "social", "community"],
+    ("educational", "intellectual", "academic"): ["learn", "study", "understand", "knowledge", "skill", "education"],
+    ("recreational", "leisure", "enjoyment"): ["fun", "enjoy", "entertaining", "amusing", "leisure", "hobby"],
+    ("medical", "wellness", "therapeutic"): ["healthy", "medical", "doctor", "treatment", "wellness", "care"],
+    ("transportation", "journey", "mobility"): ["travel", "journey", "trip", "destination", "transport", "move"],
+}
+
+# ActivityClassifier.getPatternBoost: (regex searched case-insensitively, boost)
+PATTERN_BOOSTS = {
+    "exercise": (r"\d+\s*(km|miles|steps|reps|sets|lbs|kg)", 0.2),
+    "work": (r"meeting|project", 0.15),
+    "food": (r"breakfast|lunch|dinner|snack", 0.25),
+    "sleep": (r"\d+\s*(hours?|hrs?)", 0.2),
+}
+
+# Activities shorter or longer than this get the per-category length penalty
+MIN_LENGTH, MAX_LENGTH = 3, 50
+
+# predictCategory falls back to "general" at or below this confidence
+APP_MIN_CONFIDENCE = 0.3
+
+
+class KeywordWeakLabeler:
+    """Scores activity strings against per-category keyword sets in one batch."""
+
+    def __init__(self, categories: Dict, weights: Dict[str, Dict[str, float]] = CATEGORY_WEIGHTS):
+        self.category_names = list(categories)
+        self.icons = [categories[name].icon_res for name in self.category_names]
+        self.keyword_counts = np.array([len(set(categories[name].keywords)) for name in self.category_names])
+
+        def weight_vector(key: str) -> np.ndarray:
+            return np.array([weights[name][key] for name in self.category_names])
+
+        self.exact_weight = weight_vector("exact_match")
+        self.substring_weight = weight_vector("substring_match")
+        self.character_weight = weight_vector("character_features")
+        self.length_penalty = weight_vector("length_penalty")
+
+        # Boosts that are plain word alternations are tested through the word matrices
+        # like keywords; the rest are regexes over the whole text
+        self.word_boosts, self.regex_boosts = [], []
+        for name, (pattern, boost) in PATTERN_BOOSTS.items():
+            if name not in self.category_names:
+                continue
+            if re.fullmatch(r"[a-z]+(\|[a-z]+)*", pattern):
+                self.word_boosts.append((self.category_names.index(name), pattern.split("|"), boost))
+            else:
+                self.regex_boosts.append((self.category_names.index(name), pattern, boost))
+
+        # Every string tested as a substring: keywords, characteristic and boost words
+        groups = list(CHARACTERISTIC_WORDS)
+        keywords = sorted({kw.lower() for name in self.category_names for kw in categories[name].keywords})
+        group_words = sorted({word for words in CHARACTERISTIC_WORDS.values() for word in words})
+        boost_words = {word for _, words, _ in self.word_boosts for word in words}
+        self.patterns = sorted(set(keywords) | set(group_words) | boost_words)
+        pattern_index = {pattern: i for i, pattern in enumerate(self.patterns)}
+
+        # pattern → category membership (a keyword may belong to several categories)
+        self.keyword_matrix = sparse.lil_matrix((len(self.patterns), len(self.category_names)))
+        for c, name in enumerate(self.category_names):
+            for keyword in {kw.lower() for kw in categories[name].keywords}:
+                self.keyword_matrix[pattern_index[keyword], c] = 1
+        self.keyword_matrix = self.keyword_matrix.tocsr()
+
+        # pattern → characteristic group, and how many of each category's features map to a group
+        self.group_matrix = sparse.lil_matrix((len(self.patterns), len(groups)))
+        for g, group in enumerate(groups):
+            for word in CHARACTERISTIC_WORDS[group]:
+                self.group_matrix[pattern_index[word], g] = 1
+        self.group_matrix = self.group_matrix.tocsr()
+        self.feature_counts = np.array([
+            [sum(feature in group for feature in categories[name].character_features) for name in self.category_names]
+            for group in groups
+        ], dtype=np.float64)
+        self.word_boosts = [
+            (c, [pattern_index[word] for word in words], boost) for c, words, boost in self.word_boosts
+        ]
+
+    def _word_pattern_matrices(self, vocabulary: pa.Array):
+        """Sparse (words × patterns) matrices for exact equality and substring containment."""
+        exact_ids = pc.index_in(vocabulary, value_set=pa.array(self.patterns)).to_numpy(zero_copy_only=False)
+        matched = ~np.isnan(exact_ids)
+        exact = sparse.csr_matrix(
+            (np.ones(matched.sum()), (np.flatnonzero(matched), exact_ids[matched].astype(np.int64))),
+            shape=(len(vocabulary), len(self.patterns))
+        )
+
+        rows, cols = [], []
+        for p, pattern in enumerate(self.patterns):
+            hits = np.flatnonzero(pc.match_substring(vocabulary, pattern).to_numpy(zero_copy_only=False))
+            rows.append(hits)
+            cols.append(np.full(len(hits), p))
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        substring = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                      shape=(len(vocabulary), len(self.patterns)))
+        return exact, substring
+
+    def _unique_raw_scores(self, texts: pa.Array) -> np.ndarray:
+        """Weighted scores before the app's division by keyword count, for distinct texts."""
+        words = pc.utf8_split_whitespace(texts)
+        encoded = pc.dictionary_encode(pc.list_flatten(words))
+        parents = pc.list_parent_indices(words).to_numpy()
+        word_ids = encoded.indices.to_numpy()
+
+        # Binary text × word presence; duplicate words in one text count once
+        presence = sparse.csr_matrix((np.ones(len(word_ids)), (parents, word_ids)),
+                                     shape=(len(texts), len(encoded.dictionary)))
+        presence.data[:] = 1
+
+        exact_words, substring_words = self._word_pattern_matrices(encoded.dictionary)
+        exact_hits = (presence @ exact_words) > 0
+        substring_hits = (presence @ substring_words) > 0
+
+        exact = (exact_hits @ self.keyword_matrix).toarray()
+        substring = (substring_hits @ self.keyword_matrix).toarray()
+        group_hits = ((substring_hits @ self.group_matrix).toarray() > 0).astype(np.float64)
+        character = group_hits @ self.feature_counts
+
+        scores = exact * self.exact_weight + substring * self.substring_weight + character * self.character_weight
+
+        lengths = pc.utf8_length(texts).to_numpy()
+        out_of_range = (lengths < MIN_LENGTH) | (lengths > MAX_LENGTH)
+        scores += np.outer(out_of_range, self.length_penalty)
+
+        for c, pattern_ids, boost in self.word_boosts:
+            scores[:, c] += (substring_hits[:, pattern_ids].sum(axis=1).A1 > 0) * boost
+
+        # The remaining boost regexes all need a number, so only texts with a digit are searched
+        digit_words = pc.match_substring_regex(encoded.dictionary, r"\d").to_numpy(zero_copy_only=False)
+        candidates = np.flatnonzero(presence[:, np.flatnonzero(digit_words)].sum(axis=1).A1 > 0)
+        candidate_texts = texts.take(pa.array(candidates, type=pa.int64()))
+        for c, pattern, boost in self.regex_boosts:
+            hits = pc.match_substring_regex(candidate_texts, pattern, ignore_case=True).to_numpy(zero_copy_only=False)
+            scores[candidates, c] += hits * boost
+        return scores
+
+    def raw_scores(self, texts: Sequence[str]) -> np.ndarray:
+        """(n, categories) weighted keyword evidence for each text."""
+        # Missing texts (None/NaN, e.g. empty CSV cells) score as empty strings
+        texts = pc.fill_null(pa.array(texts, type=pa.string(), from_pandas=True), "")
+        normalized = pc.utf8_trim_whitespace(pc.utf8_lower(texts))
+        # Score each distinct text once; activity logs repeat the same strings heavily
+        encoded = pc.dictionary_encode(normalized)
+        unique_scores = self._unique_raw_scores(encoded.dictionary)
+        return unique_scores[encoded.indices.to_numpy()]
+
+    def app_scores(self, texts: Sequence[str]) -> np.ndarray:
+        """Per-category confidences exactly as ActivityClassifier.calculateScore computes them."""
+        return np.clip(self.raw_scores(texts) / self.keyword_counts, 0.0, 1.0)
+
+    def soft_labels(self, texts: Sequence[str]) -> np.ndarray:
+        """Each category's share of the positive keyword evidence; all-zero rows have none."""
+        evidence = np.clip(self.raw_scores(texts), 0.0, None)
+        totals = evidence.sum(axis=1, keepdims=True)
+        return np.divide(evidence, totals, out=np.zeros_like(evidence), where=totals > 0)
+
+    def label(self, texts: Sequence[str], min_confidence: float = 0.5) -> pd.DataFrame:
+        """Best category per text with its soft label as confidence_score.
+
+        Texts whose best share is below min_confidence (or that match no
+        keyword at all) get an empty category and icon.
+        """
+        probabilities = self.soft_labels(texts)
+        best = probabilities.argmax(axis=1)
+        confidence = probabilities[np.arange(len(best)), best]
+        labeled = confidence >= max(min_confidence, np.finfo(float).tiny)
+
+        categories = np.array(self.category_names, dtype=object)[best]
+        icons = np.array(self.icons, dtype=object)[best]
+        frame = pd.DataFrame({
+            "category": np.where(labeled, categories, ""),
+            "icon_label": np.where(labeled, icons, ""),
+            "confidence_score": np.where(labeled, confidence, 0.0),
+        })
+        for c, name in enumerate(self.category_names):
+            frame[f"p_{name}"] = probabilities[:, c]
+        return frame
+
+
+def reference_raw_scores(labeler: KeywordWeakLabeler, categories: Dict, text: str) -> np.ndarray:
+    """Per-string loop transcribed from ActivityClassifier.calculateScore, for checking and timing."""
+    text = text.lower().strip()
+    words = text.split()
+    scores = np.zeros(len(labeler.category_names))
+    for c, name in enumerate(labeler.category_names):
+        keywords = {kw.lower() for kw in categories[name].keywords}
+        weights = CATEGORY_WEIGHTS[name]
+        score = sum(any(word == kw for word in words) for kw in keywords) * weights["exact_match"]
+        score += sum(kw in text for kw in keywords) * weights["substring_match"]
+        score += sum(
+            any(feature in group and any(word in text for word in group_words)
+                for group, group_words in CHARACTERISTIC_WORDS.items())
+            for feature in categories[name].character_features
+        ) * weights["character_features"]
+        if len(text) < MIN_LENGTH or len(text) > MAX_LENGTH:
+            score += weights["length_penalty"]
+        if name in PATTERN_BOOSTS:
+            pattern, boost = PATTERN_BOOSTS[name]
+            if re.search(pattern, text, re.IGNORECASE):
+                score += boost
+        scores[c] = score
+    return scores
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Weakly label activity strings with the app's keyword model")
+    parser.add_argument("input", help="CSV with a text column")
+    parser.add_argument("--column", default="user_input", help="Text column to label")
+    parser.add_argument("--output", help="Where to write the labelled CSV (default: <input>_labeled.csv)")
+    parser.add_argument("--min-confidence", type=float, default=0.5,
+                        help="Minimum soft-label share for a text to get a category")
+    parser.add_argument("--benchmark", type=int, metavar="N",
+                        help="Also time the per-string reference loop on N texts and check agreement")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    from prepare_data import ActivityDataGenerator
+
+    categories = ActivityDataGenerator().categories
+    labeler = KeywordWeakLabeler(categories)
+    texts = pd.read_csv(args.input, keep_default_na=False)[args.column].astype(str).tolist()
+
+    started = time.perf_counter()
+    labels = labeler.label(texts, args.min_confidence)
+    elapsed = time.perf_counter() - started
+    print(f"Labelled {len(texts)} texts in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):,.0f} texts/s)")
+    print(f"{(labels['category'] != '').mean():.1%} received a category")
+    print(labels.loc[labels["category"] != "", "category"].value_counts().to_string())
+
+    output = args.output or args.input.replace(".csv", "_labeled.csv")
+    pd.concat([pd.DataFrame({args.column: texts}), labels], axis=1).to_csv(output, index=False)
+    print(f"Saved labels to {output}")
+
+    if args.benchmark:
+        sample = texts[:args.benchmark]
+        started = time.perf_counter()
+        reference = np.array([reference_raw_scores(labeler, categories, text) for text in sample])
+        loop_elapsed = time.perf_counter() - started
+        started = time.perf_counter()
+        vectorized = labeler.raw_scores(sample)
+        batch_elapsed = time.perf_counter() - started
+        print(f"\nPer-string loop: {loop_elapsed:.2f}s, batched: {batch_elapsed:.3f}s "
+              f"({loop_elapsed / max(batch_elapsed, 1e-9):.0f}x) on {len(sample)} texts")
+        print(f"Max absolute score difference: {np.abs(reference - vectorized).max():.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Training throughput benchmark for the CPU profile.
+Runs a fixed number of optimizer steps for each combination of thread
+count, bf16 autocast and torch.compile, every setting in a fresh process
+(torch's thread pools are fixed once it starts), and reports samples/sec
+against the settings training used before the profile existed.
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import yaml
+
+from cpu_profile import available_cores, has_native_bf16
+
+logger = logging.getLogger(__name__)
+
+
+def benchmark_settings(config: Dict, threads: List[int], include_compile: bool) -> List[Dict]:
+    """The baseline plus every profile combination worth measuring on this machine."""
+    # Without the profile: torch's default thread pools, fp32 and the configured loader workers
+    settings = [{'name': "baseline", 'enabled': False}]
+    bf16_options = [False, True] if has_native_bf16() else [False]
+    compile_options = [False, True] if include_compile else [False]
+    for thread_count, bf16, compile_model in itertools.product(threads, bf16_options, compile_options):
+        settings.append({
+            'name': f"threads={thread_count} bf16={bf16} compile={compile_model}",
+            'enabled': True, 'intra_op_threads': thread_count, 'inter_op_threads': 1, 'bf16': bf16, 'compile': compile_model,
+            'dataloader_num_workers': 0,
+        })
+    return settings
+
+
+def run_setting(config: Dict, setting: Dict, steps: int, warmup_steps: int) -> Dict:
+    """Train for warmup_steps + steps in this process and time the last `steps`."""
+    from transformers import TrainerCallback
+    from train_model import ActivityClassificationTrainer, ActivityTrainer
+
+    config = copy.deepcopy(config)
+    config['cpu'] = {key: value for key, value in setting.items() if key != 'name'}
+
+    class StepTimer(TrainerCallback):
+        def __init__(self):
+            self.marks = {}
+
+        def on_train_begin(self, args, state, control, **kwargs):
+            # Without warm-up, timing starts before the first step
+            if warmup_steps == 0:
+                self.marks[0] = time.perf_counter()
+
+        def on_step_end(self, args, state, control, **kwargs):
+            if state.global_step in (warmup_steps, warmup_steps + steps):
+                self.marks[state.global_step] = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as output_dir, tempfile.NamedTemporaryFile('w', suffix=".yaml") as f:
+        config['output']['output_dir'] = output_dir
+        config['output']['logging_dir'] = output_dir
+        yaml.safe_dump(config, f)
+        f.flush()
+
+        trainer = ActivityClassificationTrainer(f.name)
+        train_df, val_df, test_df = trainer.load_data()
+        trainer.prepare_model_and_tokenizer()
+        train_dataset, _, _ = trainer.prepare_datasets(train_df, val_df, test_df)
+
+        args = trainer._training_arguments()
+        args.max_steps = warmup_steps + steps
+        args.eval_strategy = "no"
+        args.save_strategy = "no"
+        args.load_best_model_at_end = False
+        args.report_to = []
+        timer = StepTimer()
+        ActivityTrainer(
+            model=trainer.model,
+            args=args,
+            train_dataset=train_dataset,
+            data_collator=trainer._data_collator(),
+            callbacks=[timer]
+        ).train()
+
+    import torch
+
+    elapsed = timer.marks[warmup_steps + steps] - timer.marks[warmup_steps]
+    samples = steps * args.per_device_train_batch_size * args.gradient_accumulation_steps
+    return {
+        **setting,
+        'intra_op_threads': torch.get_num_threads(),
+        'inter_op_threads': torch.get_num_interop_threads(),
+        'steps': steps,
+        'seconds': elapsed,
+        'samples_per_second': samples / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CPU training throughput per profile setting")
+    parser.add_argument("--config", default="config.yaml", help="Training config")
+    parser.add_argument("--threads", help="Comma-separated intra-op thread counts (default: 1, half, all cores)")
+    parser.add_argument("--compile", action="store_true", help="Also measure torch.compile")
+    parser.add_argument("--steps", type=int, default=30, help="Timed optimizer steps per setting")
+    parser.add_argument("--warmup-steps", type=int, default=5, help="Untimed steps before measuring")
+    parser.add_argument("--output", default="../models/cpu_training_benchmark.json", help="Results JSON")
+    parser.add_argument("--run", help=argparse.SUPPRESS)  # One setting, in a child process
+    args = parser.parse_args()
+    if args.steps < 1 or args.warmup_steps < 0:
+        parser.error("--steps must be at least 1 and --warmup-steps at least 0")
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+
+    if args.run:
+        result = run_setting(config, json.loads(args.run), args.steps, args.warmup_steps)
+        print("RESULT " + json.dumps(result))
+        return
+
+    cores = available_cores()
+    threads = [int(t) for t in args.threads.split(",")] if args.threads else sorted({1, max(1, cores // 2), cores})
+    results = []
+    for setting in benchmark_settings(config, threads, args.compile):
+        logger.info(f"Measuring {setting['name']}")
+        completed = subprocess.run(
+            [sys.executable, __file__, "--config", args.config, "--run", json.dumps(setting),
+             "--steps", str(args.steps), "--warmup-steps", str(args.warmup_steps)],
+            capture_output=True, text=True
+        )
+        lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+        if completed.returncode != 0 or not lines:
+            logger.error(f"{setting['name']} failed:\n{completed.stderr[-2000:]}")
+            continue
+        results.append(json.loads(lines[-1][len("RESULT "):]))
+
+    if not results:
+        sys.exit(1)
+    baseline = next((result for result in results if result['name'] == "baseline"), results[0])
+    print(f"\n{'setting':<40} {'samples/s':>10} {'speedup':>8}")
+    for result in results:
+        result['speedup'] = result['samples_per_second'] / baseline['samples_per_second']
+        print(f"{result['name']:<40} {result['samples_per_second']:>10.1f} {result['speedup']:>7.2f}x")
+
+    best = max(results, key=lambda result: result['samples_per_second'])
+    print(f"\nFastest: {best['name']}; set these in the `cpu` section of {args.config}")
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'cores': cores, 'native_bf16': has_native_bf16(), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+CPU training profile.
+On CPU-only machines fp16 and data loader worker processes do not help:
+this picks intra-/inter-op thread counts from the cores the process may
+use, enables bf16 autocast when the CPU has native bf16 instructions, and
+optionally compiles the model.
+"""
+
+import logging
+import os
+from typing import Dict
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the optional `cpu` section of config.yaml
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    'intra_op_threads': 0,  # 0 = one per available core
+    'inter_op_threads': 1,
+    'bf16': "auto",  # "auto" enables bf16 only with native CPU support
+    'compile': False,
+    'dataloader_num_workers': 0,
+}
+
+# /proc/cpuinfo flags for native bf16 arithmetic; without them bf16 is emulated and slower
+NATIVE_BF16_FLAGS = {"avx512_bf16", "amx_bf16"}
+
+
+def cpu_settings(config: Dict) -> Dict:
+    """The `cpu` config section merged over the defaults."""
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get('cpu') or {})
+    return settings
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects taskset/cgroup pinning)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def has_native_bf16() -> bool:
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return bool(NATIVE_BF16_FLAGS & set(line.split(":", 1)[1].split()))
+    except OSError:
+        pass
+    return False
+
+
+def apply_cpu_profile(settings: Dict) -> Dict:
+    """Set torch's thread pools and return the TrainingArguments overrides for CPU training."""
+    intra_op = settings['intra_op_threads'] or available_cores()
+    inter_op = settings['inter_op_threads'] or 1
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_num_interop_threads(inter_op)
+    except RuntimeError:
+        # Only settable before the first inter-op parallel work in the process
+        logger.warning(f"Inter-op threads already fixed at {torch.get_num_interop_threads()}")
+
+    bf16 = settings['bf16']
+    if bf16 == "auto":
+        bf16 = has_native_bf16()
+
+    overrides = {
+        'use_cpu': True,
+        'fp16': False,
+        'bf16': bool(bf16),
+        'torch_compile': bool(settings['compile']),
+        'dataloader_num_workers': settings['dataloader_num_workers'],
+    }
+    logger.info(f"CPU profile: {intra_op} intra-op / {torch.get_num_interop_threads()} inter-op threads, "
+                f"bf16={overrides['bf16']}, compile={overrides['torch_compile']}")
+    return overrides
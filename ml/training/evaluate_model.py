@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Streaming evaluation of a saved activity classifier.
+Reads a CSV or shard set in chunks, runs the model batch by batch and folds
+every batch into running accumulators (confusion matrix, top-k hits,
+calibration bins), so memory stays flat however large the evaluation set is.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from sequence_length import load_sequence_length
+from throughput_callback import peak_rss_mb
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from shard_io import iter_shard_frames
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 50_000
+
+
+class StreamingMetrics:
+    """Running classification metrics over batches of logits."""
+
+    def __init__(self, num_classes: int, top_k: Sequence[int] = (1, 3), ece_bins: int = 15):
+        self.num_classes = num_classes
+        self.top_k = sorted({k for k in top_k if k <= num_classes})
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.top_k_hits = np.zeros(len(self.top_k), dtype=np.int64)
+        self.bin_edges = np.linspace(0.0, 1.0, ece_bins + 1)
+        self.bin_count = np.zeros(ece_bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(ece_bins)
+        self.bin_correct = np.zeros(ece_bins)
+        self.nll_sum = 0.0
+        self.count = 0
+
+    def update(self, logits: np.ndarray, labels: np.ndarray):
+        logits = logits.astype(np.float64)
+        shifted = logits - logits.max(axis=1, keepdims=True)
+        log_probs = shifted - np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+        probabilities = np.exp(log_probs)
+        predictions = probabilities.argmax(axis=1)
+
+        np.add.at(self.confusion, (labels, predictions), 1)
+
+        # Rank of the true class: how many classes scored strictly higher
+        true_scores = logits[np.arange(len(labels)), labels]
+        rank = (logits > true_scores[:, None]).sum(axis=1)
+        for i, k in enumerate(self.top_k):
+            self.top_k_hits[i] += int((rank < k).sum())
+
+        confidence = probabilities.max(axis=1)
+        bins = np.clip(np.digitize(confidence, self.bin_edges[1:-1], right=True), 0, len(self.bin_count) - 1)
+        self.bin_count += np.bincount(bins, minlength=len(self.bin_count))
+        self.bin_confidence += np.bincount(bins, weights=confidence, minlength=len(self.bin_count))
+        self.bin_correct += np.bincount(bins, weights=(predictions == labels), minlength=len(self.bin_count))
+
+        self.nll_sum -= float(log_probs[np.arange(len(labels)), labels].sum())
+        self.count += len(labels)
+
+    def result(self, class_names: Sequence[str]) -> Dict:
+        if self.count == 0:
+            raise ValueError("No examples were evaluated")
+        true_positives = np.diag(self.confusion).astype(np.float64)
+        support = self.confusion.sum(axis=1)
+        predicted = self.confusion.sum(axis=0)
+        precision = np.divide(true_positives, predicted, out=np.zeros_like(true_positives), where=predicted > 0)
+        recall = np.divide(true_positives, support, out=np.zeros_like(true_positives), where=support > 0)
+        denominator = precision + recall
+        f1 = np.divide(2 * precision * recall, denominator, out=np.zeros_like(true_positives), where=denominator > 0)
+        weights = support / support.sum()
+
+        occupied = self.bin_count > 0
+        gaps = np.abs(self.bin_correct[occupied] - self.bin_confidence[occupied]) / self.bin_count[occupied]
+
+        return {
+            'examples': int(self.count),
+            'accuracy': float(true_positives.sum() / self.count),
+            **{f'top_{k}_accuracy': float(hits / self.count) for k, hits in zip(self.top_k, self.top_k_hits)},
+            'precision_macro': float(precision.mean()),
+            'recall_macro': float(recall.mean()),
+            'f1_macro': float(f1.mean()),
+            'precision_weighted': float((precision * weights).sum()),
+            'recall_weighted': float((recall * weights).sum()),
+            'f1_weighted': float((f1 * weights).sum()),
+            'ece': float((self.bin_count[occupied] / self.count * gaps).sum()),
+            'max_calibration_error': float(gaps.max()),
+            'nll': self.nll_sum / self.count,
+            'per_class': {
+                name: {'precision': float(precision[i]), 'recall': float(recall[i]),
+                       'f1': float(f1[i]), 'support': int(support[i])}
+                for i, name in enumerate(class_names)
+            },
+            'confusion_matrix': self.confusion.tolist(),
+            'calibration_bins': [
+                {'upper': float(upper), 'count': int(count),
+                 'confidence': float(conf / count) if count else None,
+                 'accuracy': float(correct / count) if count else None}
+                for upper, count, conf, correct in zip(
+                    self.bin_edges[1:], self.bin_count, self.bin_confidence, self.bin_correct)
+            ],
+        }
+
+
+def iter_frames(path: Union[str, Path], columns: List[str], chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Chunks of a CSV file, or the shards of a shard directory, with only `columns` loaded."""
+    path = Path(path)
+    if path.is_dir():
+        yield from iter_shard_frames(path, columns=columns)
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size)
+
+
+class ModelEvaluator:
+    """Runs a saved model over a dataset in batches and accumulates its metrics."""
+
+    def __init__(self, model_dir: Union[str, Path], batch_size: int = 64, max_length: Optional[int] = None):
+        self.model_dir = Path(model_dir)
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        self.model = AutoModelForSequenceClassification.from_pretrained(self.model_dir).eval()
+
+        with open(self.model_dir / "label_encoder.json", 'r') as f:
+            self.classes = json.load(f)['classes']
+        self.class_ids = {name: i for i, name in enumerate(self.classes)}
+
+        stats = load_sequence_length(self.model_dir)
+        self.max_length = max_length or (stats['max_length'] if stats else self.tokenizer.model_max_length)
+
+    def evaluate(self, data_path: Union[str, Path], text_column: str = 'user_input',
+                 label_column: str = 'category', top_k: Sequence[int] = (1, 3), ece_bins: int = 15,
+                 chunk_size: int = CHUNK_SIZE, limit: Optional[int] = None,
+                 predictions_path: Optional[Union[str, Path]] = None) -> Dict:
+        metrics = StreamingMetrics(len(self.classes), top_k, ece_bins)
+        skipped = 0
+        tokenize_seconds = inference_seconds = 0.0
+        real_tokens = padded_tokens = 0
+        started = time.perf_counter()
+
+        predictions_file = open(predictions_path, 'w', newline='') if predictions_path else None
+        writer = csv.writer(predictions_file) if predictions_file else None
+        if writer:
+            writer.writerow([text_column, label_column, 'predicted', 'confidence'])
+
+        try:
+            for frame in iter_frames(data_path, [text_column, label_column], chunk_size):
+                if limit is not None:
+                    frame = frame.head(limit - metrics.count - skipped)
+                    if frame.empty:
+                        break
+                labels = frame[label_column].map(self.class_ids)
+                known = labels.notna().to_numpy()
+                skipped += int((~known).sum())
+                texts = frame[text_column].astype(str).to_numpy()[known]
+                labels = labels.to_numpy()[known].astype(np.int64)
+
+                # Similar lengths in a batch keep padding low; order does not affect the metrics
+                order = np.argsort([len(text) for text in texts], kind='stable')
+                for start in range(0, len(order), self.batch_size):
+                    batch = order[start:start + self.batch_size]
+
+                    tick = time.perf_counter()
+                    encoding = self.tokenizer(
+                        texts[batch].tolist(), truncation=True, max_length=self.max_length,
+                        padding=True, return_tensors='pt'
+                    )
+                    tock = time.perf_counter()
+                    with torch.inference_mode():
+                        logits = self.model(**encoding).logits.float().numpy()
+                    inference_seconds += time.perf_counter() - tock
+                    tokenize_seconds += tock - tick
+
+                    real_tokens += int(encoding['attention_mask'].sum())
+                    padded_tokens += encoding['attention_mask'].numel()
+                    metrics.update(logits, labels[batch])
+
+                    if writer:
+                        probabilities = torch.softmax(torch.from_numpy(logits), dim=1).numpy()
+                        predicted = probabilities.argmax(axis=1)
+                        writer.writerows(zip(
+                            texts[batch], np.asarray(self.classes, dtype=object)[labels[batch]],
+                            np.asarray(self.classes, dtype=object)[predicted], probabilities.max(axis=1).round(4)
+                        ))
+        finally:
+            if predictions_file:
+                predictions_file.close()
+
+        elapsed = time.perf_counter() - started
+        report = metrics.result(self.classes)
+        report.update({
+            'model_dir': str(self.model_dir),
+            'data': str(data_path),
+            'max_length': self.max_length,
+            'skipped_unknown_labels': skipped,
+            'throughput': {
+                'seconds': elapsed,
+                'examples_per_second': metrics.count / elapsed if elapsed else 0.0,
+                'tokenize_seconds': tokenize_seconds,
+                'inference_seconds': inference_seconds,
+                'real_tokens_per_second': real_tokens / elapsed if elapsed else 0.0,
+                'padding_fraction': 1 - real_tokens / padded_tokens if padded_tokens else 0.0,
+                'peak_rss_mb': peak_rss_mb(),
+            },
+        })
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a dataset through a saved model and report metrics")
+    parser.add_argument("model_dir", help="Saved model directory (e.g. ../models/fine_tuned)")
+    parser.add_argument("data", help="CSV file or shard directory")
+    parser.add_argument("--text-column", default="user_input")
+    parser.add_argument("--label-column", default="category")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="CSV rows read at a time")
+    parser.add_argument("--max-length", type=int, help="Override the model's sequence length")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--ece-bins", type=int, default=15, help="Confidence bins for calibration error")
+    parser.add_argument("--limit", type=int, help="Evaluate only the first N rows")
+    parser.add_argument("--predictions", help="Also stream per-row predictions to this CSV")
+    parser.add_argument("--output", help="Report JSON (default: <model_dir>/evaluation_report.json)")
+    args = parser.parse_args()
+
+    evaluator = ModelEvaluator(args.model_dir, args.batch_size, args.max_length)
+    report = evaluator.evaluate(
+        args.data, args.text_column, args.label_column, args.top_k, args.ece_bins,
+        args.chunk_size, args.limit, args.predictions
+    )
+
+    output = Path(args.output) if args.output else Path(args.model_dir) / "evaluation_report.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    throughput = report['throughput']
+    print(f"Examples: {report['examples']} ({report['skipped_unknown_labels']} skipped with unknown labels)")
+    print(f"Accuracy: {report['accuracy']:.4f}, weighted F1: {report['f1_weighted']:.4f}, "
+          f"macro F1: {report['f1_macro']:.4f}")
+    for k in args.top_k:
+        if f'top_{k}_accuracy' in report:
+            print(f"Top-{k} accuracy: {report[f'top_{k}_accuracy']:.4f}")
+    print(f"ECE: {report['ece']:.4f}, NLL: {report['nll']:.4f}")
+    print(f"Throughput: {throughput['examples_per_second']:.0f} examples/s "
+          f"({throughput['padding_fraction']:.1%} padding), peak RSS {throughput['peak_rss_mb']:.0f}MB")
+    print(f"Report saved to {output}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
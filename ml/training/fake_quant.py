@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Fake quantization for quantization-aware training.
+Swaps every nn.Linear for a FakeQuantLinear that rounds its weights and
+inputs to INT8 in the forward pass (gradients pass straight through), using
+the same scheme as the dynamic INT8 export in convert_to_mobile.py:
+symmetric int8 weights and per-tensor uint8 activations whose range is
+taken from each input at run time.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# Written next to a QAT model so the converter quantizes it the way it was trained
+QUANTIZATION_FILE = "quantization.json"
+
+
+def fake_quantize_weight(weight: torch.Tensor, per_channel: bool) -> torch.Tensor:
+    """Symmetric int8 in [-127, 127], per output channel or for the whole tensor."""
+    if per_channel:
+        scale = (weight.detach().abs().amax(dim=1) / 127).clamp(min=1e-8)
+        zero_point = torch.zeros_like(scale, dtype=torch.int32)
+        return torch.fake_quantize_per_channel_affine(weight, scale, zero_point, 0, -127, 127)
+    scale = (weight.detach().abs().max() / 127).clamp(min=1e-8).reshape(1)
+    return torch.fake_quantize_per_tensor_affine(weight, scale, torch.zeros(1, dtype=torch.int32), -127, 127)
+
+
+def fake_quantize_activation(x: torch.Tensor) -> torch.Tensor:
+    """Asymmetric uint8 over the tensor's own range (which always includes zero), like DynamicQuantizeLinear."""
+    low = x.detach().min().clamp(max=0)
+    high = x.detach().max().clamp(min=0)
+    scale = ((high - low) / 255).clamp(min=1e-8).reshape(1)
+    zero_point = torch.round(-low / scale).to(torch.int32).reshape(1)
+    return torch.fake_quantize_per_tensor_affine(x, scale, zero_point, 0, 255)
+
+
+class FakeQuantLinear(nn.Linear):
+    """nn.Linear computed on fake-quantized weights and inputs.
+
+    Shares the wrapped layer's parameters, so state_dict keys, optimizers and
+    checkpoints see an ordinary Linear.
+    """
+
+    per_channel = True
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, per_channel: bool = True) -> 'FakeQuantLinear':
+        module = cls.__new__(cls)
+        nn.Module.__init__(module)
+        module.in_features, module.out_features = linear.in_features, linear.out_features
+        module.weight, module.bias = linear.weight, linear.bias
+        module.per_channel = per_channel
+        return module
+
+    def to_linear(self) -> nn.Linear:
+        linear = nn.Linear.__new__(nn.Linear)
+        nn.Module.__init__(linear)
+        linear.in_features, linear.out_features = self.in_features, self.out_features
+        linear.weight, linear.bias = self.weight, self.bias
+        return linear
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return F.linear(fake_quantize_activation(x), fake_quantize_weight(self.weight, self.per_channel), self.bias)
+
+
+def _swap_linears(model: nn.Module, swap) -> int:
+    count = 0
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            replacement = swap(child)
+            if replacement is not None:
+                setattr(parent, name, replacement)
+                count += 1
+    return count
+
+
+def insert_fake_quant(model: nn.Module, per_channel: bool = True) -> int:
+    """Replace every nn.Linear in the model with a FakeQuantLinear; returns how many were replaced."""
+    return _swap_linears(model, lambda module: (
+        FakeQuantLinear.from_linear(module, per_channel)
+        if type(module) is nn.Linear else None
+    ))
+
+
+def remove_fake_quant(model: nn.Module) -> int:
+    """Turn FakeQuantLinear layers back into nn.Linear with the trained float weights."""
+    return _swap_linears(model, lambda module: (
+        module.to_linear() if isinstance(module, FakeQuantLinear) else None
+    ))
+
+
+def save_quantization_settings(model_dir: Union[str, Path], settings: Dict):
+    with open(Path(model_dir) / QUANTIZATION_FILE, 'w') as f:
+        json.dump(settings, f, indent=2)
+
+
+def load_quantization_settings(model_dir: Union[str, Path]) -> Optional[Dict]:
+    """The QAT settings saved with a model, or None for a model trained without QAT."""
+    path = Path(model_dir) / QUANTIZATION_FILE
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
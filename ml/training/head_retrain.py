@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Head-only retraining on a frozen encoder.
+Runs the fine-tuned encoder once over each data file and caches the pooled
+embeddings (the classifier's input) as memory-mapped arrays keyed by the
+model's weights, then trains just a new classification head on them in
+seconds. The head is merged back into a full checkpoint, so category
+changes or new data do not need a full fine-tune before export.
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import yaml
+from sklearn.metrics import classification_report
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from sequence_length import resolve_max_length, save_sequence_length
+from token_cache import cache_key, model_fingerprint, publish_cache
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_VERSION = 1
+
+# Defaults for the optional `head_retrain` section of config.yaml
+DEFAULT_SETTINGS = {
+    'model_dir': "../models/fine_tuned",
+    'output_dir': "../models/head_retrained",
+    'learning_rate': 0.001,
+    'weight_decay': 0.01,
+    'batch_size': 256,
+    'max_epochs': 100,
+    'patience': 5,
+    'seed': 42,
+}
+
+
+def pooled_embeddings(model, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """What the classification head sees: the pooler output, or the [CLS] state without a pooler."""
+    outputs = model.base_model(input_ids=input_ids, attention_mask=attention_mask)
+    pooled = getattr(outputs, 'pooler_output', None)
+    return pooled if pooled is not None else outputs.last_hidden_state[:, 0]
+
+
+class EmbeddingCache:
+    """Memory-mapped (examples × hidden) float32 pooled embeddings for one data file."""
+
+    def __init__(self, cache_path: Union[str, Path]):
+        self.path = Path(cache_path)
+        with open(self.path / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        self.embeddings = np.load(self.path / 'embeddings.npy', mmap_mode='c')
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @staticmethod
+    def compute(model, tokenizer, texts: List[str], max_length: int, batch_size: int = 256) -> np.ndarray:
+        """Pooled embeddings for every text, in order."""
+        # Length-sorted batches pad less; rows are scattered back by index
+        order = np.argsort([len(text) for text in texts], kind='stable')
+        embeddings = np.empty((len(texts), model.config.hidden_size), dtype=np.float32)
+        model.eval()
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                indices = order[start:start + batch_size]
+                encoding = tokenizer([texts[i] for i in indices], truncation=True, max_length=max_length,
+                                     padding=True, return_tensors='pt')
+                pooled = pooled_embeddings(model, encoding['input_ids'], encoding['attention_mask'])
+                embeddings[indices] = pooled.float().numpy()
+        return embeddings
+
+    @classmethod
+    def build(cls, cache_dir: Union[str, Path], model, model_dir: Union[str, Path], tokenizer,
+              max_length: int, data_file: Union[str, Path], texts: List[str],
+              text_column: str = 'user_input') -> 'EmbeddingCache':
+        """Open the cached embeddings for a data file, running the encoder first if they are missing."""
+        hasher = hashlib.sha256()
+        hasher.update(f"v{EMBEDDING_CACHE_VERSION}:".encode('utf-8'))
+        hasher.update(model_fingerprint(model_dir).encode('utf-8'))
+        hasher.update(cache_key(tokenizer, max_length, data_file, text_column).encode('utf-8'))
+        key = hasher.hexdigest()[:16]
+
+        cache_path = Path(cache_dir) / f"{Path(data_file).stem}-embeddings-{key}"
+        if (cache_path / 'meta.json').exists():
+            logger.info(f"Using embedding cache {cache_path}")
+            return cls(cache_path)
+
+        logger.info(f"Encoding {len(texts)} examples into {cache_path}")
+        started = time.perf_counter()
+        embeddings = cls.compute(model, tokenizer, texts, max_length)
+        logger.info(f"Encoded in {time.perf_counter() - started:.1f}s")
+
+        def write(tmp_path: Path):
+            np.save(tmp_path / 'embeddings.npy', embeddings)
+            with open(tmp_path / 'meta.json', 'w') as f:
+                json.dump({
+                    'version': EMBEDDING_CACHE_VERSION,
+                    'key': key,
+                    'model_dir': str(model_dir),
+                    'data_file': str(data_file),
+                    'max_length': max_length,
+                    'num_examples': len(texts),
+                    'hidden_size': int(embeddings.shape[1]),
+                }, f, indent=2)
+
+        publish_cache(cache_dir, cache_path, write)
+        return cls(cache_path)
+
+
+def initial_head(classifier: nn.Linear, old_classes: List[str], new_classes: List[str]) -> nn.Linear:
+    """A head for new_classes, starting from the old head's rows for categories that already existed."""
+    head = nn.Linear(classifier.in_features, len(new_classes))
+    with torch.no_grad():
+        for row, name in enumerate(new_classes):
+            if name in old_classes:
+                head.weight[row] = classifier.weight[old_classes.index(name)]
+                head.bias[row] = classifier.bias[old_classes.index(name)]
+    return head
+
+
+def train_head(head: nn.Linear, train_x: np.ndarray, train_y: np.ndarray, val_x: np.ndarray,
+               val_y: np.ndarray, settings: Dict) -> Dict:
+    """Minibatch AdamW on cached embeddings, keeping the weights with the best validation accuracy."""
+    generator = torch.Generator().manual_seed(settings['seed'])
+    train_x, train_y = torch.from_numpy(train_x), torch.from_numpy(train_y)
+    val_x, val_y = torch.from_numpy(val_x), torch.from_numpy(val_y)
+    optimizer = torch.optim.AdamW(head.parameters(), lr=settings['learning_rate'],
+                                  weight_decay=settings['weight_decay'])
+    loss_fn = nn.CrossEntropyLoss()
+
+    best = {'accuracy': -1.0, 'epoch': 0, 'state': None}
+    for epoch in range(1, settings['max_epochs'] + 1):
+        head.train()
+        for batch in torch.randperm(len(train_x), generator=generator).split(settings['batch_size']):
+            optimizer.zero_grad()
+            loss_fn(head(train_x[batch]), train_y[batch]).backward()
+            optimizer.step()
+
+        head.eval()
+        with torch.no_grad():
+            accuracy = float((head(val_x).argmax(dim=1) == val_y).float().mean())
+        if accuracy > best['accuracy']:
+            best = {'accuracy': accuracy, 'epoch': epoch, 'state': copy.deepcopy(head.state_dict())}
+        elif epoch - best['epoch'] >= settings['patience']:
+            break
+
+    head.load_state_dict(best['state'])
+    return {'best_epoch': best['epoch'], 'epochs_run': epoch, 'val_accuracy': best['accuracy']}
+
+
+def retrain_head(config: Dict, model_dir: Optional[str] = None, output_dir: Optional[str] = None) -> Dict:
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get('head_retrain') or {})
+    model_dir = Path(model_dir or settings['model_dir'])
+    output_dir = Path(output_dir or settings['output_dir'])
+    data = config['data']
+    torch.manual_seed(settings['seed'])
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    if not isinstance(getattr(model, 'classifier', None), nn.Linear):
+        raise ValueError(f"{type(model).__name__} has no single linear classifier to retrain")
+    max_length = resolve_max_length(config, tokenizer, model_dir)
+    with open(model_dir / "label_encoder.json", 'r') as f:
+        old_classes = json.load(f)['classes']
+
+    frames = {key: pd.read_csv(data[key]) for key in ('train_file', 'val_file', 'test_file')}
+    classes = sorted(set().union(*(frame[data['label_column']] for frame in frames.values())))
+    class_ids = {name: i for i, name in enumerate(classes)}
+    added, removed = sorted(set(classes) - set(old_classes)), sorted(set(old_classes) - set(classes))
+    if added or removed:
+        logger.info(f"Categories added: {added}, removed: {removed}")
+
+    started = time.perf_counter()
+    features, targets = {}, {}
+    for key, frame in frames.items():
+        texts = frame[data['text_column']].astype(str).tolist()
+        cache_dir = data.get('cache_dir')
+        if cache_dir:
+            features[key] = EmbeddingCache.build(cache_dir, model, model_dir, tokenizer, max_length,
+                                                 data[key], texts, data['text_column']).embeddings
+        else:
+            features[key] = EmbeddingCache.compute(model, tokenizer, texts, max_length)
+        targets[key] = frame[data['label_column']].map(class_ids).to_numpy(dtype=np.int64)
+    embedding_seconds = time.perf_counter() - started
+
+    head = initial_head(model.classifier, old_classes, classes)
+    started = time.perf_counter()
+    history = train_head(head, features['train_file'], targets['train_file'],
+                         features['val_file'], targets['val_file'], settings)
+    head_seconds = time.perf_counter() - started
+
+    with torch.no_grad():
+        test_predictions = head(torch.from_numpy(features['test_file'])).argmax(dim=1).numpy()
+    report = classification_report(targets['test_file'], test_predictions, labels=np.arange(len(classes)),
+                                   target_names=classes, output_dict=True, zero_division=0)
+
+    # Merge: the fine-tuned encoder with the new head is an ordinary checkpoint
+    model.classifier = head
+    model.num_labels = len(classes)
+    model.config.num_labels = len(classes)
+    model.config.id2label = dict(enumerate(classes))
+    model.config.label2id = class_ids
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    model.save_pretrained(output_dir)
+    tokenizer.model_max_length = max_length
+    tokenizer.save_pretrained(output_dir)
+    save_sequence_length({'max_length': max_length}, output_dir)
+    with open(output_dir / "label_encoder.json", 'w') as f:
+        json.dump({'classes': classes, 'category_to_id': class_ids}, f, indent=2)
+    with open(output_dir / "classification_report.json", 'w') as f:
+        json.dump(report, f, indent=2)
+
+    summary = {
+        'model_dir': str(model_dir),
+        'classes': classes,
+        'categories_added': added,
+        'categories_removed': removed,
+        'embedding_seconds': embedding_seconds,
+        'head_seconds': head_seconds,
+        'test_accuracy': report['accuracy'],
+        'test_f1_weighted': report['weighted avg']['f1-score'],
+        **history,
+    }
+    with open(output_dir / "head_retrain.json", 'w') as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Head trained in {head_seconds:.1f}s (encoding {embedding_seconds:.1f}s): "
+                f"val accuracy {history['val_accuracy']:.4f}, test accuracy {report['accuracy']:.4f}; "
+                f"saved to {output_dir}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain only the classification head on cached embeddings")
+    parser.add_argument("--config", default="config.yaml", help="Training config")
+    parser.add_argument("--model-dir", help="Fine-tuned model whose encoder is frozen")
+    parser.add_argument("--output-dir", help="Where to write the merged checkpoint")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    retrain_head(config, args.model_dir, args.output_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
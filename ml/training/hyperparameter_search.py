@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Parallel hyperparameter search for the activity classifier.
+Runs ActivityClassificationTrainer trials in a process pool, each worker
+pinned to its own subset of CPU cores, stops trials whose intermediate
+validation metric falls below the median of the other trials, and writes
+the best hyperparameters back out as a training config.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import math
+import multiprocessing as mp
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the optional `hyperparameter_search` section of config.yaml
+DEFAULT_SETTINGS = {
+    'trials': 16,
+    'parallel_trials': 2,
+    'threads_per_trial': 0,  # 0 splits the available cores evenly between parallel trials
+    'output_dir': "../models/hpo",
+    'best_config': "config.best.yaml",
+    'seed': 42,
+    'pruning': {
+        'startup_trials': 2,
+        'warmup_evaluations': 1,
+    },
+    'space': {
+        'learning_rate': {'type': 'log_uniform', 'low': 1.0e-5, 'high': 1.0e-4},
+        'batch_size': {'type': 'choice', 'values': [8, 16, 32]},
+        'warmup_steps': {'type': 'int', 'low': 0, 'high': 300},
+        'weight_decay': {'type': 'uniform', 'low': 0.0, 'high': 0.1},
+    },
+}
+
+
+def search_settings(config: Dict) -> Dict:
+    """The `hyperparameter_search` config section merged over the defaults."""
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    for key, value in (config.get('hyperparameter_search') or {}).items():
+        if key == 'pruning':
+            settings[key].update(value)
+        else:
+            # A configured search space replaces the default one entirely
+            settings[key] = value
+    return settings
+
+
+def sample_params(space: Dict[str, Dict], rng: np.random.Generator) -> Dict:
+    """Draw one value for every training parameter in the search space."""
+    params = {}
+    for name, spec in space.items():
+        kind = spec['type']
+        if kind == 'log_uniform':
+            params[name] = float(math.exp(rng.uniform(math.log(spec['low']), math.log(spec['high']))))
+        elif kind == 'uniform':
+            params[name] = float(rng.uniform(spec['low'], spec['high']))
+        elif kind == 'int':
+            params[name] = int(rng.integers(spec['low'], spec['high'] + 1))
+        elif kind == 'choice':
+            params[name] = spec['values'][int(rng.integers(len(spec['values'])))]
+        else:
+            raise ValueError(f"Unknown search space type '{kind}' for {name}")
+    return params
+
+
+def core_groups(parallel_trials: int, threads_per_trial: int = 0) -> List[List[int]]:
+    """Disjoint core sets, one per parallel trial (shared round-robin if there are too few cores)."""
+    cores = sorted(os.sched_getaffinity(0))
+    per_trial = threads_per_trial or max(1, len(cores) // parallel_trials)
+    if per_trial * parallel_trials > len(cores):
+        logger.warning(f"{parallel_trials} trials x {per_trial} threads oversubscribes {len(cores)} cores")
+    return [
+        [cores[(trial * per_trial + i) % len(cores)] for i in range(per_trial)]
+        for trial in range(parallel_trials)
+    ]
+
+
+class MedianPruner:
+    """Stops a trial whose best metric so far is worse than the median of other trials at the same evaluation.
+
+    Intermediate values go to one JSON-lines file per trial in the study
+    directory, so trials in different processes see each other's progress
+    without any shared state beyond the file system.
+    """
+
+    def __init__(self, study_dir: Path, greater_is_better: bool = True,
+                 startup_trials: int = 2, warmup_evaluations: int = 1):
+        self.path = Path(study_dir) / "intermediate"
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.greater_is_better = greater_is_better
+        self.startup_trials = startup_trials
+        self.warmup_evaluations = warmup_evaluations
+
+    def _best(self, values: List[float]) -> float:
+        return max(values) if self.greater_is_better else min(values)
+
+    def report(self, trial_id: int, evaluation: int, value: float):
+        with open(self.path / f"{trial_id}.jsonl", 'a') as f:
+            f.write(json.dumps({'evaluation': evaluation, 'value': value}) + "\n")
+
+    def should_prune(self, trial_id: int, evaluation: int, values: List[float]) -> bool:
+        if evaluation < self.warmup_evaluations:
+            return False
+
+        others = []
+        for path in self.path.glob("*.jsonl"):
+            if path.stem == str(trial_id):
+                continue
+            with open(path, 'r') as f:
+                other_values = [json.loads(line)['value'] for line in f if line.strip()]
+            if len(other_values) > evaluation:
+                others.append(self._best(other_values[:evaluation + 1]))
+        if len(others) < self.startup_trials:
+            return False
+
+        median = float(np.median(others))
+        best = self._best(values)
+        return best < median if self.greater_is_better else best > median
+
+
+def _pruning_callback(pruner: MedianPruner, trial_id: int, metric: str):
+    from transformers import TrainerCallback
+
+    class PruningCallback(TrainerCallback):
+        """Reports each validation metric to the pruner and stops training when told to."""
+
+        def __init__(self):
+            self.values = []
+            self.pruned = False
+
+        def on_evaluate(self, args, state, control, metrics=None, **kwargs):
+            value = (metrics or {}).get(f"eval_{metric}")
+            if value is None:
+                return
+            evaluation = len(self.values)
+            self.values.append(float(value))
+            pruner.report(trial_id, evaluation, float(value))
+            if pruner.should_prune(trial_id, evaluation, self.values):
+                logger.info(f"Pruning trial {trial_id} at evaluation {evaluation} ({metric}={value:.4f})")
+                self.pruned = True
+                control.should_training_stop = True
+
+    return PruningCallback()
+
+
+def trial_config(config: Dict, params: Dict, trial_dir: Path) -> Dict:
+    """Training config for one trial: sampled parameters, its own output dir, no checkpoints."""
+    config = copy.deepcopy(config)
+    config['training'].update(params)
+    config['output']['output_dir'] = str(trial_dir)
+    config['output']['logging_dir'] = str(trial_dir / "logs")
+    # Trials only need the validation curve, not saved checkpoints
+    config['validation']['save_strategy'] = "no"
+    config['validation']['load_best_model_at_end'] = False
+    # The worker's pinned cores are for the model, not for data loader processes
+    config['training']['dataloader_num_workers'] = 0
+    return config
+
+
+def _init_worker(core_queue):
+    import torch
+
+    cores = core_queue.get()
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    logger.info(f"Worker {os.getpid()} pinned to cores {cores}")
+
+
+def _run_trial(task: Dict) -> Dict:
+    from train_model import ActivityClassificationTrainer, ActivityTrainer
+
+    trial_id, params, trial_dir = task['trial_id'], task['params'], Path(task['trial_dir'])
+    trial_dir.mkdir(parents=True, exist_ok=True)
+    config_path = trial_dir / "config.yaml"
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(task['config'], f, sort_keys=False)
+
+    result = {'trial': trial_id, 'params': params, 'cores': sorted(os.sched_getaffinity(0))}
+    started = time.perf_counter()
+    try:
+        trainer = ActivityClassificationTrainer(str(config_path))
+        train_df, val_df, test_df = trainer.load_data()
+        trainer.prepare_model_and_tokenizer()
+        train_dataset, val_dataset, _ = trainer.prepare_datasets(train_df, val_df, test_df)
+
+        metric = trainer.config['validation']['metric_for_best_model']
+        pruner = MedianPruner(trial_dir.parent, trainer.config['validation']['greater_is_better'],
+                              **task['pruning'])
+        pruning = _pruning_callback(pruner, trial_id, metric)
+        ActivityTrainer(
+            model=trainer.model,
+            args=trainer._training_arguments(),
+            train_dataset=train_dataset,
+            eval_dataset=val_dataset,
+            data_collator=trainer._data_collator(),
+            compute_metrics=trainer.compute_metrics,
+            callbacks=[trainer._early_stopping(), pruning]
+        ).train()
+
+        result['status'] = "pruned" if pruning.pruned else "complete"
+        result['evaluations'] = pruning.values
+        result['value'] = pruner._best(pruning.values) if pruning.values else None
+    except Exception as e:
+        # One diverging or crashing trial should not end the study
+        logger.exception(f"Trial {trial_id} failed")
+        result['status'] = "failed"
+        result['error'] = repr(e)
+        result['value'] = None
+    result['runtime_s'] = time.perf_counter() - started
+    return result
+
+
+def prepare_shared_cache(config: Dict):
+    """Resolve max_length and tokenize every data file once, before any trial starts."""
+    from transformers import AutoTokenizer
+    from sequence_length import resolve_max_length
+    from token_cache import TokenCache
+
+    tokenizer = AutoTokenizer.from_pretrained(config['model']['name'])
+    max_length = resolve_max_length(config, tokenizer)
+    cache_dir = config['data'].get('cache_dir')
+    if cache_dir:
+        for key in ('train_file', 'val_file', 'test_file'):
+            TokenCache.build(cache_dir, tokenizer, max_length, config['data'][key],
+                             text_column=config['data']['text_column'])
+
+
+def run_search(config_path: str, trials: Optional[int] = None, parallel_trials: Optional[int] = None,
+               threads_per_trial: Optional[int] = None, output_config: Optional[str] = None) -> Dict:
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    settings = search_settings(config)
+    for key, value in (('trials', trials), ('parallel_trials', parallel_trials),
+                       ('threads_per_trial', threads_per_trial), ('best_config', output_config)):
+        if value is not None:
+            settings[key] = value
+
+    study_dir = Path(settings['output_dir'])
+    study_dir.mkdir(parents=True, exist_ok=True)
+    # Intermediate values from an earlier study would skew the pruner
+    shutil.rmtree(study_dir / "intermediate", ignore_errors=True)
+    prepare_shared_cache(config)
+
+    rng = np.random.default_rng(np.random.SeedSequence(settings['seed']))
+    tasks = []
+    for trial_id in range(settings['trials']):
+        params = sample_params(settings['space'], rng)
+        trial_dir = study_dir / f"trial_{trial_id:03d}"
+        tasks.append({
+            'trial_id': trial_id, 'params': params, 'trial_dir': str(trial_dir),
+            'config': trial_config(config, params, trial_dir), 'pruning': settings['pruning'],
+        })
+
+    # Spawned workers start without the parent's torch thread pools
+    context = mp.get_context("spawn")
+    core_queue = context.Queue()
+    for cores in core_groups(settings['parallel_trials'], settings['threads_per_trial']):
+        core_queue.put(cores)
+
+    greater_is_better = config['validation']['greater_is_better']
+    metric = config['validation']['metric_for_best_model']
+    results = []
+    with ProcessPoolExecutor(max_workers=settings['parallel_trials'], mp_context=context,
+                             initializer=_init_worker, initargs=(core_queue,)) as executor:
+        futures = [executor.submit(_run_trial, task) for task in tasks]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            value = f"{result['value']:.4f}" if result['value'] is not None else "-"
+            logger.info(f"Trial {result['trial']} {result['status']}: {metric}={value} "
+                        f"in {result['runtime_s']:.0f}s {result['params']}")
+
+    results.sort(key=lambda result: result['trial'])
+    scored = [result for result in results if result['status'] == "complete" and result['value'] is not None]
+    if not scored:
+        raise RuntimeError(f"No trial completed; see {study_dir}")
+    best = (max if greater_is_better else min)(scored, key=lambda result: result['value'])
+
+    best_config = copy.deepcopy(config)
+    best_config['training'].update(best['params'])
+    with open(settings['best_config'], 'w') as f:
+        yaml.safe_dump(best_config, f, sort_keys=False)
+
+    summary = {'metric': metric, 'best_trial': best['trial'], 'best_value': best['value'],
+               'best_params': best['params'], 'trials': results}
+    with open(study_dir / "study.json", 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    pruned = sum(result['status'] == "pruned" for result in results)
+    logger.info(f"Best trial {best['trial']}: {metric}={best['value']:.4f} {best['params']} "
+                f"({pruned}/{len(results)} trials pruned); config written to {settings['best_config']}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter search with median pruning")
+    parser.add_argument("--config", default="config.yaml", help="Base training config")
+    parser.add_argument("--trials", type=int, help="Number of trials")
+    parser.add_argument("--parallel", type=int, help="Trials run at once")
+    parser.add_argument("--threads-per-trial", type=int, help="Cores pinned to each trial (0 = split evenly)")
+    parser.add_argument("--output-config", help="Where to write the best config")
+    args = parser.parse_args()
+
+    run_search(args.config, args.trials, args.parallel, args.threads_per_trial, args.output_config)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Structured pruning of a fine-tuned model under an accuracy budget.
+Scores attention heads and FFN neurons by first-order Taylor importance on
+the validation set, removes the least important ones a step at a time with
+a short recovery fine-tune after each step, and stops before validation
+accuracy drops more than the allowed amount. Pruned weights are physically
+removed, and the saved checkpoint reloads (and converts) like any other.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from transformers.pytorch_utils import prune_linear_layer
+
+from sequence_length import resolve_max_length, save_sequence_length
+from train_model import ActivityClassificationTrainer, DynamicPaddingCollator
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the optional `pruning` section of config.yaml
+DEFAULT_SETTINGS = {
+    'model_dir': "../models/fine_tuned",
+    'output_dir': "../models/pruned",
+    'max_accuracy_drop': 0.01,
+    'head_step': 0.1,
+    'ffn_step': 0.1,
+    'min_heads_per_layer': 1,
+    'recovery_steps': 100,
+    'recovery_learning_rate': 0.00003,
+    'max_iterations': 20,
+    'latency_samples': 100,
+}
+
+
+def encoder_layers(model):
+    return model.base_model.encoder.layer
+
+
+def taylor_importance(model, loader: DataLoader) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """Per-layer head and FFN-neuron importance: |sum of weight × gradient| over each unit, summed over batches."""
+    layers = encoder_layers(model)
+    heads = [np.zeros(layer.attention.self.num_attention_heads) for layer in layers]
+    neurons = [np.zeros(layer.intermediate.dense.out_features) for layer in layers]
+
+    # Eval mode keeps dropout out of the scores; gradients are still needed
+    model.eval()
+    for batch in loader:
+        model.zero_grad()
+        model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask'], labels=batch['labels']).loss.backward()
+
+        with torch.no_grad():
+            for l, layer in enumerate(layers):
+                attention = layer.attention.self
+                shape = (attention.num_attention_heads, attention.attention_head_size)
+                output = layer.attention.output.dense
+                contribution = (output.weight * output.weight.grad).sum(dim=0).view(shape).sum(dim=1)
+                for projection in (attention.query, attention.key, attention.value):
+                    contribution += (projection.weight * projection.weight.grad).sum(dim=1).view(shape).sum(dim=1)
+                    contribution += (projection.bias * projection.bias.grad).view(shape).sum(dim=1)
+                heads[l] += contribution.abs().numpy()
+
+                intermediate, ffn_output = layer.intermediate.dense, layer.output.dense
+                contribution = (intermediate.weight * intermediate.weight.grad).sum(dim=1)
+                contribution += intermediate.bias * intermediate.bias.grad
+                contribution += (ffn_output.weight * ffn_output.weight.grad).sum(dim=0)
+                neurons[l] += contribution.abs().numpy()
+    model.zero_grad()
+    return heads, neurons
+
+
+def heads_to_prune(model, head_scores: List[np.ndarray], count: int, min_per_layer: int) -> Dict[int, List[int]]:
+    """The `count` globally least important heads, as original head indices per layer.
+
+    Scores are normalized per layer, since gradient magnitudes differ
+    between layers; every layer keeps at least `min_per_layer` heads.
+    """
+    candidates = []
+    for l, (layer, scores) in enumerate(zip(encoder_layers(model), head_scores)):
+        normalized = scores / (np.linalg.norm(scores) or 1.0)
+        # prune_heads takes indices into the original, unpruned heads
+        original = [h for h in range(model.config.num_attention_heads) if h not in layer.attention.pruned_heads]
+        candidates.extend((normalized[j], l, original[j]) for j in range(len(original)))
+
+    remaining = {l: layer.attention.self.num_attention_heads for l, layer in enumerate(encoder_layers(model))}
+    selected = {}
+    for _, l, head in sorted(candidates):
+        if count == 0:
+            break
+        if remaining[l] > min_per_layer:
+            selected.setdefault(l, []).append(head)
+            remaining[l] -= 1
+            count -= 1
+    return selected
+
+
+def prune_ffn(model, neuron_scores: List[np.ndarray], keep: int):
+    """Keep the `keep` most important intermediate neurons in every layer.
+
+    Every layer keeps the same number, so the result is still described by a
+    single config.intermediate_size and reloads with from_pretrained.
+    """
+    for layer, scores in zip(encoder_layers(model), neuron_scores):
+        index = torch.from_numpy(np.sort(np.argsort(scores)[-keep:]))
+        layer.intermediate.dense = prune_linear_layer(layer.intermediate.dense, index, dim=0)
+        layer.output.dense = prune_linear_layer(layer.output.dense, index, dim=1)
+    model.config.intermediate_size = keep
+
+
+def accuracy(model, loader: DataLoader) -> float:
+    model.eval()
+    correct = total = 0
+    with torch.inference_mode():
+        for batch in loader:
+            logits = model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask']).logits
+            correct += int((logits.argmax(dim=1) == batch['labels']).sum())
+            total += len(batch['labels'])
+    return correct / total
+
+
+def recover(model, loader: DataLoader, steps: int, learning_rate: float):
+    """Short fine-tune after a pruning step."""
+    model.train()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate)
+    step = 0
+    while step < steps:
+        for batch in loader:
+            optimizer.zero_grad()
+            model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask'],
+                  labels=batch['labels']).loss.backward()
+            optimizer.step()
+            step += 1
+            if step == steps:
+                break
+    model.eval()
+
+
+def model_size_mb(model) -> float:
+    """Parameter and buffer bytes, as MobileModelConverter._get_pytorch_model_size counts them."""
+    total = sum(p.nelement() * p.element_size() for p in model.parameters())
+    total += sum(b.nelement() * b.element_size() for b in model.buffers())
+    return total / 1024**2
+
+
+def latency_ms(model, dataset, collator: DynamicPaddingCollator, samples: int) -> Dict:
+    """Single-example latency at the fixed export length, as the mobile benchmarks measure it."""
+    model.eval()
+    times = []
+    with torch.inference_mode():
+        for i in range(min(samples, len(dataset))):
+            batch = collator([dataset[i]])
+            start = time.perf_counter()
+            model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask'])
+            times.append((time.perf_counter() - start) * 1000)
+    return {'mean_latency_ms': float(np.mean(times)), 'p95_latency_ms': float(np.percentile(times, 95))}
+
+
+def describe(model) -> Dict:
+    layers = encoder_layers(model)
+    return {
+        'heads_per_layer': [layer.attention.self.num_attention_heads for layer in layers],
+        'intermediate_size': model.config.intermediate_size,
+        'parameters': int(sum(p.numel() for p in model.parameters())),
+        'model_size_mb': model_size_mb(model),
+    }
+
+
+def prune(config_path: str, max_accuracy_drop: float = None) -> Dict:
+    trainer = ActivityClassificationTrainer(config_path)
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(trainer.config.get('pruning') or {})
+    if max_accuracy_drop is not None:
+        settings['max_accuracy_drop'] = max_accuracy_drop
+    model_dir, output_dir = Path(settings['model_dir']), Path(settings['output_dir'])
+
+    trainer.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    trainer.max_length = resolve_max_length(trainer.config, trainer.tokenizer, model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+
+    train_dataset, val_dataset, test_dataset = trainer.prepare_datasets(*trainer.load_data())
+    with open(model_dir / "label_encoder.json", 'r') as f:
+        if json.load(f)['classes'] != trainer.label_encoder.classes_.tolist():
+            raise ValueError(f"Labels in the data do not match {model_dir}")
+
+    collator = trainer._data_collator()
+    batch_size = trainer.config['training']['batch_size']
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, collate_fn=collator)
+    val_loader = DataLoader(val_dataset, batch_size=batch_size * 4, collate_fn=collator)
+    test_loader = DataLoader(test_dataset, batch_size=batch_size * 4, collate_fn=collator)
+    export_collator = DynamicPaddingCollator(trainer.tokenizer.pad_token_id, trainer.max_length)
+
+    baseline = accuracy(model, val_loader)
+    floor = baseline - settings['max_accuracy_drop']
+    before = {**describe(model), 'val_accuracy': baseline, 'test_accuracy': accuracy(model, test_loader),
+              **latency_ms(model, test_dataset, export_collator, settings['latency_samples'])}
+    logger.info(f"Unpruned: val accuracy {baseline:.4f}, {before['parameters'] / 1e6:.2f}M parameters; "
+                f"accuracy floor {floor:.4f}")
+
+    head_step, ffn_step = settings['head_step'], settings['ffn_step']
+    iterations = []
+    for iteration in range(1, settings['max_iterations'] + 1):
+        head_scores, neuron_scores = taylor_importance(model, val_loader)
+        total_heads = sum(len(scores) for scores in head_scores)
+        head_count = int(total_heads * head_step)
+        keep = model.config.intermediate_size - int(model.config.intermediate_size * ffn_step)
+        selected = heads_to_prune(model, head_scores, head_count, settings['min_heads_per_layer'])
+        if not selected and keep == model.config.intermediate_size:
+            logger.info("Steps too small to remove anything more")
+            break
+
+        candidate = copy.deepcopy(model)
+        if selected:
+            candidate.prune_heads(selected)
+        if keep < candidate.config.intermediate_size:
+            prune_ffn(candidate, neuron_scores, keep)
+        recover(candidate, train_loader, settings['recovery_steps'], settings['recovery_learning_rate'])
+        candidate_accuracy = accuracy(candidate, val_loader)
+
+        accepted = candidate_accuracy >= floor
+        iterations.append({
+            'iteration': iteration, 'heads_removed': sum(len(heads) for heads in selected.values()),
+            'intermediate_size': keep, 'val_accuracy': candidate_accuracy, 'accepted': accepted,
+            **describe(candidate),
+        })
+        logger.info(f"Iteration {iteration}: heads {describe(candidate)['heads_per_layer']}, "
+                    f"intermediate {keep}, val accuracy {candidate_accuracy:.4f} "
+                    f"({'kept' if accepted else 'rejected'})")
+        if accepted:
+            model = candidate
+        else:
+            # Retry with smaller steps from the last accepted model
+            head_step, ffn_step = head_step / 2, ffn_step / 2
+
+    after = {**describe(model), 'val_accuracy': accuracy(model, val_loader),
+             'test_accuracy': accuracy(model, test_loader),
+             **latency_ms(model, test_dataset, export_collator, settings['latency_samples'])}
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    model.save_pretrained(output_dir)
+    trainer.tokenizer.model_max_length = trainer.max_length
+    trainer.tokenizer.save_pretrained(output_dir)
+    save_sequence_length({'max_length': trainer.max_length}, output_dir)
+    shutil.copy(model_dir / "label_encoder.json", output_dir / "label_encoder.json")
+
+    report = {
+        'model_dir': str(model_dir),
+        'max_accuracy_drop': settings['max_accuracy_drop'],
+        'before': before,
+        'after': after,
+        'parameter_ratio': after['parameters'] / before['parameters'],
+        'speedup': before['mean_latency_ms'] / after['mean_latency_ms'],
+        'iterations': iterations,
+    }
+    with open(output_dir / "pruning_report.json", 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Pruned model saved to {output_dir}: {report['parameter_ratio']:.1%} of the parameters, "
+                f"{report['speedup']:.2f}x faster, val accuracy {before['val_accuracy']:.4f} -> "
+                f"{after['val_accuracy']:.4f}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune attention heads and FFN neurons under an accuracy budget")
+    parser.add_argument("--config", default="config.yaml", help="Training config")
+    parser.add_argument("--max-accuracy-drop", type=float,
+                        help="Largest allowed fall in validation accuracy (absolute, e.g. 0.01)")
+    args = parser.parse_args()
+    prune(args.config, args.max_accuracy_drop)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Corpus-driven vocabulary pruning.
+Tokenizes every corpus the model is trained and evaluated on, keeps the
+WordPiece tokens that actually occur (plus special tokens and, as a safety
+margin, every single-character piece so unseen words still split into
+characters rather than [UNK]), and slices the word-embedding matrix to
+match. The tokenizer and the exported vocab.json are remapped with it, and
+the corpora tokenize to exactly the same pieces as before.
+"""
+
+import argparse
+import json
+import logging
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import yaml
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from fake_quant import QUANTIZATION_FILE
+from sequence_length import resolve_max_length, save_sequence_length
+from token_cache import TOKENIZE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 50_000
+CONVERTER = Path(__file__).resolve().parent.parent / "scripts" / "convert_to_mobile.py"
+WEIGHT_FILES = ("model.safetensors", "pytorch_model.bin")
+
+# Defaults for the optional `vocab_pruning` section of config.yaml
+DEFAULT_SETTINGS = {
+    'model_dir': "../models/fine_tuned",
+    'output_dir': "../models/vocab_pruned",
+    'extra_files': [],
+    'min_count': 1,
+    'keep_characters': True,
+    'load_repeats': 5,
+}
+
+
+def corpus_token_counts(tokenizer, files: List[str], text_column: str) -> np.ndarray:
+    """How often each vocabulary id occurs across the text column of every file."""
+    counts = np.zeros(len(tokenizer), dtype=np.int64)
+    for path in files:
+        for frame in pd.read_csv(path, usecols=[text_column], chunksize=CHUNK_SIZE):
+            texts = frame[text_column].astype(str).tolist()
+            for start in range(0, len(texts), TOKENIZE_BATCH_SIZE):
+                ids = tokenizer(texts[start:start + TOKENIZE_BATCH_SIZE], add_special_tokens=False)['input_ids']
+                if ids:
+                    counts += np.bincount(np.concatenate([np.asarray(row, dtype=np.int64) for row in ids]),
+                                          minlength=len(counts))
+    return counts
+
+
+def kept_token_ids(tokenizer, counts: np.ndarray, min_count: int, keep_characters: bool) -> np.ndarray:
+    """Sorted ids to keep: corpus tokens, special tokens and (optionally) single-character pieces."""
+    keep = counts >= min_count
+    keep[tokenizer.all_special_ids] = True
+    if keep_characters:
+        for token, token_id in tokenizer.get_vocab().items():
+            if len(token) == 1 or (token.startswith("##") and len(token) == 3):
+                keep[token_id] = True
+    return np.flatnonzero(keep)
+
+
+def prune_embeddings(model, kept_ids: np.ndarray):
+    """Keep only the kept rows of the word-embedding matrix, in their original order."""
+    old = model.get_input_embeddings()
+    index = torch.from_numpy(kept_ids)
+    remap = {int(old_id): new_id for new_id, old_id in enumerate(kept_ids)}
+    padding_idx = remap.get(old.padding_idx) if old.padding_idx is not None else None
+
+    new = nn.Embedding(len(kept_ids), old.embedding_dim, padding_idx=padding_idx)
+    with torch.no_grad():
+        new.weight.copy_(old.weight[index])
+    model.set_input_embeddings(new)
+    model.config.vocab_size = len(kept_ids)
+    if model.config.pad_token_id is not None:
+        model.config.pad_token_id = remap[model.config.pad_token_id]
+
+
+def remap_tokenizer(tokenizer, kept_ids: np.ndarray, output_dir: Path):
+    """Save a tokenizer whose vocab.txt holds only the kept tokens, and load it back."""
+    id_to_token = {token_id: token for token, token_id in tokenizer.get_vocab().items()}
+    tokenizer.save_pretrained(output_dir)
+    with open(output_dir / "vocab.txt", 'w', encoding='utf-8') as f:
+        f.writelines(f"{id_to_token[int(token_id)]}\n" for token_id in kept_ids)
+
+    # Special tokens are pinned to their ids in tokenizer_config.json
+    remap = {str(old_id): str(new_id) for new_id, old_id in enumerate(kept_ids)}
+    config_path = output_dir / "tokenizer_config.json"
+    with open(config_path, 'r') as f:
+        tokenizer_config = json.load(f)
+    tokenizer_config['added_tokens_decoder'] = {
+        remap[old_id]: token for old_id, token in tokenizer_config.get('added_tokens_decoder', {}).items()
+        if old_id in remap
+    }
+    with open(config_path, 'w') as f:
+        json.dump(tokenizer_config, f, indent=2)
+
+    # The fast tokenizer file embeds the old vocabulary; it is rebuilt from vocab.txt
+    (output_dir / "tokenizer.json").unlink(missing_ok=True)
+    remapped = AutoTokenizer.from_pretrained(output_dir)
+    remapped.save_pretrained(output_dir)
+    return remapped
+
+
+def mismatched_texts(old_tokenizer, new_tokenizer, kept_ids: np.ndarray, texts: List[str]) -> int:
+    """How many texts tokenize differently after remapping (0 for every corpus the vocabulary came from)."""
+    old_to_new = np.full(len(old_tokenizer), -1, dtype=np.int64)
+    old_to_new[kept_ids] = np.arange(len(kept_ids))
+    mismatches = 0
+    for start in range(0, len(texts), TOKENIZE_BATCH_SIZE):
+        batch = texts[start:start + TOKENIZE_BATCH_SIZE]
+        for old_ids, new_ids in zip(old_tokenizer(batch)['input_ids'], new_tokenizer(batch)['input_ids']):
+            if old_to_new[old_ids].tolist() != new_ids:
+                mismatches += 1
+    return mismatches
+
+
+def checkpoint_stats(model_dir: Path, repeats: int) -> Dict:
+    """On-disk weight size and median from_pretrained time for a saved model."""
+    weights = next(model_dir / name for name in WEIGHT_FILES if (model_dir / name).exists())
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        AutoModelForSequenceClassification.from_pretrained(model_dir)
+        times.append((time.perf_counter() - start) * 1000)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    vocab = dict(sorted(tokenizer.get_vocab().items(), key=lambda x: x[1]))
+    return {
+        'vocab_size': len(tokenizer),
+        'model_size_mb': weights.stat().st_size / 1024**2,
+        'load_time_ms': statistics.median(times),
+        # vocab.json as convert_to_mobile.create_android_assets writes it
+        'vocab_json_kb': len(json.dumps(vocab, separators=(',', ':')).encode('utf-8')) / 1024,
+    }
+
+
+def compare_exports(config_path: str, model_dirs: Dict[str, Path], output_dir: Path) -> Dict:
+    """Convert each model with convert_to_mobile.py and compare size and load time per export format."""
+    results = {}
+    for name, model_dir in model_dirs.items():
+        export_dir = output_dir / "exports" / name
+        export_dir.mkdir(parents=True, exist_ok=True)
+        subprocess.run(
+            [sys.executable, str(CONVERTER), str(Path(config_path).resolve()), str(model_dir.resolve()),
+             "--output-dir", str(export_dir.resolve()), "--skip-android-assets"],
+            cwd=CONVERTER.parent, check=True
+        )
+        with open(export_dir / "benchmark_results.json", 'r') as f:
+            results[name] = json.load(f)['backends']
+
+    formats = {}
+    for export_format, before in results['original'].items():
+        after = results['pruned'].get(export_format)
+        if after is None:
+            continue
+        formats[export_format] = {
+            metric: {'original': before.get(metric), 'pruned': after.get(metric),
+                     'reduction': 1 - after[metric] / before[metric]
+                     if before.get(metric) and after.get(metric) is not None else None}
+            for metric in ('model_size_mb', 'load_time_ms', 'mean_latency_ms')
+        }
+    return formats
+
+
+def prune_vocabulary(config_path: str, model_dir: Optional[str] = None, output_dir: Optional[str] = None,
+                     export_comparison: bool = False) -> Dict:
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get('vocab_pruning') or {})
+    model_dir = Path(model_dir or settings['model_dir'])
+    output_dir = Path(output_dir or settings['output_dir'])
+    data = config['data']
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    max_length = resolve_max_length(config, tokenizer, model_dir)
+
+    files = [data['train_file'], data['val_file'], data['test_file'], *settings['extra_files']]
+    counts = corpus_token_counts(tokenizer, files, data['text_column'])
+    kept_ids = kept_token_ids(tokenizer, counts, settings['min_count'], settings['keep_characters'])
+    logger.info(f"Keeping {len(kept_ids)} of {len(tokenizer)} tokens "
+                f"({int((counts >= settings['min_count']).sum())} seen in {len(files)} files)")
+
+    parameters_before = sum(p.numel() for p in model.parameters())
+    prune_embeddings(model, kept_ids)
+    parameters_after = sum(p.numel() for p in model.parameters())
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    model.save_pretrained(output_dir)
+    tokenizer.model_max_length = max_length
+    new_tokenizer = remap_tokenizer(tokenizer, kept_ids, output_dir)
+    save_sequence_length({'max_length': max_length}, output_dir)
+    for name in ("label_encoder.json", QUANTIZATION_FILE):
+        if (model_dir / name).exists():
+            shutil.copy(model_dir / name, output_dir / name)
+
+    texts = [text for path in files
+             for text in pd.read_csv(path, usecols=[data['text_column']])[data['text_column']].astype(str)]
+    mismatches = mismatched_texts(tokenizer, new_tokenizer, kept_ids, texts)
+    if mismatches:
+        raise RuntimeError(f"{mismatches} corpus texts tokenize differently after remapping")
+
+    report = {
+        'model_dir': str(model_dir),
+        'corpora': [str(path) for path in files],
+        'settings': {key: settings[key] for key in ('min_count', 'keep_characters')},
+        'vocab_size': {'original': len(tokenizer), 'pruned': len(kept_ids)},
+        'parameters': {'original': parameters_before, 'pruned': parameters_after},
+        'checked_texts': len(texts),
+        'pytorch': {'original': checkpoint_stats(model_dir, settings['load_repeats']),
+                    'pruned': checkpoint_stats(output_dir, settings['load_repeats'])},
+    }
+    if export_comparison:
+        report['exports'] = compare_exports(config_path, {'original': model_dir, 'pruned': output_dir}, output_dir)
+
+    with open(output_dir / "vocab_pruning_report.json", 'w') as f:
+        json.dump(report, f, indent=2)
+
+    before, after = report['pytorch']['original'], report['pytorch']['pruned']
+    logger.info(f"Parameters {parameters_before / 1e6:.2f}M -> {parameters_after / 1e6:.2f}M; "
+                f"weights {before['model_size_mb']:.1f}MB -> {after['model_size_mb']:.1f}MB; "
+                f"load {before['load_time_ms']:.0f}ms -> {after['load_time_ms']:.0f}ms; "
+                f"vocab.json {before['vocab_json_kb']:.0f}KB -> {after['vocab_json_kb']:.0f}KB")
+    for export_format, metrics in report.get('exports', {}).items():
+        size, load = metrics['model_size_mb'], metrics['load_time_ms']
+        logger.info(f"{export_format}: {size['original']:.1f}MB -> {size['pruned']:.1f}MB, "
+                    f"load {load['original']:.0f}ms -> {load['pruned']:.0f}ms")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop vocabulary tokens the corpora never use")
+    parser.add_argument("--config", default="config.yaml", help="Training config")
+    parser.add_argument("--model-dir", help="Model to prune (default from config)")
+    parser.add_argument("--output-dir", help="Where to write the pruned model (default from config)")
+    parser.add_argument("--compare-exports", action="store_true",
+                        help="Also convert both models and compare size and load time per export format")
+    args = parser.parse_args()
+    prune_vocabulary(args.config, args.model_dir, args.output_dir, args.compare_exports)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Data-driven sequence length selection.
+Measures the token-length distribution of the training corpus and picks a
+percentile-based max_length, saved as a small JSON file that training,
+mobile conversion and the Android assets all read.
+"""
+
+import argparse
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from token_cache import TOKENIZE_BATCH_SIZE, file_digest, tokenizer_fingerprint
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_LENGTH_FILE = "sequence_length.json"
+
+# Defaults for the optional `sequence_length` section of config.yaml
+DEFAULT_SETTINGS = {
+    "percentile": 99.9,
+    "multiple_of": 8,
+    "minimum": 16,
+    "stats_file": "../data/sequence_length.json",
+}
+
+REPORTED_PERCENTILES = [50, 90, 95, 99, 99.9, 100]
+
+
+def sequence_length_settings(config: Dict) -> Dict:
+    """The `sequence_length` config section merged over the defaults."""
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get('sequence_length') or {})
+    return settings
+
+
+def token_lengths(tokenizer, texts: List[str]) -> np.ndarray:
+    """Untruncated token count of every text, special tokens included."""
+    lengths = []
+    for start in range(0, len(texts), TOKENIZE_BATCH_SIZE):
+        batch = [str(text) for text in texts[start:start + TOKENIZE_BATCH_SIZE]]
+        encoding = tokenizer(batch, truncation=False, add_special_tokens=True)
+        lengths.extend(len(ids) for ids in encoding['input_ids'])
+    return np.array(lengths, dtype=np.int32)
+
+
+def select_max_length(lengths: np.ndarray, percentile: float = 99.9, multiple_of: int = 8,
+                      minimum: int = 16, maximum: Optional[int] = None) -> int:
+    """Smallest multiple of `multiple_of` covering the given length percentile."""
+    if len(lengths) == 0:
+        raise ValueError("Cannot select a sequence length from an empty corpus")
+    target = int(np.ceil(np.percentile(lengths, percentile)))
+    max_length = max(minimum, -(-target // multiple_of) * multiple_of)
+    if maximum is not None:
+        max_length = min(max_length, maximum)
+    return int(max_length)
+
+
+def sequence_length_stats(tokenizer, data_file: Union[str, Path], text_column: str,
+                          settings: Dict) -> Dict:
+    """Measure a data file and describe the selected max_length."""
+    texts = pd.read_csv(data_file)[text_column].astype(str).tolist()
+    lengths = token_lengths(tokenizer, texts)
+    max_length = select_max_length(
+        lengths, settings['percentile'], settings['multiple_of'], settings['minimum'],
+        getattr(tokenizer, 'model_max_length', None)
+    )
+    return {
+        'max_length': max_length,
+        'percentile': settings['percentile'],
+        'multiple_of': settings['multiple_of'],
+        'minimum': settings['minimum'],
+        'num_examples': int(len(lengths)),
+        'mean_length': float(lengths.mean()),
+        'length_percentiles': {
+            str(p): float(np.percentile(lengths, p)) for p in REPORTED_PERCENTILES
+        },
+        'truncated_fraction': float((lengths > max_length).mean()),
+        'data_file': str(data_file),
+        'data_digest': file_digest(data_file),
+        'tokenizer': tokenizer_fingerprint(tokenizer),
+    }
+
+
+def load_sequence_length(path: Union[str, Path]) -> Optional[Dict]:
+    """Read a sequence length file (or a directory containing one), if it exists."""
+    path = Path(path)
+    if path.is_dir():
+        path = path / SEQUENCE_LENGTH_FILE
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_sequence_length(stats: Dict, path: Union[str, Path]):
+    path = Path(path)
+    if path.is_dir():
+        path = path / SEQUENCE_LENGTH_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
+
+
+def resolve_max_length(config: Dict, tokenizer, model_dir: Optional[Union[str, Path]] = None) -> int:
+    """The max_length to use for this config.
+
+    An integer `model.max_length` is used as is. With "auto", a trained
+    model's own sequence_length.json wins, so exports always match what the
+    model was trained on; otherwise the stats file is reused while the
+    training data and tokenizer are unchanged, and re-measured if not.
+    """
+    configured = config['model']['max_length']
+    if configured != 'auto':
+        return int(configured)
+
+    if model_dir is not None:
+        stats = load_sequence_length(model_dir)
+        if stats is not None:
+            return int(stats['max_length'])
+
+    settings = sequence_length_settings(config)
+    data_file = config['data']['train_file']
+
+    stats = load_sequence_length(settings['stats_file'])
+    if (stats is None
+            or stats.get('data_digest') != file_digest(data_file)
+            or stats.get('tokenizer') != tokenizer_fingerprint(tokenizer)
+            or any(stats.get(key) != settings[key] for key in ('percentile', 'multiple_of', 'minimum'))):
+        stats = sequence_length_stats(tokenizer, data_file, config['data']['text_column'], settings)
+        save_sequence_length(stats, settings['stats_file'])
+        logger.info(f"Measured {stats['num_examples']} examples; selected max_length={stats['max_length']} "
+                    f"({stats['truncated_fraction']:.2%} truncated)")
+
+    return int(stats['max_length'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure token lengths and select max_length")
+    parser.add_argument("--config", default="config.yaml", help="Training config")
+    parser.add_argument("--tokenizer", help="Tokenizer to measure with (default: model.name)")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    config['model']['max_length'] = 'auto'
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer or config['model']['name'])
+    max_length = resolve_max_length(config, tokenizer)
+
+    stats = load_sequence_length(sequence_length_settings(config)['stats_file'])
+    print(f"Examples: {stats['num_examples']}, mean length {stats['mean_length']:.1f} tokens")
+    for percentile, length in stats['length_percentiles'].items():
+        print(f"  p{percentile:<5} {length:>6.1f}")
+    print(f"Selected max_length: {max_length} ({stats['truncated_fraction']:.2%} of examples truncated)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
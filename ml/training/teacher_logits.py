@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Cached teacher logits for knowledge distillation.
+Runs the teacher over a dataset once and stores its logits as a memory-mapped
+.npy array, keyed by the teacher's weights, the tokenizer, max_length and the
+data file contents, so repeated student runs never re-run the teacher.
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Union
+
+import numpy as np
+import torch
+
+from token_cache import cache_key, model_fingerprint, publish_cache
+
+logger = logging.getLogger(__name__)
+
+TEACHER_LOGITS_VERSION = 1
+
+# Kept for callers that imported the model hash from here
+teacher_fingerprint = model_fingerprint
+
+
+class TeacherLogits:
+    """Memory-mapped (examples × labels) float32 teacher logits for one data file."""
+
+    def __init__(self, cache_path: Union[str, Path]):
+        self.path = Path(cache_path)
+        with open(self.path / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        self.logits = np.load(self.path / 'logits.npy', mmap_mode='c')
+
+    def __len__(self):
+        return len(self.logits)
+
+    @staticmethod
+    def compute(teacher, dataset, collator: Callable, batch_size: int = 64) -> np.ndarray:
+        """Teacher logits for every dataset item, in dataset order."""
+        # Batches of similar length pad less; rows are scattered back by index
+        order = np.argsort(dataset.lengths, kind='stable')
+        logits = None
+        teacher.eval()
+        with torch.no_grad():
+            for start in range(0, len(order), batch_size):
+                indices = order[start:start + batch_size]
+                batch = collator([dataset[int(i)] for i in indices])
+                outputs = teacher(input_ids=batch['input_ids'], attention_mask=batch['attention_mask'])
+                if logits is None:
+                    logits = np.empty((len(dataset), outputs.logits.shape[-1]), dtype=np.float32)
+                logits[indices] = outputs.logits.float().numpy()
+        return logits
+
+    @classmethod
+    def build(cls, cache_dir: Union[str, Path], teacher, teacher_dir: Union[str, Path], tokenizer,
+              max_length: int, dataset, data_file: Union[str, Path], collator: Callable,
+              text_column: str = 'user_input', batch_size: int = 64) -> 'TeacherLogits':
+        """Open the cached logits for a data file, running the teacher first if they are missing."""
+        hasher = hashlib.sha256()
+        hasher.update(f"v{TEACHER_LOGITS_VERSION}:".encode('utf-8'))
+        hasher.update(model_fingerprint(teacher_dir).encode('utf-8'))
+        hasher.update(cache_key(tokenizer, max_length, data_file, text_column).encode('utf-8'))
+        key = hasher.hexdigest()[:16]
+
+        cache_path = Path(cache_dir) / f"{Path(data_file).stem}-teacher-{key}"
+        if (cache_path / 'meta.json').exists():
+            logger.info(f"Using teacher logits {cache_path}")
+            return cls(cache_path)
+
+        logger.info(f"Computing teacher logits for {len(dataset)} examples into {cache_path}")
+        logits = cls.compute(teacher, dataset, collator, batch_size)
+
+        def write(tmp_path: Path):
+            np.save(tmp_path / 'logits.npy', logits)
+            with open(tmp_path / 'meta.json', 'w') as f:
+                json.dump({
+                    'version': TEACHER_LOGITS_VERSION,
+                    'key': key,
+                    'teacher_dir': str(teacher_dir),
+                    'data_file': str(data_file),
+                    'max_length': max_length,
+                    'num_examples': len(dataset),
+                    'num_labels': int(logits.shape[1]),
+                }, f, indent=2)
+
+        publish_cache(cache_dir, cache_path, write)
+        return cls(cache_path)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Training throughput instrumentation.
+A TrainerCallback that splits every optimizer step into dataloader wait,
+forward, backward and optimizer time, counts samples and real vs padded
+tokens, and tracks peak RSS. Windowed values go to TensorBoard at each
+logging step; a summary is written next to classification_report.json.
+"""
+
+import json
+import logging
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import torch
+from transformers import TrainerCallback
+
+logger = logging.getLogger(__name__)
+
+THROUGHPUT_FILE = "training_throughput.json"
+PHASES = ["dataloader", "forward", "backward", "optimizer"]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class ThroughputCallback(TrainerCallback):
+    """Per-step timing, sample/token throughput and peak memory for a training run.
+
+    Forward time comes from hooks on the model; backward is the rest of the
+    training step (including gradient clipping); optimizer time runs from
+    the optimizer step to the end of the step (scheduler, zero_grad).
+    Dataloader wait is the time between steps, excluding evaluation and
+    checkpointing.
+    """
+
+    def __init__(self):
+        self.steps: List[Dict[str, float]] = []
+        self._window_start = 0
+        self._writer = None
+        self._hooks = []
+        self._mark = None
+        self._step_start = None
+        self._optimizer_start = None
+        self._forward_start = None
+        self._reset_step()
+
+    def _reset_step(self):
+        self._step = {phase: 0.0 for phase in PHASES}
+        self._step.update(samples=0, real_tokens=0, padded_tokens=0)
+
+    def _now(self) -> float:
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _forward_pre_hook(self, module, args, kwargs):
+        if not module.training:
+            return
+        attention_mask = kwargs.get('attention_mask')
+        input_ids = kwargs.get('input_ids', args[0] if args else None)
+        if input_ids is not None:
+            self._step['samples'] += input_ids.shape[0]
+            self._step['padded_tokens'] += input_ids.numel()
+            self._step['real_tokens'] += (
+                int(attention_mask.sum()) if attention_mask is not None else input_ids.numel()
+            )
+        self._forward_start = self._now()
+
+    def _forward_hook(self, module, args, kwargs, output):
+        if module.training and self._forward_start is not None:
+            self._step['forward'] += self._now() - self._forward_start
+            self._forward_start = None
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        if model is not None:
+            self._hooks = [
+                model.register_forward_pre_hook(self._forward_pre_hook, with_kwargs=True),
+                model.register_forward_hook(self._forward_hook, with_kwargs=True),
+            ]
+        if state.is_world_process_zero and args.logging_dir:
+            try:
+                from torch.utils.tensorboard import SummaryWriter
+                self._writer = SummaryWriter(log_dir=args.logging_dir)
+            except ImportError:
+                logger.warning("tensorboard is not installed; throughput goes to the JSON summary only")
+        self._mark = self._now()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        now = self._now()
+        self._reset_step()
+        self._step['dataloader'] = now - self._mark
+        self._step_start = now
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        self._optimizer_start = self._now()
+        self._step['backward'] = self._optimizer_start - self._step_start - self._step['forward']
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self._mark = self._now()
+        self._step['optimizer'] = self._mark - self._optimizer_start
+        self.steps.append(dict(self._step))
+
+    # Evaluation and checkpointing happen between steps and are not dataloader wait
+    def on_evaluate(self, args, state, control, **kwargs):
+        self._mark = self._now()
+
+    def on_save(self, args, state, control, **kwargs):
+        self._mark = self._now()
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        window = self.steps[self._window_start:]
+        self._window_start = len(self.steps)
+        if window and self._writer is not None:
+            for name, value in self._summarize(window).items():
+                if isinstance(value, (int, float)):
+                    self._writer.add_scalar(f"throughput/{name}", value, state.global_step)
+            self._writer.flush()
+        self._mark = self._now()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if not self.steps or not state.is_world_process_zero:
+            return
+
+        summary = self._summarize(self.steps)
+        output_dir = Path(args.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with open(output_dir / THROUGHPUT_FILE, 'w') as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"Training throughput: {summary['samples_per_second']:.1f} samples/s, "
+                    f"{summary['real_tokens_per_second']:.0f} real tokens/s "
+                    f"({summary['padding_fraction']:.1%} padding), peak RSS {summary['peak_rss_mb']:.0f}MB")
+
+    def _summarize(self, steps: List[Dict[str, float]]) -> Dict:
+        phase_seconds = {phase: np.array([step[phase] for step in steps]) for phase in PHASES}
+        step_seconds = sum(phase_seconds.values())
+        total = float(step_seconds.sum())
+        samples = sum(step['samples'] for step in steps)
+        real_tokens = sum(step['real_tokens'] for step in steps)
+        padded_tokens = sum(step['padded_tokens'] for step in steps)
+
+        summary = {
+            'steps': len(steps),
+            'seconds': total,
+            'samples_per_second': samples / total if total else 0.0,
+            'real_tokens_per_second': real_tokens / total if total else 0.0,
+            'padded_tokens_per_second': padded_tokens / total if total else 0.0,
+            'padding_fraction': 1 - real_tokens / padded_tokens if padded_tokens else 0.0,
+            'step_ms_p50': float(np.percentile(step_seconds, 50) * 1000),
+            'step_ms_p95': float(np.percentile(step_seconds, 95) * 1000),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        for phase, seconds in phase_seconds.items():
+            summary[f'{phase}_ms_mean'] = float(seconds.mean() * 1000)
+            summary[f'{phase}_fraction'] = float(seconds.sum() / total) if total else 0.0
+        return summary
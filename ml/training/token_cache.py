@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Pre-tokenized, memory-mapped dataset cache.
+Tokenizes a data file once in batches and stores input_ids, attention_mask
+and token lengths as .npy arrays, keyed by the tokenizer files, max_length
+and the data file contents. Training and benchmarking map the same arrays.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+TOKENIZE_BATCH_SIZE = 4096
+
+# Files that determine what a saved model computes
+MODEL_FILES = ("config.json", "model.safetensors", "pytorch_model.bin")
+
+
+def _hash_file(path: Union[str, Path], hasher) -> None:
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+
+
+def file_digest(path: Union[str, Path]) -> str:
+    """sha256 of a file's contents."""
+    hasher = hashlib.sha256()
+    _hash_file(path, hasher)
+    return hasher.hexdigest()
+
+
+def model_fingerprint(model_dir: Union[str, Path]) -> str:
+    """Hash of a saved model's config and weights."""
+    hasher = hashlib.sha256()
+    for name in MODEL_FILES:
+        path = Path(model_dir) / name
+        if path.exists():
+            hasher.update(name.encode('utf-8'))
+            _hash_file(path, hasher)
+    return hasher.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Hash of the files the tokenizer would save, independent of where it was loaded from.
+
+    Fast tokenizers also save the truncation/padding left behind by their
+    last call, so those are cleared while saving.
+    """
+    backend = getattr(tokenizer, 'backend_tokenizer', None)
+    truncation = padding = None
+    if backend is not None:
+        truncation, padding = backend.truncation, backend.padding
+        backend.no_truncation()
+        backend.no_padding()
+
+    hasher = hashlib.sha256()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tokenizer.save_pretrained(tmp_dir)
+            for path in sorted(Path(tmp_dir).iterdir()):
+                hasher.update(path.name.encode('utf-8'))
+                _hash_file(path, hasher)
+    finally:
+        if truncation:
+            backend.enable_truncation(**truncation)
+        if padding:
+            backend.enable_padding(**padding)
+    return hasher.hexdigest()
+
+
+def publish_cache(cache_dir: Union[str, Path], cache_path: Path, write: Callable[[Path], None]):
+    """Fill a temporary sibling directory with `write(tmp_path)` and rename it to cache_path.
+
+    Readers never see a partial cache; if another process (e.g. a parallel
+    trial) publishes the same cache first, its copy is kept.
+    """
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(prefix=f".{cache_path.name}-", dir=cache_dir))
+    try:
+        write(tmp_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    try:
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not (cache_path / 'meta.json').exists():
+            raise
+
+
+def cache_key(tokenizer, max_length: int, data_file: Union[str, Path], text_column: str) -> str:
+    """Cache key covering tokenizer files, max_length and the data file contents."""
+    hasher = hashlib.sha256()
+    hasher.update(f"v{CACHE_VERSION}:{max_length}:{text_column}:".encode('utf-8'))
+    hasher.update(tokenizer_fingerprint(tokenizer).encode('utf-8'))
+    _hash_file(data_file, hasher)
+    return hasher.hexdigest()[:16]
+
+
+class TokenCache:
+    """Memory-mapped input_ids/attention_mask arrays for one data file."""
+
+    def __init__(self, cache_path: Union[str, Path]):
+        self.path = Path(cache_path)
+        with open(self.path / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        # Copy-on-write maps are writable views, so torch.from_numpy stays zero-copy
+        self.input_ids = np.load(self.path / 'input_ids.npy', mmap_mode='c')
+        self.attention_mask = np.load(self.path / 'attention_mask.npy', mmap_mode='c')
+        self.lengths = np.load(self.path / 'lengths.npy', mmap_mode='c')
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @property
+    def max_length(self) -> int:
+        return self.meta['max_length']
+
+    @classmethod
+    def build(cls, cache_dir: Union[str, Path], tokenizer, max_length: int,
+              data_file: Union[str, Path], texts: Optional[List[str]] = None,
+              text_column: str = 'user_input') -> 'TokenCache':
+        """Open the cache for a data file, tokenizing it first if it is missing."""
+        key = cache_key(tokenizer, max_length, data_file, text_column)
+        cache_path = Path(cache_dir) / f"{Path(data_file).stem}-{key}"
+        if (cache_path / 'meta.json').exists():
+            logger.info(f"Using token cache {cache_path}")
+            return cls(cache_path)
+
+        if texts is None:
+            import pandas as pd
+            texts = pd.read_csv(data_file)[text_column].astype(str).tolist()
+
+        logger.info(f"Tokenizing {len(texts)} examples into {cache_path}")
+
+        def write(tmp_path: Path):
+            shape = (len(texts), max_length)
+            input_ids = np.lib.format.open_memmap(tmp_path / 'input_ids.npy', mode='w+', dtype=np.int32, shape=shape)
+            attention_mask = np.lib.format.open_memmap(tmp_path / 'attention_mask.npy', mode='w+', dtype=np.int8, shape=shape)
+            lengths = np.lib.format.open_memmap(tmp_path / 'lengths.npy', mode='w+', dtype=np.int32, shape=(len(texts),))
+
+            for start in range(0, len(texts), TOKENIZE_BATCH_SIZE):
+                batch = [str(text) for text in texts[start:start + TOKENIZE_BATCH_SIZE]]
+                encoding = tokenizer(
+                    batch,
+                    truncation=True,
+                    padding='max_length',
+                    max_length=max_length,
+                    return_tensors='np'
+                )
+                end = start + len(batch)
+                input_ids[start:end] = encoding['input_ids']
+                attention_mask[start:end] = encoding['attention_mask']
+                lengths[start:end] = encoding['attention_mask'].sum(axis=1)
+
+            for array in (input_ids, attention_mask, lengths):
+                array.flush()
+            del input_ids, attention_mask, lengths
+
+            with open(tmp_path / 'meta.json', 'w') as f:
+                json.dump({
+                    'version': CACHE_VERSION,
+                    'key': key,
+                    'data_file': str(data_file),
+                    'text_column': text_column,
+                    'max_length': max_length,
+                    'num_examples': len(texts),
+                }, f, indent=2)
+
+        publish_cache(cache_dir, cache_path, write)
+        return cls(cache_path)
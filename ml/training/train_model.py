@@ -4,17 +4,22 @@ TinyBERT training script for activity classification.
 Fine-tunes TinyBERT for categorizing user activity text inputs.
 """
 
+import argparse
+import copy
 import os
 import sys
+import time
 import yaml
 import pandas as pd
 import numpy as np
 import torch
+import torch.nn.functional as F
 from torch.utils.data import Dataset, DataLoader
 from transformers import (
-    AutoTokenizer, AutoModelForSequenceClassification,
+    AutoConfig, AutoTokenizer, AutoModelForSequenceClassification,
     TrainingArguments, Trainer, EarlyStoppingCallback
 )
+from transformers.trainer_pt_utils import LengthGroupedSampler
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support, confusion_matrix
 from sklearn.preprocessing import LabelEncoder
 import matplotlib.pyplot as plt
@@ -22,46 +27,231 @@ import seaborn as sns
 from pathlib import Path
 import json
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from cpu_profile import apply_cpu_profile, cpu_settings
+from fake_quant import insert_fake_quant, remove_fake_quant, save_quantization_settings
+from throughput_callback import ThroughputCallback
+from token_cache import TokenCache
+from teacher_logits import TeacherLogits
+from sequence_length import (
+    load_sequence_length, resolve_max_length, save_sequence_length, sequence_length_settings
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Defaults for the optional `distillation` section of config.yaml
+DISTILLATION_DEFAULTS = {
+    'teacher_dir': "../models/fine_tuned",
+    'output_dir': "../models/distilled",
+    'temperature': 2.0,
+    'alpha': 0.5,
+    'student': {
+        'num_hidden_layers': 2,
+        'hidden_size': 128,
+        'num_attention_heads': 2,
+        'intermediate_size': 512,
+    },
+    'latency_samples': 100,
+}
+
+# Defaults for the optional `incremental` section of config.yaml
+INCREMENTAL_DEFAULTS = {
+    'base_model_dir': "../models/fine_tuned",
+    'output_root': "../models/incremental",
+    'replay_fraction': 0.15,  # Share of the old training set mixed in, stratified by category
+    'replay_per_new': 4,  # ...but at most this many old examples per new one
+    'replay_size': None,  # Fixed number of old examples; overrides the two settings above
+    'replay_seed': 42,
+    'learning_rate': 0.00001,
+    'num_epochs': 2,
+    'warmup_steps': 0,
+}
+
+# Defaults for the optional `qat` section of config.yaml
+QAT_DEFAULTS = {
+    'base_model_dir': "../models/fine_tuned",
+    'output_dir': "../models/qat",
+    'per_channel': True,
+    'learning_rate': 0.00002,
+    'num_epochs': 2,
+    'warmup_steps': 0,
+}
+
+
+def stratified_sample(df: pd.DataFrame, label_col: str, n: int, seed: int = 42) -> pd.DataFrame:
+    """About n rows with every label's share of df preserved (at least one row per label)."""
+    if n >= len(df):
+        return df
+    fraction = n / len(df)
+    return pd.concat([
+        group.sample(max(1, round(len(group) * fraction)), random_state=seed)
+        for _, group in df.groupby(label_col)
+    ])
+
+
+def replay_count(settings: Dict, old_examples: int, new_examples: int) -> int:
+    """Old examples to replay: replay_size if set, else replay_fraction of them capped by replay_per_new."""
+    if settings.get('replay_size') is not None:
+        return min(settings['replay_size'], old_examples)
+    return min(round(old_examples * settings['replay_fraction']), new_examples * settings['replay_per_new'])
+
+
+def next_version_dir(output_root: Path) -> Path:
+    """output_root/vNNN, one past the highest finished version (a failed run's directory is reused)."""
+    versions = [
+        int(path.parent.name[1:]) for path in output_root.glob("v[0-9]*/version.json") if path.parent.name[1:].isdigit()
+    ]
+    return output_root / f"v{max(versions, default=0) + 1:03d}"
+
 class ActivityDataset(Dataset):
-    """Dataset class for activity classification."""
+    """Dataset class for activity classification.
+    
+    Items are unpadded; DynamicPaddingCollator pads each batch to its own
+    longest row. With a TokenCache, items are zero-copy slices of the
+    memory-mapped token arrays; otherwise each text is tokenized on access.
+    Teacher logits, when set, are returned with each item for distillation.
+    """
     
     def __init__(self, texts: List[str], labels: List[str], confidences: List[float], 
-                 tokenizer, max_length: int = 128):
+                 tokenizer, max_length: int = 128, cache: Optional[TokenCache] = None):
         self.texts = texts
         self.labels = labels
         self.confidences = confidences
         self.tokenizer = tokenizer
         self.max_length = max_length
+        self.cache = cache
+        self.teacher_logits = None
+        
+        if cache is not None and len(cache) != len(texts):
+            raise ValueError(f"Token cache has {len(cache)} rows but dataset has {len(texts)}")
+        self._lengths = None
     
     def __len__(self):
         return len(self.texts)
     
+    @property
+    def lengths(self) -> List[int]:
+        """Token count of every example, used to group similar lengths into batches."""
+        if self._lengths is None:
+            if self.cache is not None:
+                self._lengths = self.cache.lengths.tolist()
+            else:
+                encoding = self.tokenizer(
+                    [str(text) for text in self.texts],
+                    truncation=True,
+                    max_length=self.max_length
+                )
+                self._lengths = [len(ids) for ids in encoding['input_ids']]
+        return self._lengths
+    
     def __getitem__(self, idx):
-        text = str(self.texts[idx])
         label = self.labels[idx]
         confidence = self.confidences[idx]
         
-        # Tokenize text
-        encoding = self.tokenizer(
-            text,
-            truncation=True,
-            padding='max_length',
-            max_length=self.max_length,
-            return_tensors='pt'
-        )
-        
-        return {
-            'input_ids': encoding['input_ids'].flatten(),
-            'attention_mask': encoding['attention_mask'].flatten(),
+        if self.cache is not None:
+            length = int(self.cache.lengths[idx])
+            input_ids = torch.from_numpy(self.cache.input_ids[idx, :length])
+            attention_mask = torch.from_numpy(self.cache.attention_mask[idx, :length])
+        else:
+            # Tokenize text
+            encoding = self.tokenizer(
+                str(self.texts[idx]),
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors='pt'
+            )
+            input_ids = encoding['input_ids'].flatten()
+            attention_mask = encoding['attention_mask'].flatten()
+        
+        item = {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
             'labels': torch.tensor(label, dtype=torch.long),
             'confidence': torch.tensor(confidence, dtype=torch.float)
         }
+        if self.teacher_logits is not None:
+            item['teacher_logits'] = torch.from_numpy(self.teacher_logits[idx])
+        return item
+
+class DynamicPaddingCollator:
+    """Pads each batch only to its longest row (rounded up to pad_to_multiple_of)."""
+    
+    def __init__(self, pad_token_id: int, pad_to_multiple_of: Optional[int] = None):
+        self.pad_token_id = pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+    
+    def __call__(self, features: List[Dict[str, torch.Tensor]]) -> Dict[str, torch.Tensor]:
+        batch_length = max(len(feature['input_ids']) for feature in features)
+        if self.pad_to_multiple_of:
+            batch_length = -(-batch_length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        
+        input_ids = torch.full((len(features), batch_length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(features), batch_length), dtype=torch.long)
+        for row, feature in enumerate(features):
+            length = len(feature['input_ids'])
+            input_ids[row, :length] = feature['input_ids']
+            attention_mask[row, :length] = feature['attention_mask']
+        
+        batch = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        # Any other per-example fields (labels, confidence) are scalars
+        for key in features[0]:
+            if key not in batch:
+                batch[key] = torch.stack([feature[key] for feature in features])
+        return batch
+
+
+class ActivityTrainer(Trainer):
+    """Trainer that groups training batches by the dataset's precomputed token lengths."""
+    
+    def _get_train_sampler(self, train_dataset: Optional[Dataset] = None):
+        train_dataset = train_dataset if train_dataset is not None else self.train_dataset
+        if self.args.group_by_length and isinstance(train_dataset, ActivityDataset):
+            # The stock sampler would fetch every item to measure it
+            return LengthGroupedSampler(
+                self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                lengths=train_dataset.lengths
+            )
+        return super()._get_train_sampler(train_dataset)
+
+
+class DistillationTrainer(ActivityTrainer):
+    """Trains a student on temperature-softened teacher logits plus the hard labels.
+    
+    The loss is alpha * T^2 * KL(teacher || student) at temperature T, plus
+    (1 - alpha) * cross-entropy. Batches without teacher logits (evaluation)
+    use the cross-entropy alone.
+    """
+    
+    def __init__(self, *args, temperature: float = 2.0, alpha: float = 0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.temperature = temperature
+        self.alpha = alpha
+    
+    def _set_signature_columns_if_needed(self):
+        # Keep teacher_logits from being dropped as an unknown model input
+        super()._set_signature_columns_if_needed()
+        if 'teacher_logits' not in self._signature_columns:
+            self._signature_columns.append('teacher_logits')
+    
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        teacher_logits = inputs.pop('teacher_logits', None)
+        outputs = model(**inputs)
+        loss = outputs.loss
+        
+        if teacher_logits is not None:
+            temperature = self.temperature
+            soft_loss = F.kl_div(
+                F.log_softmax(outputs.logits / temperature, dim=-1),
+                F.softmax(teacher_logits.to(outputs.logits.dtype) / temperature, dim=-1),
+                reduction='batchmean'
+            ) * temperature ** 2
+            loss = self.alpha * soft_loss + (1 - self.alpha) * loss
+        
+        return (loss, outputs) if return_outputs else loss
+
 
 class ActivityClassificationTrainer:
     """Main trainer class for activity classification."""
@@ -71,9 +261,16 @@ class ActivityClassificationTrainer:
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         logger.info(f"Using device: {self.device}")
         
+        # Thread pools have to be sized before torch does any parallel work
+        self.cpu_overrides = {}
+        if self.device.type == 'cpu' and cpu_settings(self.config)['enabled']:
+            self.cpu_overrides = apply_cpu_profile(cpu_settings(self.config))
+        
         # Initialize components
         self.tokenizer = None
         self.model = None
+        self.teacher = None
+        self.max_length = None
         self.label_encoder = LabelEncoder()
         
     def _load_config(self, config_path: str) -> Dict:
@@ -108,6 +305,10 @@ class ActivityClassificationTrainer:
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
             self.model.config.pad_token_id = self.tokenizer.eos_token_id
+        
+        # "auto" picks a percentile-based length from the training data
+        self.max_length = resolve_max_length(self.config, self.tokenizer)
+        logger.info(f"Using max_length={self.max_length}")
     
     def prepare_datasets(self, train_df: pd.DataFrame, val_df: pd.DataFrame, 
                         test_df: pd.DataFrame) -> Tuple[ActivityDataset, ActivityDataset, ActivityDataset]:
@@ -126,23 +327,53 @@ class ActivityClassificationTrainer:
         test_labels = self.label_encoder.transform(test_df[label_col])
         
         # Create datasets
-        max_length = self.config['model']['max_length']
+        max_length = self.max_length
         
         train_dataset = ActivityDataset(
             train_df[text_col].tolist(), train_labels, train_df[conf_col].tolist(),
-            self.tokenizer, max_length
+            self.tokenizer, max_length, self._token_cache('train_file', train_df)
         )
         val_dataset = ActivityDataset(
             val_df[text_col].tolist(), val_labels, val_df[conf_col].tolist(),
-            self.tokenizer, max_length
+            self.tokenizer, max_length, self._token_cache('val_file', val_df)
         )
         test_dataset = ActivityDataset(
             test_df[text_col].tolist(), test_labels, test_df[conf_col].tolist(),
-            self.tokenizer, max_length
+            self.tokenizer, max_length, self._token_cache('test_file', test_df)
         )
         
         return train_dataset, val_dataset, test_dataset
     
+    def _token_cache(self, file_key: str, df: pd.DataFrame) -> Optional[TokenCache]:
+        """Open (or build) the pre-tokenized cache for one of the configured data files."""
+        cache_dir = self.config['data'].get('cache_dir')
+        if not cache_dir:
+            return None
+        
+        text_col = self.config['data']['text_column']
+        return TokenCache.build(
+            cache_dir, self.tokenizer, self.max_length,
+            self.config['data'][file_key], texts=df[text_col].astype(str).tolist(),
+            text_column=text_col
+        )
+    
+    def _data_collator(self) -> DynamicPaddingCollator:
+        """Collator padding each batch to its own longest row."""
+        return DynamicPaddingCollator(
+            self.tokenizer.pad_token_id,
+            self.config['training'].get('pad_to_multiple_of')
+        )
+    
+    def _save_sequence_length(self):
+        """Record the trained max_length next to the model, for conversion and export."""
+        stats = None
+        if self.config['model']['max_length'] == 'auto':
+            stats = load_sequence_length(sequence_length_settings(self.config)['stats_file'])
+        # A model resumed from another keeps that model's length, which the stats may not describe
+        if stats is None or stats['max_length'] != self.max_length:
+            stats = {'max_length': self.max_length}
+        save_sequence_length(stats, Path(self.config['output']['output_dir']))
+    
     def compute_metrics(self, eval_pred):
         """Compute metrics for evaluation."""
         predictions, labels = eval_pred
@@ -152,8 +383,10 @@ class ActivityClassificationTrainer:
         accuracy = accuracy_score(labels, predictions)
         precision, recall, f1, _ = precision_recall_fscore_support(labels, predictions, average='weighted')
         
-        # Calculate per-class F1 scores
-        per_class_f1 = precision_recall_fscore_support(labels, predictions, average=None)[2]
+        # Calculate per-class F1 scores (every class, even ones absent from a small eval set)
+        per_class_f1 = precision_recall_fscore_support(
+            labels, predictions, labels=np.arange(len(self.label_encoder.classes_)), average=None, zero_division=0
+        )[2]
         
         metrics = {
             'accuracy': accuracy,
@@ -168,19 +401,9 @@ class ActivityClassificationTrainer:
         
         return metrics
     
-    def train(self):
-        """Main training loop."""
-        # Load data
-        train_df, val_df, test_df = self.load_data()
-        
-        # Prepare model
-        self.prepare_model_and_tokenizer()
-        
-        # Prepare datasets
-        train_dataset, val_dataset, test_dataset = self.prepare_datasets(train_df, val_df, test_df)
-        
-        # Set up training arguments
-        training_args = TrainingArguments(
+    def _training_arguments(self) -> TrainingArguments:
+        """TrainingArguments built from the training and validation config sections."""
+        args = dict(
             output_dir=self.config['output']['output_dir'],
             logging_dir=self.config['output']['logging_dir'],
             
@@ -203,24 +426,56 @@ class ActivityClassificationTrainer:
             
             fp16=self.config['training']['fp16'],
             dataloader_num_workers=self.config['training']['dataloader_num_workers'],
+            group_by_length=self.config['training'].get('group_by_length', False),
             
             report_to="tensorboard",
             run_name="tinybert_activity_classification"
         )
+        # On CPU the profile replaces fp16 and data loader workers
+        args.update(self.cpu_overrides)
+        return TrainingArguments(**args)
+    
+    def _early_stopping(self) -> EarlyStoppingCallback:
+        return EarlyStoppingCallback(
+            early_stopping_patience=self.config['early_stopping']['patience'],
+            early_stopping_threshold=self.config['early_stopping']['min_delta']
+        )
+    
+    def _save_model(self, trainer: Trainer):
+        """Save the model with its tokenizer, sequence length and label encoder."""
+        trainer.save_model()
+        self.tokenizer.model_max_length = self.max_length
+        self.tokenizer.save_pretrained(self.config['output']['output_dir'])
+        self._save_sequence_length()
+        
+        # Save label encoder
+        label_encoder_path = Path(self.config['output']['output_dir']) / "label_encoder.json"
+        with open(label_encoder_path, 'w') as f:
+            json.dump({
+                'classes': self.label_encoder.classes_.tolist(),
+                'category_to_id': dict(zip(self.label_encoder.classes_, range(len(self.label_encoder.classes_))))
+            }, f, indent=2)
+    
+    def train(self):
+        """Main training loop."""
+        # Load data
+        train_df, val_df, test_df = self.load_data()
+        
+        # Prepare model
+        self.prepare_model_and_tokenizer()
+        
+        # Prepare datasets
+        train_dataset, val_dataset, test_dataset = self.prepare_datasets(train_df, val_df, test_df)
         
         # Initialize trainer
-        trainer = Trainer(
+        trainer = ActivityTrainer(
             model=self.model,
-            args=training_args,
+            args=self._training_arguments(),
             train_dataset=train_dataset,
             eval_dataset=val_dataset,
+            data_collator=self._data_collator(),
             compute_metrics=self.compute_metrics,
-            callbacks=[
-                EarlyStoppingCallback(
-                    early_stopping_patience=self.config['early_stopping']['patience'],
-                    early_stopping_threshold=self.config['early_stopping']['min_delta']
-                )
-            ]
+            callbacks=[self._early_stopping(), ThroughputCallback()]
         )
         
         # Train model
@@ -228,16 +483,7 @@ class ActivityClassificationTrainer:
         trainer.train()
         
         # Save final model
-        trainer.save_model()
-        self.tokenizer.save_pretrained(self.config['output']['output_dir'])
-        
-        # Save label encoder
-        label_encoder_path = Path(self.config['output']['output_dir']) / "label_encoder.json"
-        with open(label_encoder_path, 'w') as f:
-            json.dump({
-                'classes': self.label_encoder.classes_.tolist(),
-                'category_to_id': dict(zip(self.label_encoder.classes_, range(len(self.label_encoder.classes_))))
-            }, f, indent=2)
+        self._save_model(trainer)
         
         # Evaluate on test set
         logger.info("Evaluating on test set...")
@@ -249,6 +495,324 @@ class ActivityClassificationTrainer:
         logger.info("Training completed successfully!")
         return trainer
     
+    def _distillation_settings(self) -> Dict:
+        """The `distillation` config section merged over DISTILLATION_DEFAULTS."""
+        settings = copy.deepcopy(DISTILLATION_DEFAULTS)
+        for key, value in (self.config.get('distillation') or {}).items():
+            if isinstance(value, dict):
+                settings[key].update(value)
+            else:
+                settings[key] = value
+        return settings
+    
+    def prepare_student(self, teacher_dir: Path, student_overrides: Dict):
+        """Load the teacher with its tokenizer and build a freshly initialized student.
+        
+        The student shares the teacher's tokenizer, labels and max_length, so
+        it exports through MobileModelConverter exactly like the teacher.
+        """
+        logger.info(f"Loading teacher from {teacher_dir}")
+        self.tokenizer = AutoTokenizer.from_pretrained(teacher_dir)
+        self.teacher = AutoModelForSequenceClassification.from_pretrained(teacher_dir)
+        self.max_length = resolve_max_length(self.config, self.tokenizer, teacher_dir)
+        
+        student_config = AutoConfig.from_pretrained(teacher_dir, **student_overrides)
+        self.model = AutoModelForSequenceClassification.from_config(student_config)
+        
+        teacher_params = sum(p.numel() for p in self.teacher.parameters())
+        student_params = sum(p.numel() for p in self.model.parameters())
+        logger.info(f"Teacher: {teacher_params / 1e6:.2f}M parameters, "
+                    f"student: {student_params / 1e6:.2f}M ({student_overrides})")
+    
+    def distill(self):
+        """Train a smaller student on the fine-tuned model's soft logits."""
+        settings = self._distillation_settings()
+        teacher_dir = Path(settings['teacher_dir'])
+        if not (teacher_dir / "label_encoder.json").exists():
+            raise FileNotFoundError(f"No fine-tuned teacher in {teacher_dir}; run the default mode first")
+        
+        # The student writes everything the fine-tuned model would, but to its own directory
+        self.config['output']['output_dir'] = settings['output_dir']
+        for key in ('learning_rate', 'num_epochs', 'warmup_steps', 'batch_size'):
+            if settings.get(key) is not None:
+                self.config['training'][key] = settings[key]
+        
+        train_df, val_df, test_df = self.load_data()
+        self.prepare_student(teacher_dir, settings['student'])
+        train_dataset, val_dataset, test_dataset = self.prepare_datasets(train_df, val_df, test_df)
+        
+        with open(teacher_dir / "label_encoder.json", 'r') as f:
+            teacher_classes = json.load(f)['classes']
+        if teacher_classes != self.label_encoder.classes_.tolist():
+            raise ValueError(f"Teacher labels {teacher_classes} do not match the data's "
+                             f"{self.label_encoder.classes_.tolist()}")
+        
+        train_dataset.teacher_logits = self._teacher_logits(teacher_dir, train_dataset)
+        
+        trainer = DistillationTrainer(
+            model=self.model,
+            args=self._training_arguments(),
+            train_dataset=train_dataset,
+            eval_dataset=val_dataset,
+            data_collator=self._data_collator(),
+            compute_metrics=self.compute_metrics,
+            callbacks=[self._early_stopping(), ThroughputCallback()],
+            temperature=settings['temperature'],
+            alpha=settings['alpha']
+        )
+        
+        logger.info("Starting distillation...")
+        trainer.train()
+        
+        self._save_model(trainer)
+        self._detailed_evaluation(trainer, test_dataset, test_df)
+        self._distillation_report(trainer, test_dataset, settings)
+        
+        logger.info("Distillation completed successfully!")
+        return trainer
+    
+    def _teacher_logits(self, teacher_dir: Path, dataset: ActivityDataset) -> np.ndarray:
+        """Teacher logits for the training set, cached next to the token cache."""
+        batch_size = self.config['training']['batch_size'] * 4
+        cache_dir = self.config['data'].get('cache_dir')
+        if not cache_dir:
+            return TeacherLogits.compute(self.teacher, dataset, self._data_collator(), batch_size)
+        
+        return TeacherLogits.build(
+            cache_dir, self.teacher, teacher_dir, self.tokenizer, self.max_length, dataset,
+            self.config['data']['train_file'], self._data_collator(),
+            text_column=self.config['data']['text_column'], batch_size=batch_size
+        ).logits
+    
+    def _distillation_report(self, trainer: Trainer, test_dataset: ActivityDataset, settings: Dict):
+        """Compare student and teacher test accuracy, size and single-example CPU latency."""
+        student = trainer.model.to('cpu').eval()
+        teacher = self.teacher.to('cpu').eval()
+        
+        # Mobile inference runs one example padded to max_length
+        samples = min(len(test_dataset), settings['latency_samples'])
+        padding = DynamicPaddingCollator(self.tokenizer.pad_token_id, self.max_length)
+        inputs = [padding([test_dataset[i]]) for i in range(samples)]
+        
+        report = {'max_length': self.max_length, 'temperature': settings['temperature'], 'alpha': settings['alpha']}
+        for name, model in (('teacher', teacher), ('student', student)):
+            logits = TeacherLogits.compute(model, test_dataset, self._data_collator())
+            predictions = logits.argmax(axis=1)
+            labels = np.asarray(test_dataset.labels)
+            
+            times = []
+            with torch.no_grad():
+                for batch in inputs:
+                    start = time.perf_counter()
+                    model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask'])
+                    times.append((time.perf_counter() - start) * 1000)
+            
+            report[name] = {
+                'accuracy': float(accuracy_score(labels, predictions)),
+                'f1_weighted': float(precision_recall_fscore_support(labels, predictions, average='weighted')[2]),
+                'parameters': int(sum(p.numel() for p in model.parameters())),
+                'num_hidden_layers': model.config.num_hidden_layers,
+                'hidden_size': model.config.hidden_size,
+                'mean_latency_ms': float(np.mean(times)),
+                'p95_latency_ms': float(np.percentile(times, 95)),
+            }
+        
+        report['accuracy_delta'] = report['student']['accuracy'] - report['teacher']['accuracy']
+        report['speedup'] = report['teacher']['mean_latency_ms'] / report['student']['mean_latency_ms']
+        report['size_ratio'] = report['student']['parameters'] / report['teacher']['parameters']
+        
+        output_dir = Path(self.config['output']['output_dir'])
+        with open(output_dir / "distillation_report.json", 'w') as f:
+            json.dump(report, f, indent=2)
+        
+        logger.info(f"Student accuracy {report['student']['accuracy']:.4f} vs teacher "
+                    f"{report['teacher']['accuracy']:.4f}; {report['speedup']:.1f}x faster at "
+                    f"{report['size_ratio']:.1%} of the parameters")
+    
+    def incremental(self, new_data_file: str, base_model_dir: Optional[str] = None):
+        """Continue training an existing model on new examples plus a replay sample of the old corpus.
+        
+        The result goes to a new versioned directory with the same files as a
+        fine-tuned model, plus the before/after metrics on the new examples,
+        validation and test sets.
+        """
+        settings = dict(INCREMENTAL_DEFAULTS)
+        settings.update(self.config.get('incremental') or {})
+        base_dir = Path(base_model_dir or settings['base_model_dir'])
+        version_dir = next_version_dir(Path(settings['output_root']))
+        started = time.perf_counter()
+        
+        self.config['output']['output_dir'] = str(version_dir)
+        for key in ('learning_rate', 'num_epochs', 'warmup_steps'):
+            self.config['training'][key] = settings[key]
+        # Few steps: evaluate and keep the best model per epoch instead of every eval_steps
+        self.config['validation']['eval_strategy'] = "epoch"
+        self.config['validation']['save_strategy'] = "epoch"
+        
+        logger.info(f"Resuming from {base_dir} into {version_dir}")
+        self.tokenizer = AutoTokenizer.from_pretrained(base_dir)
+        self.model = AutoModelForSequenceClassification.from_pretrained(base_dir)
+        self.max_length = resolve_max_length(self.config, self.tokenizer, base_dir)
+        with open(base_dir / "label_encoder.json", 'r') as f:
+            self.label_encoder.classes_ = np.array(json.load(f)['classes'], dtype=object)
+        
+        text_col = self.config['data']['text_column']
+        label_col = self.config['data']['label_column']
+        conf_col = self.config['data']['confidence_column']
+        new_df = pd.read_csv(new_data_file)
+        unknown = sorted(set(new_df[label_col]) - set(self.label_encoder.classes_))
+        if unknown:
+            raise ValueError(f"New data has categories the model was not trained on: {unknown}; "
+                             f"adding categories needs a full retrain")
+        
+        # Old rows whose text was relabelled would pull the model back to the old label
+        train_df, val_df, test_df = self.load_data()
+        new_texts = set(new_df[text_col].astype(str).str.strip().str.lower())
+        old_df = train_df[~train_df[text_col].astype(str).str.strip().str.lower().isin(new_texts)]
+        replay_size = replay_count(settings, len(old_df), len(new_df))
+        replay_df = stratified_sample(old_df, label_col, replay_size, settings['replay_seed']) if replay_size else old_df[:0]
+        combined_df = pd.concat([new_df, replay_df], ignore_index=True)
+        logger.info(f"Training on {len(new_df)} new and {len(replay_df)} replayed examples")
+        
+        def dataset(df: pd.DataFrame, file_key: Optional[str] = None) -> ActivityDataset:
+            cache = self._token_cache(file_key, df) if file_key else None
+            return ActivityDataset(
+                df[text_col].tolist(), self.label_encoder.transform(df[label_col]),
+                df[conf_col].tolist(), self.tokenizer, self.max_length, cache
+            )
+        
+        # The combined set changes every run, so only the fixed splits use the token cache
+        train_dataset = dataset(combined_df)
+        eval_sets = {
+            'new': dataset(new_df),
+            'validation': dataset(val_df, 'val_file'),
+            'test': dataset(test_df, 'test_file'),
+        }
+        
+        trainer = ActivityTrainer(
+            model=self.model,
+            args=self._training_arguments(),
+            train_dataset=train_dataset,
+            eval_dataset=eval_sets['validation'],
+            data_collator=self._data_collator(),
+            compute_metrics=self.compute_metrics,
+            callbacks=[self._early_stopping(), ThroughputCallback()]
+        )
+        
+        before = {name: trainer.evaluate(data, metric_key_prefix=name) for name, data in eval_sets.items()}
+        trainer.train()
+        after = {name: trainer.evaluate(data, metric_key_prefix=name) for name, data in eval_sets.items()}
+        
+        self._save_model(trainer)
+        self._detailed_evaluation(trainer, eval_sets['test'], test_df)
+        
+        diff = {}
+        for name in eval_sets:
+            diff[name] = {}
+            for key, value in after[name].items():
+                metric = key[len(name) + 1:]
+                if metric in ('accuracy', 'f1_weighted', 'precision', 'recall', 'loss') or metric.startswith('f1_'):
+                    diff[name][metric] = {
+                        'before': before[name][key], 'after': value, 'change': value - before[name][key]
+                    }
+        
+        elapsed = time.perf_counter() - started
+        with open(version_dir / "metric_diff.json", 'w') as f:
+            json.dump(diff, f, indent=2)
+        with open(version_dir / "version.json", 'w') as f:
+            json.dump({
+                'version': version_dir.name,
+                'base_model_dir': str(base_dir),
+                'new_data_file': str(new_data_file),
+                'new_examples': len(new_df),
+                'replay_examples': len(replay_df),
+                'replay_seed': settings['replay_seed'],
+                'learning_rate': settings['learning_rate'],
+                'num_epochs': settings['num_epochs'],
+                'seconds': elapsed,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }, f, indent=2)
+        
+        for name in eval_sets:
+            accuracy = diff[name]['accuracy']
+            logger.info(f"{name:<10} accuracy {accuracy['before']:.4f} -> {accuracy['after']:.4f} "
+                        f"({accuracy['change']:+.4f})")
+        logger.info(f"Incremental model {version_dir} trained in {elapsed:.1f}s")
+        return trainer
+    
+    def quantization_aware(self, base_model_dir: Optional[str] = None):
+        """Fine-tune an existing model with INT8 fake quantization in every linear layer.
+        
+        The saved weights are ordinary float weights that have learned to
+        tolerate the INT8 rounding the converter applies, and quantization.json
+        tells the converter to quantize them the same way.
+        """
+        settings = dict(QAT_DEFAULTS)
+        settings.update(self.config.get('qat') or {})
+        base_dir = Path(base_model_dir or settings['base_model_dir'])
+        if not (base_dir / "label_encoder.json").exists():
+            raise FileNotFoundError(f"No fine-tuned model in {base_dir}; run the default mode first")
+        
+        self.config['output']['output_dir'] = settings['output_dir']
+        for key in ('learning_rate', 'num_epochs', 'warmup_steps'):
+            self.config['training'][key] = settings[key]
+        
+        logger.info(f"Quantization-aware training from {base_dir}")
+        self.tokenizer = AutoTokenizer.from_pretrained(base_dir)
+        self.model = AutoModelForSequenceClassification.from_pretrained(base_dir)
+        self.max_length = resolve_max_length(self.config, self.tokenizer, base_dir)
+        
+        train_df, val_df, test_df = self.load_data()
+        train_dataset, val_dataset, test_dataset = self.prepare_datasets(train_df, val_df, test_df)
+        with open(base_dir / "label_encoder.json", 'r') as f:
+            base_classes = json.load(f)['classes']
+        if base_classes != self.label_encoder.classes_.tolist():
+            raise ValueError(f"Model labels {base_classes} do not match the data's "
+                             f"{self.label_encoder.classes_.tolist()}")
+        
+        trainer = ActivityTrainer(
+            model=self.model,
+            args=self._training_arguments(),
+            train_dataset=train_dataset,
+            eval_dataset=val_dataset,
+            data_collator=self._data_collator(),
+            compute_metrics=self.compute_metrics,
+            callbacks=[self._early_stopping(), ThroughputCallback()]
+        )
+        
+        # Float accuracy, then INT8 accuracy before and after training with fake quantization
+        test_metrics = {'float': trainer.evaluate(test_dataset, metric_key_prefix='test')}
+        layers = insert_fake_quant(self.model, settings['per_channel'])
+        logger.info(f"Fake-quantizing {layers} linear layers (per_channel={settings['per_channel']})")
+        test_metrics['int8_post_training'] = trainer.evaluate(test_dataset, metric_key_prefix='test')
+        
+        trainer.train()
+        test_metrics['int8_qat'] = trainer.evaluate(test_dataset, metric_key_prefix='test')
+        # The detailed report describes the model as it will run after INT8 export
+        self._detailed_evaluation(trainer, test_dataset, test_df)
+        
+        remove_fake_quant(self.model)
+        self._save_model(trainer)
+        output_dir = Path(self.config['output']['output_dir'])
+        save_quantization_settings(output_dir, {
+            'scheme': "dynamic_int8",
+            'per_channel': settings['per_channel'],
+            'base_model_dir': str(base_dir),
+        })
+        
+        report = {
+            name: {metric: metrics[f'test_{metric}'] for metric in ('accuracy', 'f1_weighted', 'loss')}
+            for name, metrics in test_metrics.items()
+        }
+        report['accuracy_delta'] = report['int8_qat']['accuracy'] - report['float']['accuracy']
+        with open(output_dir / "qat_report.json", 'w') as f:
+            json.dump(report, f, indent=2)
+        
+        logger.info(f"Test accuracy: float {report['float']['accuracy']:.4f}, INT8 without QAT "
+                    f"{report['int8_post_training']['accuracy']:.4f}, INT8 with QAT "
+                    f"{report['int8_qat']['accuracy']:.4f}")
+        return trainer
+    
     def _detailed_evaluation(self, trainer, test_dataset: ActivityDataset, test_df: pd.DataFrame):
         """Generate detailed evaluation metrics and visualizations."""
         # Get predictions
@@ -317,14 +881,32 @@ class ActivityClassificationTrainer:
 
 def main():
     """Main training script."""
-    config_path = "config.yaml"
+    parser = argparse.ArgumentParser(description="Train the activity classifier")
+    parser.add_argument("--config", default="config.yaml", help="Training config")
+    parser.add_argument("--mode", choices=["finetune", "distill", "incremental", "qat"], default="finetune",
+                        help="Fine-tune the base model, distill the fine-tuned model into a smaller "
+                             "student, continue training it on new examples, or fine-tune it with "
+                             "INT8 fake quantization")
+    parser.add_argument("--new-data", help="CSV of new labeled examples (incremental mode)")
+    parser.add_argument("--base-model", help="Model to resume from (incremental and qat modes; default from config)")
+    args = parser.parse_args()
+    config_path = args.config
     
     if not os.path.exists(config_path):
         logger.error(f"Config file not found: {config_path}")
         sys.exit(1)
     
     trainer = ActivityClassificationTrainer(config_path)
-    trainer.train()
+    if args.mode == "distill":
+        trainer.distill()
+    elif args.mode == "incremental":
+        if not args.new_data:
+            parser.error("--mode incremental needs --new-data")
+        trainer.incremental(args.new_data, args.base_model)
+    elif args.mode == "qat":
+        trainer.quantization_aware(args.base_model)
+    else:
+        trainer.train()
 
 
 if __name__ == "__main__":